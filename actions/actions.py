@@ -1,6 +1,10 @@
 import os
+import time
+import asyncio
+import inspect
 import logging
-from typing import Any, Text, Dict, List
+import functools
+from typing import Any, Text, Dict, List, Iterator, Optional
 from dotenv import load_dotenv
 
 from rasa_sdk import Action, Tracker
@@ -9,16 +13,78 @@ from rasa_sdk.events import SlotSet, FollowupAction
 
 import google.generativeai as genai
 
+from src.streaming import stream_registry_from_env
+from src.response_cache import ResponseCache
+from src.semantic_cache import SemanticAnswerCache
+from src.llm_executor import BoundedLLMExecutor
+from src.resilience import ResilientCaller, CircuitOpenError
+from src.metrics import REGISTRY as metrics, start_metrics_server
+from src.tracing import Tracer, TraceContext, TRACEPARENT_KEY
+from src.catalog import CatalogStore
+from src.generation_prompts import build_domain_prompt, symptom_prompt, medication_prompt, recommendation_prompt, prompt_fingerprint, user_text
+from src.speculation import SPECULATION_KEY, SpeculationStore
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- MÉTRICAS (formato Prometheus en /metrics del servidor de streams, puerto 5056) ---
+# Dominios con etiqueta propia; el slot current_domain es texto libre y cualquier otro valor se agrupa
+METRIC_DOMAINS = ('general', 'ecommerce', 'banca', 'salud')
+ACTION_RUN_SECONDS = metrics.histogram('action_run_seconds', "Duración de Action.run por acción y dominio", ['action', 'domain'])
+ACTION_RUNS = metrics.counter('action_runs_total', "Ejecuciones de acciones por acción, dominio y resultado", ['action', 'domain', 'outcome'])
+GEMINI_GENERATION_SECONDS = metrics.histogram(
+    'action_gemini_generation_seconds', "Generación con Gemini (reintentos incluidos) por dominio", ['domain', 'mode', 'outcome'])
+# La similitud de los aciertos y fallos de la cache semántica sirve para ajustar SEMANTIC_CACHE_THRESHOLD
+SEMANTIC_CACHE_SIMILARITY = metrics.histogram(
+    'action_semantic_cache_similarity', "Similitud con la pregunta más parecida de la cache semántica", ['domain', 'outcome'],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0))
+# Pool limitado de llamadas a Gemini (GEMINI_MAX_CONCURRENCY): espera en cola y ocupación
+GEMINI_QUEUE_WAIT_SECONDS = metrics.histogram(
+    'action_gemini_queue_wait_seconds', "Espera en cola del pool de Gemini antes de llamar al SDK")
+GEMINI_IN_FLIGHT = metrics.gauge('action_gemini_in_flight', "Llamadas a Gemini en curso en el pool")
+GEMINI_QUEUED = metrics.gauge('action_gemini_queued', "Llamadas a Gemini esperando un hilo libre del pool")
+GEMINI_ABANDONED = metrics.gauge(
+    'action_gemini_abandoned_in_flight', "Llamadas a Gemini abandonadas por plazo o hedge que siguen en curso y ocupan hueco")
+GEMINI_BREAKER_STATE = metrics.gauge(
+    'action_gemini_breaker_state', "Estado del circuit breaker de Gemini (0 closed, 1 half_open, 2 open)", ['breaker'])
+GEMINI_BREAKER_TRANSITIONS = metrics.counter(
+    'action_gemini_breaker_transitions_total', "Cambios de estado del circuit breaker de Gemini", ['breaker', 'from_state', 'to_state'])
+SPECULATION_RESULTS = metrics.counter(
+    'action_speculation_total', "Resultados especulativos del gateway por resultado (hit, mismatch, failed, timeout)", ['outcome'])
+SPECULATION_SAVED_SECONDS = metrics.histogram(
+    'action_speculation_saved_seconds', "Latencia ahorrada por cada resultado especulativo usado")
+
+
+def metric_domain(domain: Optional[Text]) -> Text:
+    return domain if domain in METRIC_DOMAINS else 'otro'
+
+# --- TRAZAS ---
+# Los spans de las acciones cuelgan de la traza que el gateway envía en metadata.traceparent
+# (TRACE_EXPORT_PATH o TRACE_COLLECTOR_URL para exportarlos)
+tracer = Tracer.from_env('actions')
+
 # --- SERVICIO DE IA GENERATIVA ---
 class GeminiService:
     def __init__(self):
         self.api_key = os.getenv('GEMINI_API_KEY')
         self.model_name = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+        # Cache persistente de respuestas (modelo, dominio, prompt normalizado)
+        self.cache = ResponseCache.from_env()
+        # Cache semántica en memoria para preguntas abiertas parafraseadas (espacio TF-IDF del modelo local)
+        self.semantic_cache = SemanticAnswerCache.from_env()
+        # Pool dedicado y limitado para las llamadas bloqueantes al SDK (GEMINI_MAX_CONCURRENCY)
+        self.executor = BoundedLLMExecutor.from_env(on_wait=GEMINI_QUEUE_WAIT_SECONDS.observe)
+        GEMINI_IN_FLIGHT.set_function(lambda: self.executor.in_flight)
+        GEMINI_QUEUED.set_function(lambda: self.executor.queued)
+        GEMINI_ABANDONED.set_function(lambda: self.executor.abandoned)
+        # Presupuesto de latencia, reintentos, circuit breaker y hedge (GEMINI_GENERATION_BUDGET, GEMINI_BREAKER_*)
+        # Los intentos abandonados siguen ocupando un hueco del pool hasta que Gemini responde
+        self.resilience = ResilientCaller.from_env(
+            'gemini-generacion', prefix='GEMINI_GENERATION', budget=20.0, max_attempts=2, on_abandon=self.executor.hold,
+            on_transition=lambda old, new: GEMINI_BREAKER_TRANSITIONS.labels('gemini-generacion', old, new).inc())
+        GEMINI_BREAKER_STATE.labels('gemini-generacion').set_function(lambda: self.resilience.breaker.state_value)
         
         if not self.api_key:
             logger.error("GEMINI_API_KEY no encontrada en variables de entorno. Las respuestas de IA generativa no funcionarán.")
@@ -33,33 +99,213 @@ class GeminiService:
             logger.error(f"Error configurando Gemini: {e}. Las respuestas de IA generativa no funcionarán.")
             self.model = None
     
-    def generate_response(self, prompt: str, domain: str = "general") -> str:
+    def build_prompt(self, prompt: str, domain: str = "general") -> str:
+        # Adaptar el prompt según el dominio (el gateway usa la misma función para especular)
+        return build_domain_prompt(prompt, domain)
+
+    def use_semantic_cache(self, domain: str) -> bool:
+        """La cache semántica está cargada y el dominio no está excluido (SEMANTIC_CACHE_DISABLED_DOMAINS)"""
+        return self.semantic_cache is not None and self.semantic_cache.enabled_for(domain)
+
+    def semantic_lookup(self, prompt: str, domain: str) -> Optional[Text]:
+        """Respuesta ya generada para una pregunta equivalente del mismo dominio, o None"""
+        result = self.semantic_cache.lookup(prompt, domain)
+        if result is None:
+            return None
+        SEMANTIC_CACHE_SIMILARITY.labels(metric_domain(domain), 'hit' if result.answer is not None else 'miss').observe(result.similarity)
+        return result.answer
+
+    def cached_response(self, prompt: str, domain: str, semantic: bool = False) -> Optional[Text]:
+        """Respuesta ya guardada (cache semántica o de respuestas) para este prompt, sin llamar a Gemini; None si no hay"""
+        if semantic and self.use_semantic_cache(domain):
+            cached = self.semantic_lookup(prompt, domain)
+            if cached is not None:
+                return cached
+        if self.model and self.cache is not None and self.cache.enabled_for(domain):
+            return self.cache.get(self.cache.key(self.model_name, domain, self.build_prompt(prompt, domain)))
+        return None
+
+    def store_response(self, prompt: str, domain: str, text: str, semantic: bool = False) -> None:
+        """Guarda en las caches una respuesta generada fuera de este servicio (la especulativa del gateway)"""
+        if self.model and self.cache is not None and self.cache.enabled_for(domain):
+            self.cache.set(self.cache.key(self.model_name, domain, self.build_prompt(prompt, domain)), text)
+        if semantic and self.use_semantic_cache(domain):
+            self.semantic_cache.add(prompt, domain, text)
+
+    def generate_response(self, prompt: str, domain: str = "general", semantic: bool = False) -> str:
+        """Con semantic=True se consulta y alimenta la cache semántica (preguntas abiertas)."""
         if not self.model:
             return "Lo siento, hay un problema con la configuración de la IA en este momento."
-        
-        # Adaptar el prompt según el dominio
-        system_prompt = ""
-        if domain == "ecommerce":
-            system_prompt = "Eres un asistente experto para una tienda online de tecnología. Responde de forma clara y útil sobre productos, stock o pedidos. Siempre mantén un tono comercial pero amigable."
-        elif domain == "banca":
-            system_prompt = "Eres un asistente bancario. Responde con precisión sobre saldos, transferencias, bloqueos de tarjeta o asesoramiento financiero. Prioriza la seguridad y la claridad en la información."
-        elif domain == "salud":
-            system_prompt = "Eres un asistente de salud. Proporciona información general sobre síntomas, citas o medicamentos. NO eres un médico, no hagas diagnósticos ni prescribas tratamientos. Siempre recomienda consultar a un profesional de la salud en caso de emergencia o dudas médicas."
-        else: # general o fallback
-            system_prompt = "Eres un asistente general y útil."
-
-        full_prompt = f"{system_prompt}\n\nPregunta del usuario: \"{prompt}\""
+
+        full_prompt = self.build_prompt(prompt, domain)
+        use_cache = self.cache is not None and self.cache.enabled_for(domain)
+        semantic = semantic and self.use_semantic_cache(domain)
+
+        def generate():
+            span.set_attribute('cache', 'miss' if use_cache else 'off')
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                text = self.resilience.call(
+                    lambda timeout: self.model.generate_content(full_prompt, request_options={'timeout': timeout}).text)
+                outcome = 'ok'
+                return text
+            except CircuitOpenError:
+                outcome = 'circuit_open'
+                raise
+            finally:
+                span.set_attribute('outcome', outcome)
+                GEMINI_GENERATION_SECONDS.labels(metric_domain(domain), 'complete', outcome).observe(time.perf_counter() - started)
 
         try:
-            response = self.model.generate_content(full_prompt)
-            return response.text
+            with tracer.span('gemini.generate', root=False, domain=domain, mode='complete', cache='hit') as span:
+                if semantic:
+                    cached = self.semantic_lookup(prompt, domain)
+                    if cached is not None:
+                        span.set_attribute('cache', 'semantic')
+                        return cached
+                if not use_cache:
+                    text = generate()
+                else:
+                    key = self.cache.key(self.model_name, domain, full_prompt)
+                    text = self.cache.get_or_generate(key, generate)
+            if semantic:
+                self.semantic_cache.add(prompt, domain, text)
+            return text
+        except CircuitOpenError:
+            logger.warning("Circuit breaker de Gemini abierto: se responde sin llamar a la IA.")
+            return "Lo siento, el servicio de IA no está disponible en este momento. Inténtalo de nuevo en unos segundos."
         except Exception as e:
             logger.error(f"Error generando respuesta con Gemini: {e}")
             return f"Disculpa, tuve un problema al procesar tu consulta con la IA: {str(e)}"
 
+    async def generate_response_async(self, prompt: str, domain: str = "general", semantic: bool = False) -> str:
+        """Ejecuta generate_response en el pool de Gemini sin bloquear el event loop de las acciones."""
+        return await self.executor.run(self.generate_response, prompt, domain, semantic)
+
+    def generate_response_stream(self, prompt: str, domain: str = "general", semantic: bool = False) -> Iterator[Text]:
+        """Igual que generate_response, pero devuelve los fragmentos de texto a medida que Gemini los genera."""
+        if not self.model:
+            yield "Lo siento, hay un problema con la configuración de la IA en este momento."
+            return
+
+        full_prompt = self.build_prompt(prompt, domain)
+        use_cache = self.cache is not None and self.cache.enabled_for(domain)
+        on_complete = None
+        with tracer.span('gemini.generate', root=False, domain=domain, mode='stream') as span:
+            if semantic and self.use_semantic_cache(domain):
+                cached = self.semantic_lookup(prompt, domain)
+                if cached is not None:
+                    span.set_attribute('cache', 'semantic')
+                    yield cached
+                    return
+                on_complete = lambda text: self.semantic_cache.add(prompt, domain, text)  # noqa: E731
+            yield from self._stream(full_prompt, domain, use_cache, span, on_complete)
+
+    def _stream(self, full_prompt: str, domain: str, use_cache: bool, span, on_complete=None) -> Iterator[Text]:
+        """on_complete recibe el texto completo si la respuesta sale bien (de la cache o de Gemini)"""
+        started = None
+        try:
+            if use_cache:
+                key = self.cache.key(self.model_name, domain, full_prompt)
+                cached = self.cache.get(key)
+                span.set_attribute('cache', 'miss' if cached is None else 'hit')
+                if cached is not None:
+                    yield cached
+                    if on_complete is not None:
+                        on_complete(cached)
+                    return
+
+            if not self.resilience.breaker.allow():
+                logger.warning("Circuit breaker de Gemini abierto: se responde sin llamar a la IA.")
+                yield "Lo siento, el servicio de IA no está disponible en este momento. Inténtalo de nuevo en unos segundos."
+                return
+
+            # En streaming no se reintenta (ya se enviaron fragmentos), pero el resultado alimenta el breaker
+            started = time.monotonic()
+            parts = []
+            for chunk in self.model.generate_content(full_prompt, stream=True, request_options={'timeout': self.resilience.budget}):
+                parts.append(chunk.text)
+                yield chunk.text
+            self.resilience.record(None, time.monotonic() - started)
+            GEMINI_GENERATION_SECONDS.labels(metric_domain(domain), 'stream', 'ok').observe(time.monotonic() - started)
+
+            if use_cache:
+                self.cache.set(key, "".join(parts))
+            if on_complete is not None:
+                on_complete("".join(parts))
+        except Exception as e:
+            self.resilience.record(e)
+            span.set_error(e)
+            if started is not None:
+                GEMINI_GENERATION_SECONDS.labels(metric_domain(domain), 'stream', 'error').observe(time.monotonic() - started)
+            logger.error(f"Error generando respuesta en streaming con Gemini: {e}")
+            yield f"Disculpa, tuve un problema al procesar tu consulta con la IA: {str(e)}"
+
 # Instancia global del servicio para reutilizarla
 gemini_service = GeminiService()
 
+# Resultados de la generación especulativa del gateway (POST /speculative en el servidor de streams)
+speculation_store = SpeculationStore.from_env()
+
+# Registro de streams para enviar los tokens de Gemini al gateway a medida que se generan
+stream_registry = stream_registry_from_env(speculation_store)
+
+# Catálogo de productos y pedidos (SQLite, CATALOG_DB_PATH) indexado en memoria una vez por proceso
+catalog = CatalogStore.from_env()
+
+# El servidor de streams ya sirve /metrics; si está desactivado se arranca uno solo para métricas
+if stream_registry is None and metrics.enabled:
+    try:
+        start_metrics_server(host=os.getenv('ACTION_STREAM_HOST', '0.0.0.0'), port=int(os.getenv('ACTION_STREAM_PORT', 5056)))
+    except OSError as e:
+        logger.error(f"No se pudo arrancar el servidor de métricas: {e}")
+
+
+async def utter_gemini_response(dispatcher: CollectingDispatcher, tracker: Tracker, prompt: Text, domain: Text, prefix: Text = "", semantic: bool = False) -> Optional[Text]:
+    """
+    Envía la respuesta de Gemini al usuario. Si el cliente pidió streaming (metadata.stream),
+    solo se envía la referencia del stream y la generación continúa en segundo plano; en ese
+    caso devuelve None. Si no, devuelve el texto completo generado.
+    Con semantic=True se usa la cache semántica (el prompt debe ser la pregunta del usuario).
+    """
+    metadata = tracker.latest_message.get('metadata') or {}
+    if metadata.get(SPECULATION_KEY) and stream_registry is not None:
+        # Lo que ya está en las caches no espera a la especulación (su resultado caduca sin usarse)
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, gemini_service.cached_response, prompt, domain, semantic)
+        if response is None:
+            response = await take_speculative_response(tracker.sender_id, metadata[SPECULATION_KEY], prompt, domain)
+            if response is not None:
+                await loop.run_in_executor(None, gemini_service.store_response, prompt, domain, response, semantic)
+        if response is not None:
+            dispatcher.utter_message(text=f"{prefix}{response}")
+            return response
+
+    if metadata.get('stream') and stream_registry is not None:
+        stream = gemini_service.generate_response_stream(prompt, domain=domain, semantic=semantic)
+        stream_id = stream_registry.start(stream, prefix=prefix, executor=gemini_service.executor)
+        dispatcher.utter_message(json_message={"stream_id": stream_id})
+        return None
+
+    response = await gemini_service.generate_response_async(prompt, domain=domain, semantic=semantic)
+    dispatcher.utter_message(text=f"{prefix}{response}")
+    return response
+
+async def take_speculative_response(sender_id: Text, speculation: Dict[Text, Any], prompt: Text, domain: Text) -> Optional[Text]:
+    """
+    Respuesta que el gateway generó en paralelo con RASA para este turno, si se generó con el
+    mismo prompt que usaría la acción; si aún está en curso se espera (SPECULATION_WAIT_TIMEOUT).
+    """
+    fingerprint = prompt_fingerprint(gemini_service.model_name, gemini_service.build_prompt(prompt, domain))
+    with tracer.span('speculation.take', root=False) as span:
+        result = await asyncio.get_running_loop().run_in_executor(None, speculation_store.take, sender_id, speculation, fingerprint)
+        span.set_attribute('outcome', result.outcome)
+    SPECULATION_RESULTS.labels(result.outcome).inc()
+    if result.outcome == 'hit':
+        SPECULATION_SAVED_SECONDS.observe(result.saved)
+    return result.text
+
 # --- ACCIONES GENERALES ---
 
 class ActionSetDomain(Action):
@@ -115,13 +361,16 @@ class ActionAskGemini(Action):
     def name(self) -> Text:
         return "accion_pregunta_gemini"
     
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
-        user_message = tracker.latest_message.get('text', '')
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        # En los modos 'gemini' e 'hybrid' el texto es la intención inyectada; el original va en los metadatos
+        user_message = user_text(tracker.latest_message)
         current_domain = tracker.get_slot("current_domain") or "general"
         
-        # El prompt se adapta dentro del servicio Gemini
-        response = gemini_service.generate_response(user_message, domain=current_domain)
-        dispatcher.utter_message(text=response)
+        # El prompt se adapta dentro del servicio Gemini; las preguntas ya respondidas con otras
+        # palabras se sirven desde la cache semántica. Sin el texto original (una intención inyectada
+        # sin metadata.user_text) todas las preguntas compartirían una entrada: no se usa la cache.
+        semantic = not user_message.startswith('/')
+        await utter_gemini_response(dispatcher, tracker, user_message, current_domain, semantic=semantic)
         return []
 
 # ======================================================================================================
@@ -138,23 +387,19 @@ class ActionVerificarStock(Action):
             dispatcher.utter_message(text="Claro, ¿qué producto te gustaría consultar?")
             return []
 
-        # --- SIMULACIÓN DE CONSULTA A BASE DE DATOS/API DE INVENTARIO ---
-        # En un entorno real, aquí se haría una llamada a una API de tu sistema de inventario.
-        stock_db = {
-            "iphone 15": 50,
-            "samsung galaxy s24": 35,
-            "rtx 4080": 0,
-            "teclado mecánico keychron": 120,
-            "monitor ultrawide": 15,
-            "auriculares bluetooth": 200
-        }
-        
-        stock_disponible = stock_db.get(producto.lower(), 0)
-        
-        if stock_disponible > 0:
-            message = f"¡Buenas noticias! Tenemos {stock_disponible} unidades de {producto} en stock."
+        # --- CONSULTA AL CATÁLOGO (SQLite local en lugar del sistema de inventario real) ---
+        # Resuelve variantes del nombre ("iphone15", "teclado keychron") al producto del catálogo
+        match = catalog.find_product(producto)
+
+        if match is None:
+            message = f"No encontré {producto} en nuestro catálogo. ¿Puedes indicarme el nombre o el modelo exacto?"
+        elif match.score < 1.0:
+            # Coincidencia aproximada: se confirma antes de dar el stock de un producto que quizá no es el pedido
+            message = f"No encontré exactamente {producto} en nuestro catálogo. ¿Te refieres a {match.name}? Si es así, pregúntame por ese nombre y te digo el stock."
+        elif match.stock > 0:
+            message = f"¡Buenas noticias! Tenemos {match.stock} unidades de {match.name} en stock."
         else:
-            message = f"Lo siento, actualmente no tenemos stock de {producto}. ¿Te gustaría que te notifique cuando vuelva a estar disponible?"
+            message = f"Lo siento, actualmente no tenemos stock de {match.name}. ¿Te gustaría que te notifique cuando vuelva a estar disponible?"
         
         dispatcher.utter_message(text=message)
         return []
@@ -169,16 +414,9 @@ class ActionConsultarEstadoPedido(Action):
             dispatcher.utter_message(text="Claro, por favor, indícame tu número de pedido.")
             return []
 
-        # --- SIMULACIÓN DE CONSULTA A API DE LOGÍSTICA/CRM ---
-        # Aquí se integraría con un sistema de gestión de pedidos real.
-        pedidos_db = {
-            "123-abc-789": "Enviado. Se espera que llegue en 2 días hábiles.",
-            "xyz-987-654": "Procesando. Tu pedido está siendo preparado en nuestro almacén.",
-            "ord-001": "Retrasado. Lamentamos el inconveniente, la nueva fecha estimada es el 15 de Octubre.",
-            "ord-456-111": "Entregado. ¡Esperamos que lo disfrutes!"
-        }
-        
-        estado = pedidos_db.get(num_pedido.lower(), "No pudimos encontrar un pedido con ese número. Por favor, verifica que sea correcto.")
+        # --- CONSULTA AL CATÁLOGO DE PEDIDOS (SQLite local en lugar del sistema de logística/CRM) ---
+        # Solo coincidencias exactas (sin distinguir mayúsculas, espacios ni guiones)
+        estado = catalog.get_order_status(num_pedido) or "No pudimos encontrar un pedido con ese número. Por favor, verifica que sea correcto."
         
         dispatcher.utter_message(text=f"El estado de tu pedido {num_pedido} es: {estado}")
         return []
@@ -187,7 +425,7 @@ class ActionRecomendarProducto(Action):
     def name(self) -> Text:
         return "action_recomendar_producto"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         categoria = tracker.get_slot("categoria")
         interes = tracker.get_slot("interes")
 
@@ -199,10 +437,9 @@ class ActionRecomendarProducto(Action):
             dispatcher.utter_message(text="Para recomendarte un producto, ¿qué tipo de producto te interesa y para qué uso lo necesitas?")
             return []
         
-        prompt_recommendation = f"El usuario busca una recomendación de {categoria or 'producto'} para {interes or 'uso general'}. Como experto en ventas, sugiere 2-3 productos populares de tu tienda y explica brevemente por qué son buenas opciones."
+        prompt_recommendation = recommendation_prompt(categoria, interes)
         
-        recommendation = gemini_service.generate_response(prompt_recommendation, domain="ecommerce")
-        dispatcher.utter_message(text=f"Aquí tienes algunas recomendaciones:\n{recommendation}")
+        await utter_gemini_response(dispatcher, tracker, prompt_recommendation, "ecommerce", prefix="Aquí tienes algunas recomendaciones:\n")
 
         return [SlotSet("categoria", None), SlotSet("interes", None)] # Limpiar slots para futuras recomendaciones
 
@@ -350,7 +587,7 @@ class ActionConsultarSintoma(Action):
     def name(self) -> Text:
         return "action_consultar_sintoma"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         sintoma = tracker.get_slot("sintoma")
 
         if not sintoma:
@@ -358,21 +595,16 @@ class ActionConsultarSintoma(Action):
             return []
         
         # --- USO DE GEMINI PARA EXPLICAR SÍNTOMAS ---
-        # Es crucial que el prompt indique a Gemini que NO DEBE HACER DIAGNÓSTICOS.
-        prompt = f"""
-        Eres un asistente de salud que proporciona información general sobre síntomas. NO ERES UN MÉDICO, NO DIAGNOSTICAS NI PRESCRIBES.
-        Explica brevemente y de forma informativa sobre el siguiente síntoma: {sintoma}.
-        Siempre termina tu respuesta recomendando consultar a un profesional de la salud si los síntomas persisten o empeoran.
-        """
-        info_sintoma = gemini_service.generate_response(prompt, domain="salud")
-        dispatcher.utter_message(text=info_sintoma)
+        # Es crucial que el prompt indique a Gemini que NO DEBE HACER DIAGNÓSTICOS (ver symptom_prompt).
+        prompt = symptom_prompt(sintoma)
+        await utter_gemini_response(dispatcher, tracker, prompt, "salud")
         return [SlotSet("sintoma", None)]
 
 class ActionInformacionMedicamento(Action):
     def name(self) -> Text:
         return "action_informacion_medicamento"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
         # --- LOG DE DEPURACIÓN AÑADIDO ---
         logger.info(f"--- Ejecutando ActionInformacionMedicamento ---")
@@ -387,20 +619,18 @@ class ActionInformacionMedicamento(Action):
             dispatcher.utter_message(text="¿De qué medicamento te gustaría obtener información?")
             return []
         
-        prompt = f"""
-        Eres un asistente de salud que proporciona información general sobre medicamentos. NO ERES UN MÉDICO, NO DIAGNOSTICAS NI PRESCRIBES.
-        Explica brevemente para qué sirve y cuáles son los usos comunes del medicamento: {medicamento}.
-        Aclara que siempre se debe consultar a un médico o farmacéutico antes de tomar cualquier medicamento.
-        """
+        prompt = medication_prompt(medicamento)
         
         # --- LOG DE DEPURACIÓN AÑADIDO ---
         logger.info(f"Enviando prompt a Gemini para el medicamento: {medicamento}")
-        info_medicamento = gemini_service.generate_response(prompt, domain="salud")
+        info_medicamento = await utter_gemini_response(dispatcher, tracker, prompt, "salud")
         
         # --- LOG DE DEPURACIÓN AÑADIDO ---
-        logger.info(f"Respuesta de Gemini recibida: {info_medicamento[:100]}...") # Mostramos los primeros 100 caracteres
+        if info_medicamento is not None:
+            logger.info(f"Respuesta de Gemini recibida: {info_medicamento[:100]}...") # Mostramos los primeros 100 caracteres
+        else:
+            logger.info("Respuesta de Gemini enviada en streaming.")
         
-        dispatcher.utter_message(text=info_medicamento)
         return [SlotSet("medicamento", None)]
 
 class ActionContactarEmergencia(Action):
@@ -414,4 +644,56 @@ class ActionContactarEmergencia(Action):
 
 # ======================================================================================================
 # --- FIN DE ACCIONES ---
-# ======================================================================================================
\ No newline at end of file
+# ======================================================================================================
+
+def action_span(action, tracker):
+    """Span de la acción, hijo del traceparent que el gateway envió en la metadata del mensaje"""
+    metadata = tracker.latest_message.get('metadata') or {}
+    context = TraceContext.from_traceparent(metadata.get(TRACEPARENT_KEY))
+    return tracer.span('action.run', context=context, action=action.name(), sender=tracker.sender_id)
+
+
+def instrument_action(action_class):
+    """
+    Envuelve Action.run (síncrono o asíncrono) para medir su duración por acción y dominio
+    y registrarla como span de la traza del mensaje.
+    """
+    run = action_class.run
+
+    def observe(action, tracker, outcome, started):
+        current_domain = metric_domain(tracker.get_slot("current_domain") or "general")
+        ACTION_RUN_SECONDS.labels(action.name(), current_domain).observe(time.perf_counter() - started)
+        ACTION_RUNS.labels(action.name(), current_domain, outcome).inc()
+
+    if inspect.iscoroutinefunction(run):
+        @functools.wraps(run)
+        async def timed_run(self, dispatcher, tracker, domain):
+            with action_span(self, tracker):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    events = await run(self, dispatcher, tracker, domain)
+                    outcome = 'ok'
+                    return events
+                finally:
+                    observe(self, tracker, outcome, started)
+    else:
+        @functools.wraps(run)
+        def timed_run(self, dispatcher, tracker, domain):
+            with action_span(self, tracker):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    events = run(self, dispatcher, tracker, domain)
+                    outcome = 'ok'
+                    return events
+                finally:
+                    observe(self, tracker, outcome, started)
+
+    action_class.run = timed_run
+    return action_class
+
+# Todas las acciones de este módulo quedan instrumentadas
+for _action_class in Action.__subclasses__():
+    if _action_class.__module__ == __name__:
+        instrument_action(_action_class)
\ No newline at end of file
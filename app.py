@@ -1,13 +1,27 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import requests
 import logging
 import os
+import time
 from dotenv import load_dotenv
 import json
-import time
 import google.generativeai as genai
 
+from src.rasa_client import RasaClient
+from src.nlu_router import HybridNLURouter
+from src.nlu_cache import NLUCache, schema_version
+from src.nlu_batcher import NLUBatcher, batching_config_from_env
+from src.streaming import sse_event, iter_action_stream
+from src.resilience import ResilientCaller, CircuitOpenError
+from src.batch_scoring import DEFAULT_CHUNK_SIZE, ThroughputMeter, batch_params_error, score_lines
+from src.metrics import REGISTRY as metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.tracing import Tracer, TraceContext, TRACEPARENT_KEY
+from src.emergency import EmergencyDetector
+from src.admission import AdmissionController
+from src.speculation import SPECULATION_KEY, Speculator
+from src.generation_prompts import USER_TEXT_KEY
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -20,13 +34,26 @@ logger = logging.getLogger(__name__)
 # --- CONFIGURACIÓN ---
 # RASA_API_URL = os.getenv("RASA_API_URL", "https://chatbot-rasa.onrender.com/webhooks/rest/webhook")
 # Para pruebas locales
-RASA_API_URL = "http://localhost:5005/webhooks/rest/webhook"
+RASA_API_URL = os.getenv("RASA_API_URL", "http://localhost:5005/webhooks/rest/webhook")
+
+# Cliente con pool de conexiones keep-alive hacia RASA (uno por worker)
+rasa_client = RasaClient.from_env(RASA_API_URL)
+
+# Endpoint del servidor de acciones que sirve los tokens de Gemini en streaming
+ACTION_STREAM_URL = os.getenv("ACTION_STREAM_URL", "http://localhost:5056/streams")
+action_stream_session = requests.Session()
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Endpoint alternativo de la API REST de Gemini (p. ej. el stub de benchmarks/load_test.py)
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
 
 # Configuración de Gemini con manejo de errores
 try:
-    if GEMINI_API_KEY:
+    if GEMINI_API_KEY and GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY, transport='rest', client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+        gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+        logger.info(f"Modelo Gemini cargado exitosamente (endpoint {GEMINI_API_ENDPOINT}).")
+    elif GEMINI_API_KEY:
         genai.configure(api_key=GEMINI_API_KEY)
         gemini_model = genai.GenerativeModel('gemini-2.0-flash')
         logger.info("Modelo Gemini cargado exitosamente.")
@@ -60,6 +87,33 @@ Texto del usuario: "{user_message}"
 JSON:
 """
 
+# Variante del prompt que clasifica varios mensajes en una sola llamada (micro-batching)
+BATCH_INTENT_PROMPT_TEMPLATE = """
+Eres un motor de Comprensión de Lenguaje Natural (NLU) altamente preciso. Tu tarea es analizar VARIOS textos de usuarios independientes y extraer la intención y entidades de cada uno en formato JSON.
+
+REGLAS CRÍTICAS:
+1.  **PRIORIDAD MÁXIMA:** Si un texto indica una emergencia médica, una situación de vida o muerte, o menciona síntomas graves como "infarto", "derrame cerebral", "no puedo respirar", etc., DEBES clasificar su intención como "contacto_emergencia", sin importar qué más diga.
+2.  La salida DEBE ser un array JSON con exactamente un objeto por texto, con las claves "id", "intent" y "entities". "id" es el número del texto.
+3.  La clave "intent" DEBE ser uno de los siguientes valores: {intents_list}.
+4.  La clave "entities" DEBE ser una lista de objetos JSON, cada uno con una clave "entity" y una clave "value".
+5.  Las entidades posibles son: {entities_list}.
+6.  Si después de aplicar la regla de emergencia, no puedes identificar una intención de la lista con confianza, asigna el intent "nlu_fallback".
+7.  Si no encuentras entidades, devuelve una lista vacía [].
+8.  Clasifica cada texto por separado; no mezcles información entre textos.
+9.  Tu respuesta DEBE contener únicamente el array JSON y nada más.
+
+### EJEMPLO
+Textos:
+1. "hola"
+2. "me duele el pecho y creo que estoy teniendo un infarto"
+JSON: [{{"id": 1, "intent": "greet", "entities": []}}, {{"id": 2, "intent": "contacto_emergencia", "entities": []}}]
+
+### TAREA
+Textos:
+{user_messages}
+JSON:
+"""
+
 # Definición centralizada de intenciones y entidades conocidas por el sistema RASA
 VALID_INTENTS = [
     "greet", "goodbye", "affirm", "deny", "ask_help", "switch_domain",
@@ -73,111 +127,557 @@ VALID_ENTITIES = [
     "cuenta_destino", "tipo_tarjeta", "especialidad", "fecha_hora", "sintoma", "medicamento", "dominio"
 ]
 
+# Enrutador del modo 'hybrid': modelo local (SVC) primero, Gemini solo si hace falta
+nlu_router = HybridNLURouter.from_env(VALID_INTENTS)
+
+# Camino rápido de emergencias: términos de data/emergency_terms.txt comprobados antes de cualquier NLU
+emergency_detector = EmergencyDetector.from_env()
+EMERGENCY_NLU = {"intent": "contacto_emergencia", "entities": []}
+
+# Control de admisión hacia Gemini: token bucket por sender y límite de llamadas en vuelo con
+# cola por prioridad de dominio. Lo que no se admite usa el NLU de RASA (ADMISSION_ENABLED=0 lo desactiva).
+admission = AdmissionController.from_env()
+
+# Cache de resultados de NLU de Gemini (texto normalizado + versión del esquema)
+nlu_cache = NLUCache.from_env()
 
-def get_intent_from_gemini_robust(user_message, max_retries=2):
+# --- MÉTRICAS (formato Prometheus en /metrics) ---
+NLU_MODES = ('rasa', 'gemini', 'hybrid')
+GEMINI_NLU_SECONDS = metrics.histogram(
+    'gateway_gemini_nlu_seconds', "NLU con Gemini de extremo a extremo (cache, batching y reintentos incluidos)", ['outcome'])
+GEMINI_NLU_ATTEMPT_SECONDS = metrics.histogram(
+    'gateway_gemini_nlu_attempt_seconds', "Cada llamada individual a Gemini para NLU", ['attempt', 'outcome'])
+GEMINI_NLU_ATTEMPTS = metrics.counter(
+    'gateway_gemini_nlu_attempts_total', "Llamadas a Gemini para NLU (primer intento, reintentos y lotes)", ['attempt', 'outcome'])
+RASA_REQUEST_SECONDS = metrics.histogram(
+    'gateway_rasa_request_seconds', "Ida y vuelta al webhook REST de RASA", ['outcome'])
+WEBHOOK_SECONDS = metrics.histogram(
+    'gateway_message_seconds', "Procesado completo de un mensaje (NLU + RASA)", ['nlu_mode'])
+EMERGENCY_FAST_PATH = metrics.counter(
+    'gateway_emergency_fast_path_total', "Mensajes enviados a RASA como contacto_emergencia sin pasar por el NLU")
+ADMISSION_WAIT_SECONDS = metrics.histogram(
+    'gateway_admission_wait_seconds', "Espera de admisión antes de llamar a Gemini", ['outcome'])
+ADMISSION_SHED = metrics.counter(
+    'gateway_admission_shed_total', "Mensajes que no se admiten hacia Gemini y usan el NLU de RASA", ['reason'])
+ADMISSION_QUEUE_DEPTH = metrics.gauge(
+    'gateway_admission_queue_depth', "Mensajes esperando un hueco para llamar a Gemini")
+ADMISSION_IN_FLIGHT = metrics.gauge(
+    'gateway_admission_in_flight', "Llamadas a Gemini admitidas y en curso")
+SPECULATION_STARTED = metrics.counter(
+    'gateway_speculation_started_total', "Generaciones especulativas lanzadas en paralelo con RASA", ['intent'])
+GEMINI_BREAKER_STATE = metrics.gauge(
+    'gateway_gemini_breaker_state', "Estado del circuit breaker de Gemini (0 closed, 1 half_open, 2 open)", ['breaker'])
+GEMINI_BREAKER_TRANSITIONS = metrics.counter(
+    'gateway_gemini_breaker_transitions_total', "Cambios de estado del circuit breaker de Gemini", ['breaker', 'from_state', 'to_state'])
+
+# Resiliencia del NLU con Gemini: presupuesto por petición (GEMINI_NLU_BUDGET), reintentos con
+# backoff y jitter, circuit breaker y hedge opcional. Si falla, se usa el fallback de RASA.
+# Las llamadas abandonadas por plazo siguen ocupando su hueco de admisión hasta que terminan.
+gemini_resilience = ResilientCaller.from_env(
+    'gemini-nlu', prefix='GEMINI_NLU', budget=8.0, max_attempts=2,
+    on_abandon=admission.gate.hold if admission is not None else None,
+    on_transition=lambda old, new: GEMINI_BREAKER_TRANSITIONS.labels('gemini-nlu', old, new).inc())
+GEMINI_BREAKER_STATE.labels('gemini-nlu').set_function(lambda: gemini_resilience.breaker.state_value)
+
+# Generación especulativa (SPECULATION_ENABLED=1): con la intención ya conocida, la respuesta de
+# Gemini de pregunta_abierta, consultar_sintoma, informacion_medicamento y recomendar_producto
+# se genera en paralelo con RASA y se entrega a la acción a través del servidor de acciones.
+# Comparte el circuit breaker de Gemini y solo usa huecos de admisión libres.
+GEMINI_GENERATION_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+speculator = Speculator.from_env(
+    genai.GenerativeModel(GEMINI_GENERATION_MODEL) if gemini_model else None, GEMINI_GENERATION_MODEL,
+    breaker=gemini_resilience.breaker, gate=admission.gate if admission is not None else None)
+
+
+# --- TRAZAS (gateway -> RASA -> acciones) ---
+# Cada mensaje abre una traza (o continúa la de la cabecera 'traceparent') que viaja a RASA en
+# metadata.traceparent. Exportación con TRACE_EXPORT_PATH o TRACE_COLLECTOR_URL.
+tracer = Tracer.from_env('gateway')
+
+
+def observe_gemini_attempt(attempt, outcome, started):
+    """Registra la duración y el resultado de una llamada individual a Gemini"""
+    GEMINI_NLU_ATTEMPT_SECONDS.labels(attempt, outcome).observe(time.perf_counter() - started)
+    GEMINI_NLU_ATTEMPTS.labels(attempt, outcome).inc()
+
+
+def observe_admission(reason, started, span):
+    """Registra la espera de admisión y, si no se admite, el motivo"""
+    ADMISSION_WAIT_SECONDS.labels(reason or 'admitted').observe(time.perf_counter() - started)
+    span.set_attribute('outcome', reason or 'admitted')
+    if reason is not None:
+        ADMISSION_SHED.labels(reason).inc()
+        logger.warning(f"Mensaje no admitido hacia Gemini ({reason}): se usa el NLU de RASA.")
+
+
+def admit_to_gemini(sender_id):
+    """None si el mensaje puede llamar a Gemini (liberar con admission.release()) o el motivo del descarte"""
+    with tracer.span('admission.wait', root=False, sender=sender_id) as span:
+        started = time.perf_counter()
+        reason = admission.admit(sender_id)
+        observe_admission(reason, started, span)
+    return reason
+
+
+def remember_sender_domain(sender_id, nlu_data):
+    """Dominio del sender para priorizar sus próximos mensajes y para los prompts especulativos"""
+    if admission is not None:
+        admission.remember(sender_id, nlu_data)
+    if speculator is not None:
+        speculator.remember(sender_id, nlu_data)
+
+
+def start_speculation(sender_id, nlu_data, user_message, rasa_metadata):
+    """Lanza la generación especulativa si la intención lo permite y devuelve los metadatos para RASA"""
+    if speculator is None:
+        return rasa_metadata
+    speculation = speculator.start(sender_id, nlu_data, user_message)
+    if speculation is None:
+        return rasa_metadata
+    SPECULATION_STARTED.labels(nlu_data['intent']).inc()
+    logger.info(f"Generación especulativa lanzada para '{nlu_data['intent']}' (turno {speculation['turn']}).")
+    return dict(rasa_metadata or {}, **{SPECULATION_KEY: speculation})
+
+
+# Mensajes que se devuelven al usuario cuando algo falla
+GEMINI_FALLBACK_NOTICE = "(Hubo un problema con el modo inteligente, usando el modo rápido para esta respuesta.)"
+RASA_CONNECTION_ERROR_TEXT = "Lo siento, no puedo conectarme con el asistente en este momento."
+RASA_UNEXPECTED_ERROR_TEXT = "Ha ocurrido un error inesperado."
+
+
+def build_intent_prompt(user_message):
     """
-    Función robusta para obtener la intención de Gemini, con reintentos y validación de JSON.
+    Construye el prompt de NLU para Gemini a partir del mensaje del usuario.
     """
-    if not gemini_model:
-        logger.error("Se intentó usar el NLU de Gemini, pero el modelo no está disponible.")
-        return None
-
-    prompt = INTENT_PROMPT_TEMPLATE.format(
+    return INTENT_PROMPT_TEMPLATE.format(
         intents_list=json.dumps(VALID_INTENTS),
         entities_list=json.dumps(VALID_ENTITIES),
         user_message=user_message
     )
-    
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Intento {attempt + 1} de NLU con Gemini.")
-            response = gemini_model.generate_content(prompt)
-            
-            # Limpiar la respuesta para extraer solo el JSON
-            cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-            
-            # Validar el JSON
-            parsed_json = json.loads(cleaned_response)
-            
-            # Validar la estructura del JSON
-            if "intent" in parsed_json and "entities" in parsed_json and isinstance(parsed_json["entities"], list):
-                logger.info(f"NLU de Gemini exitoso: {parsed_json}")
-                return parsed_json
-            else:
-                logger.warning(f"Respuesta de Gemini no tiene la estructura esperada: {cleaned_response}")
-
-        except json.JSONDecodeError:
-            logger.warning(f"Respuesta de Gemini no es un JSON válido: {response.text}")
-        except Exception as e:
-            logger.error(f"Error inesperado en la llamada a Gemini: {e}")
-        
-        # Esperar un poco antes de reintentar
-        time.sleep(0.5)
 
-    logger.error(f"Fallaron todos los intentos de obtener NLU de Gemini para el mensaje: '{user_message}'")
-    return None # Devolver None si todos los intentos fallan
+
+def current_nlu_schema_version():
+    """
+    Versión del esquema de NLU; cambia si se modifican VALID_INTENTS, VALID_ENTITIES o el prompt.
+    """
+    return schema_version(VALID_INTENTS, VALID_ENTITIES, INTENT_PROMPT_TEMPLATE)
 
 
-def get_rasa_response(sender_id, message):
+def build_batch_intent_prompt(user_messages):
     """
-    Función para enviar un mensaje a RASA y obtener la respuesta.
+    Construye el prompt de NLU que clasifica varios mensajes a la vez.
+    """
+    numbered = "\n".join(f"{index}. {json.dumps(message, ensure_ascii=False)}" for index, message in enumerate(user_messages, start=1))
+    return BATCH_INTENT_PROMPT_TEMPLATE.format(
+        intents_list=json.dumps(VALID_INTENTS),
+        entities_list=json.dumps(VALID_ENTITIES),
+        user_messages=numbered
+    )
+
+
+def is_valid_nlu(parsed_json):
+    """
+    Comprueba que un resultado de NLU tenga la estructura esperada.
     """
-    payload = {"sender": sender_id, "message": message}
+    return isinstance(parsed_json, dict) and "intent" in parsed_json and "entities" in parsed_json and isinstance(parsed_json["entities"], list)
+
+
+def parse_gemini_nlu(response_text):
+    """
+    Limpia y valida la respuesta de Gemini. Devuelve el dict de NLU o None si no tiene la estructura esperada.
+    Lanza json.JSONDecodeError si la respuesta no es un JSON válido.
+    """
+    # Limpiar la respuesta para extraer solo el JSON
+    cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
+
+    # Validar el JSON
+    parsed_json = json.loads(cleaned_response)
+
+    # Validar la estructura del JSON
+    if is_valid_nlu(parsed_json):
+        return parsed_json
+
+    logger.warning(f"Respuesta de Gemini no tiene la estructura esperada: {cleaned_response}")
+    return None
+
+
+def parse_gemini_nlu_batch(response_text, size):
+    """
+    Valida la respuesta de un lote. Devuelve una lista de `size` elementos con el dict de NLU
+    de cada mensaje, o None en las posiciones que falten o sean inválidas.
+    Lanza json.JSONDecodeError si la respuesta no es un JSON válido.
+    """
+    cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
+    parsed_json = json.loads(cleaned_response)
+
+    results = [None] * size
+    if not isinstance(parsed_json, list):
+        logger.warning(f"Respuesta de lote de Gemini no es un array: {cleaned_response}")
+        return results
+
+    for position, item in enumerate(parsed_json):
+        if not is_valid_nlu(item):
+            continue
+        index = item.get("id", position + 1)
+        if not isinstance(index, int) or not 1 <= index <= size or results[index - 1] is not None:
+            continue
+        results[index - 1] = {"intent": item["intent"], "entities": item["entities"]}
+    return results
+
+
+def build_rasa_message(nlu_data):
+    """
+    Convierte el resultado de NLU en un mensaje inyectable a RASA Core (/intent{"entidad": "valor"}).
+    """
+    intent_name = nlu_data.get("intent", "nlu_fallback")
+    entities = nlu_data.get("entities", [])
+
+    if entities:
+        entity_payload = json.dumps({entity['entity']: entity['value'] for entity in entities if 'entity' in entity and 'value' in entity})
+        return f"/{intent_name}{entity_payload}"
+    return f"/{intent_name}"
+
+
+def request_intent_from_gemini(user_message, max_retries=2, budget=None):
+    """
+    Llamada individual a Gemini con reintentos y validación de JSON (sin cache ni batching).
+    Los reintentos, el backoff y el presupuesto de latencia (budget, por defecto GEMINI_NLU_BUDGET)
+    los gestiona gemini_resilience.
+    """
+    prompt = build_intent_prompt(user_message)
+    attempts = []
+
+    def call_gemini(timeout):
+        attempts.append(None)
+        attempt = 'first' if len(attempts) == 1 else 'retry'
+        logger.info(f"Intento {len(attempts)} de NLU con Gemini.")
+        with tracer.span('gemini.nlu_attempt', root=False, attempt=attempt):
+            started = time.perf_counter()
+            try:
+                response = gemini_model.generate_content(prompt, request_options={'timeout': timeout})
+            except Exception:
+                observe_gemini_attempt(attempt, 'error', started)
+                raise
+            try:
+                parsed_json = parse_gemini_nlu(response.text)
+            except json.JSONDecodeError:
+                observe_gemini_attempt(attempt, 'invalid', started)
+                logger.warning(f"Respuesta de Gemini no es un JSON válido: {response.text}")
+                raise
+            if parsed_json is None:
+                observe_gemini_attempt(attempt, 'invalid', started)
+                raise ValueError("Respuesta de Gemini sin la estructura esperada")
+            observe_gemini_attempt(attempt, 'ok', started)
+            return parsed_json
+
     try:
-        response = requests.post(RASA_API_URL, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error de conexión con el servidor de RASA: {e}")
-        return [{"text": "Lo siento, no puedo conectarme con el asistente en este momento."}]
+        parsed_json = gemini_resilience.call(call_gemini, budget=budget, max_attempts=max_retries)
+        logger.info(f"NLU de Gemini exitoso: {parsed_json}")
+        return parsed_json
+    except CircuitOpenError:
+        logger.warning("Circuit breaker de Gemini abierto: se omite la llamada y se usa el fallback de RASA.")
     except Exception as e:
-        logger.error(f"Ocurrió un error inesperado al comunicarse con RASA: {e}")
-        return [{"text": "Ha ocurrido un error inesperado."}]
+        logger.error(f"Fallaron todos los intentos de obtener NLU de Gemini para el mensaje: '{user_message}' ({e})")
+    return None # Devolver None si todos los intentos fallan
+
+
+def request_intents_batch_from_gemini(user_messages, budget=None):
+    """
+    Clasifica varios mensajes con una sola llamada a Gemini. Las posiciones inválidas quedan en None
+    para que el batcher las reenvíe individualmente.
+    """
+    logger.info(f"NLU con Gemini para un lote de {len(user_messages)} mensajes.")
+    prompt = build_batch_intent_prompt(user_messages)
+    started = time.perf_counter()
+    try:
+        response = gemini_resilience.call(
+            lambda timeout: gemini_model.generate_content(prompt, request_options={'timeout': timeout}), budget=budget, max_attempts=1)
+    except Exception:
+        observe_gemini_attempt('batch', 'error', started)
+        raise
+    observe_gemini_attempt('batch', 'ok', started)
+    return parse_gemini_nlu_batch(response.text, len(user_messages))
+
+
+# Micro-batching opcional de peticiones de NLU concurrentes (NLU_BATCH_ENABLED=1). El lote y el
+# reenvío individual comparten el presupuesto de GEMINI_NLU_BUDGET de cada mensaje.
+_batch_config = batching_config_from_env()
+nlu_batcher = NLUBatcher(
+    request_intents_batch_from_gemini, request_intent_from_gemini, budget=gemini_resilience.budget, **_batch_config
+) if _batch_config else None
+
+
+def get_intent_from_gemini_robust(user_message, max_retries=2, sender_id=None):
+    """
+    Función robusta para obtener la intención de Gemini, con reintentos y validación de JSON.
+    Con sender_id la llamada pasa por el control de admisión.
+    """
+    with tracer.span('gemini.nlu', root=False) as span:
+        started = time.perf_counter()
+        parsed_json, outcome = _intent_from_gemini(user_message, max_retries, sender_id)
+        GEMINI_NLU_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+        span.set_attribute('outcome', outcome)
+    return parsed_json
+
+
+def _intent_from_gemini(user_message, max_retries, sender_id=None):
+    """Devuelve (nlu_data, resultado) con resultado 'unavailable', 'cache', 'shed', 'ok' o 'failed'"""
+    if not gemini_model:
+        logger.error("Se intentó usar el NLU de Gemini, pero el modelo no está disponible.")
+        return None, 'unavailable'
+
+    if nlu_cache is not None:
+        version = current_nlu_schema_version()
+        cached = nlu_cache.get(user_message, version)
+        if cached is not None:
+            logger.info(f"NLU de Gemini servido desde cache: {cached}")
+            return cached, 'cache'
+
+    admitted = admission is not None and sender_id is not None
+    if admitted and admit_to_gemini(sender_id) is not None:
+        return None, 'shed'
+    try:
+        if nlu_batcher is not None:
+            parsed_json = nlu_batcher.classify(user_message)
+        else:
+            parsed_json = request_intent_from_gemini(user_message, max_retries)
+    finally:
+        if admitted:
+            admission.release()
+
+    if parsed_json is None:
+        return None, 'failed'
+    if nlu_cache is not None:
+        nlu_cache.set(user_message, version, parsed_json)
+    return parsed_json, 'ok'
+
+
+def get_intent_hybrid(user_message, sender_id=None):
+    """
+    NLU del modo 'hybrid': usa el clasificador local y escala a Gemini solo con baja confianza
+    o para intenciones de la lista de escalado.
+    """
+    with tracer.span('nlu.local', root=False) as span:
+        nlu_data, reason = nlu_router.local_decision(user_message)
+        span.set_attribute('reason', reason)
+    if nlu_data is not None:
+        nlu_router.record('local', reason)
+        return nlu_data
+
+    nlu_data = get_intent_from_gemini_robust(user_message, sender_id=sender_id)
+    nlu_router.record('gemini' if nlu_data is not None else 'gemini_fallido', reason)
+    return nlu_data
+
+
+def get_rasa_response(sender_id, message, metadata=None):
+    """
+    Función para enviar un mensaje a RASA y obtener la respuesta.
+    """
+    with tracer.span('rasa.request', root=False) as span:
+        if span.traceparent:
+            # Las acciones leen el traceparent de tracker.latest_message['metadata']
+            metadata = dict(metadata or {}, **{TRACEPARENT_KEY: span.traceparent})
+        payload = {"sender": sender_id, "message": message}
+        if metadata:
+            payload["metadata"] = metadata
+        started = time.perf_counter()
+        try:
+            messages = rasa_client.post(payload)
+            RASA_REQUEST_SECONDS.labels('ok').observe(time.perf_counter() - started)
+            return messages
+        except requests.exceptions.RequestException as e:
+            RASA_REQUEST_SECONDS.labels('connection_error').observe(time.perf_counter() - started)
+            span.set_error(e)
+            logger.error(f"Error de conexión con el servidor de RASA: {e}")
+            return [{"text": RASA_CONNECTION_ERROR_TEXT}]
+        except Exception as e:
+            RASA_REQUEST_SECONDS.labels('error').observe(time.perf_counter() - started)
+            span.set_error(e)
+            logger.error(f"Ocurrió un error inesperado al comunicarse con RASA: {e}")
+            return [{"text": RASA_UNEXPECTED_ERROR_TEXT}]
 
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    data = request.json
-    user_message = data['message']
-    sender_id = data.get('sender', 'user')
-    # Extraer el modo NLU de los metadatos, con 'rasa' como valor por defecto
-    nlu_mode = data.get('metadata', {}).get('nlu_mode', 'rasa')
+@app.route('/stats/rasa-pool')
+def rasa_pool_stats():
+    return jsonify(rasa_client.stats())
+
+@app.route('/stats/nlu-router')
+def nlu_router_stats():
+    return jsonify(nlu_router.stats())
+
+@app.route('/stats/nlu-cache')
+def nlu_cache_stats():
+    return jsonify(nlu_cache.stats() if nlu_cache is not None else {'enabled': False})
+
+@app.route('/stats/nlu-batch')
+def nlu_batch_stats():
+    return jsonify(nlu_batcher.stats() if nlu_batcher is not None else {'enabled': False})
+
+def handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata=None, trace=None):
+    """
+    Procesa un mensaje del usuario según el modo NLU y devuelve la lista de mensajes de RASA.
+    trace es el TraceContext de la petición (una traza nueva si no se indica).
+    """
+    with tracer.span('gateway.message', context=trace, sender=sender_id, nlu_mode=nlu_mode):
+        with WEBHOOK_SECONDS.labels(nlu_mode if nlu_mode in NLU_MODES else 'rasa').time():
+            return _handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata)
+
+
+def detect_emergency(user_message):
+    """Término de emergencia del mensaje (None si no hay o el detector está desactivado)"""
+    if emergency_detector is None:
+        return None
+    with tracer.span('emergency.check', root=False) as span:
+        term = emergency_detector.detect(user_message)
+        span.set_attribute('detected', term is not None)
+    if term is not None:
+        EMERGENCY_FAST_PATH.inc()
+        logger.warning(f"Emergencia detectada ('{term}'): se envía contacto_emergencia a RASA sin esperar al NLU.")
+    return term
+
 
+def _handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata):
     logger.info(f"Mensaje: '{user_message}', Sender: '{sender_id}', Modo NLU: '{nlu_mode}'")
 
-    if nlu_mode == 'gemini':
-        nlu_data = get_intent_from_gemini_robust(user_message)
+    # Las emergencias no esperan a Gemini ni al clasificador, sea cual sea el modo
+    if detect_emergency(user_message) is not None:
+        remember_sender_domain(sender_id, EMERGENCY_NLU)
+        return get_rasa_response(sender_id, build_rasa_message(EMERGENCY_NLU), rasa_metadata)
+
+    if nlu_mode in ('gemini', 'hybrid'):
+        if nlu_mode == 'hybrid':
+            nlu_data = get_intent_hybrid(user_message, sender_id)
+        else:
+            nlu_data = get_intent_from_gemini_robust(user_message, sender_id=sender_id)
+        remember_sender_domain(sender_id, nlu_data)
         
         # Si Gemini falla, cambiamos al modo RASA como fallback para esta petición
         if nlu_data is None:
             logger.warning("Fallback a NLU de RASA debido a un error de Gemini.")
-            rasa_messages = get_rasa_response(sender_id, user_message)
+            rasa_messages = get_rasa_response(sender_id, user_message, rasa_metadata)
             # Añadir un mensaje para informar al usuario del cambio
-            rasa_messages.insert(0, {"text": "(Hubo un problema con el modo inteligente, usando el modo rápido para esta respuesta.)"})
-            return jsonify(rasa_messages)
+            rasa_messages.insert(0, {"text": GEMINI_FALLBACK_NOTICE})
+            return rasa_messages
 
-        # Si Gemini tiene éxito, construimos el mensaje para RASA Core
-        intent_name = nlu_data.get("intent", "nlu_fallback")
-        entities = nlu_data.get("entities", [])
-        
-        if entities:
-            entity_payload = json.dumps({entity['entity']: entity['value'] for entity in entities if 'entity' in entity and 'value' in entity})
-            rasa_message = f"/{intent_name}{entity_payload}"
-        else:
-            rasa_message = f"/{intent_name}"
+        # Si Gemini tiene éxito, construimos el mensaje para RASA Core (con el texto original en los metadatos)
+        rasa_message = build_rasa_message(nlu_data)
+        rasa_metadata = dict(rasa_metadata or {}, **{USER_TEXT_KEY: user_message})
+        rasa_metadata = start_speculation(sender_id, nlu_data, user_message, rasa_metadata)
         
         logger.info(f"Inyectando a RASA Core: {rasa_message}")
-        rasa_messages = get_rasa_response(sender_id, rasa_message)
+        return get_rasa_response(sender_id, rasa_message, rasa_metadata)
 
-    else: # nlu_mode == 'rasa'
-        logger.info("Usando NLU de RASA.")
-        rasa_messages = get_rasa_response(sender_id, user_message)
-        
-    return jsonify(rasa_messages)
+    # nlu_mode == 'rasa'
+    logger.info("Usando NLU de RASA.")
+    return get_rasa_response(sender_id, user_message, rasa_metadata)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if admission is not None:
+        ADMISSION_QUEUE_DEPTH.set(admission.gate.depth)
+        ADMISSION_IN_FLIGHT.set(admission.gate.in_flight)
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/stats/resilience')
+def resilience_stats():
+    return jsonify(gemini_resilience.stats())
+
+@app.route('/stats/tracing')
+def tracing_stats():
+    return jsonify(tracer.stats())
+
+@app.route('/stats/admission')
+def admission_stats():
+    return jsonify(admission.stats() if admission is not None else {'enabled': False})
+
+@app.route('/stats/speculation')
+def speculation_stats():
+    return jsonify(speculator.stats() if speculator is not None else {'enabled': False})
+
+@app.route('/stats/emergency')
+def emergency_stats():
+    return jsonify(emergency_detector.stats() if emergency_detector is not None else {'enabled': False})
+
+@app.route('/nlu/batch', methods=['POST'])
+def nlu_batch():
+    """
+    Clasificación masiva con el modelo local (sin pasar por RASA ni Gemini). El cuerpo es JSONL
+    y la respuesta también, una línea por mensaje, generada por trozos a medida que se lee.
+    Parámetros: chunk_size, top_k y summary=1 para añadir una última línea con el rendimiento.
+    """
+    classifier = nlu_router.classifier
+    if classifier is None:
+        return jsonify({'error': 'No hay modelo local entrenado'}), 503
+
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    top_k = request.args.get('top_k', 1, type=int)
+    # Se valida antes de empezar a responder: a mitad del stream ya no se puede devolver un 400
+    error = batch_params_error(chunk_size, top_k)
+    if error is not None:
+        return jsonify({'error': error}), 400
+    with_summary = request.args.get('summary') in ('1', 'true')
+
+    def results():
+        meter = ThroughputMeter()
+        for result in score_lines(classifier, request.stream, chunk_size, top_k, meter):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        summary = meter.summary()
+        logger.info(f"/nlu/batch: {summary['messages']} mensajes en {summary['seconds']}s ({summary['messages_per_second']} msg/s)")
+        if with_summary:
+            yield json.dumps({'summary': summary}) + "\n"
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+@app.route('/webhook', methods=['POST'])
+def webhook():
+    data = request.json
+    user_message = data['message']
+    sender_id = data.get('sender', 'user')
+    # Extraer el modo NLU de los metadatos, con 'rasa' como valor por defecto
+    nlu_mode = data.get('metadata', {}).get('nlu_mode', 'rasa')
+    trace = TraceContext.from_traceparent(request.headers.get(TRACEPARENT_KEY))
+
+    response = jsonify(handle_user_message(user_message, sender_id, nlu_mode, trace=trace))
+    response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.route('/webhook/stream', methods=['POST'])
+def webhook_stream():
+    """
+    Igual que /webhook pero responde con Server-Sent Events: los mensajes fijos llegan como
+    eventos 'message' y las respuestas generadas por Gemini como eventos 'token' a medida
+    que el servidor de acciones las produce.
+    """
+    data = request.json
+    user_message = data['message']
+    sender_id = data.get('sender', 'user')
+    nlu_mode = data.get('metadata', {}).get('nlu_mode', 'rasa')
+    trace = TraceContext.from_traceparent(request.headers.get(TRACEPARENT_KEY))
+
+    def events():
+        rasa_messages = handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata={"stream": True}, trace=trace)
+        for message in rasa_messages:
+            stream_id = (message.get('custom') or {}).get('stream_id')
+            if not stream_id:
+                yield sse_event('message', message)
+                continue
+
+            yield sse_event('stream_start', {"stream_id": stream_id})
+            try:
+                for token in iter_action_stream(action_stream_session, ACTION_STREAM_URL, stream_id):
+                    yield sse_event('token', {"stream_id": stream_id, "text": token})
+            except Exception as e:
+                logger.error(f"Error leyendo el stream {stream_id} del servidor de acciones: {e}")
+                yield sse_event('token', {"stream_id": stream_id, "text": RASA_UNEXPECTED_ERROR_TEXT})
+            yield sse_event('stream_end', {"stream_id": stream_id})
+        yield sse_event('done', {})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Trace-Id': trace.trace_id})
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
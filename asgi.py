@@ -0,0 +1,445 @@
+# Modo asíncrono (ASGI) del gateway.
+# Expone la misma API que app.py ('/' y '/webhook') pero las llamadas a Gemini y a RASA
+# se esperan con await, por lo que un solo proceso puede atender cientos de conversaciones
+# en paralelo sin bloquear workers.
+#
+# Para ejecutarlo:  uvicorn asgi:app --host 0.0.0.0 --port $PORT
+from quart import Quart, render_template, request, jsonify, Response
+from quart_cors import cors
+import aiohttp
+import asyncio
+import json
+import logging
+import os
+import time
+
+from app import (
+    RASA_API_URL,
+    ACTION_STREAM_URL,
+    GEMINI_FALLBACK_NOTICE,
+    RASA_CONNECTION_ERROR_TEXT,
+    RASA_UNEXPECTED_ERROR_TEXT,
+    gemini_model,
+    gemini_resilience,
+    nlu_router,
+    nlu_cache,
+    current_nlu_schema_version,
+    build_intent_prompt,
+    build_batch_intent_prompt,
+    parse_gemini_nlu,
+    parse_gemini_nlu_batch,
+    build_rasa_message,
+    metrics,
+    METRICS_CONTENT_TYPE,
+    NLU_MODES,
+    GEMINI_NLU_SECONDS,
+    RASA_REQUEST_SECONDS,
+    WEBHOOK_SECONDS,
+    observe_gemini_attempt,
+    tracer,
+    emergency_detector,
+    detect_emergency,
+    EMERGENCY_NLU,
+    admission,
+    observe_admission,
+    remember_sender_domain,
+    start_speculation,
+    speculator,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_IN_FLIGHT,
+)
+from src.rasa_client import AsyncRasaClient
+from src.nlu_batcher import AsyncNLUBatcher, batching_config_from_env
+from src.streaming import sse_event, iter_action_stream_async
+from src.resilience import CircuitOpenError
+from src.batch_scoring import DEFAULT_CHUNK_SIZE, ThroughputMeter, batch_params_error, parse_record, score_chunk
+from src.tracing import TraceContext, TRACEPARENT_KEY
+from src.generation_prompts import USER_TEXT_KEY
+
+app = Quart(__name__)
+app = cors(app, allow_origin="*")
+app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default-secret-key-for-dev')
+
+logger = logging.getLogger(__name__)
+
+# Cliente asíncrono con pool de conexiones keep-alive hacia RASA
+rasa_client = AsyncRasaClient.from_env(RASA_API_URL)
+
+# Sesión para leer los streams de tokens del servidor de acciones (se crea al arrancar)
+action_stream_session = None
+
+
+async def request_intent_from_gemini_async(user_message, max_retries=2, budget=None):
+    """
+    Llamada individual asíncrona a Gemini con reintentos y validación de JSON (sin cache ni batching).
+    Comparte con app.py la capa de resiliencia (presupuesto, backoff, circuit breaker, hedge).
+    """
+    prompt = build_intent_prompt(user_message)
+    attempts = []
+
+    async def call_gemini(timeout):
+        attempts.append(None)
+        attempt = 'first' if len(attempts) == 1 else 'retry'
+        logger.info(f"Intento {len(attempts)} de NLU con Gemini (async).")
+        with tracer.span('gemini.nlu_attempt', root=False, attempt=attempt):
+            started = time.perf_counter()
+            try:
+                response = await gemini_model.generate_content_async(prompt, request_options={'timeout': timeout})
+            except Exception:
+                observe_gemini_attempt(attempt, 'error', started)
+                raise
+            try:
+                parsed_json = parse_gemini_nlu(response.text)
+            except json.JSONDecodeError:
+                observe_gemini_attempt(attempt, 'invalid', started)
+                logger.warning(f"Respuesta de Gemini no es un JSON válido: {response.text}")
+                raise
+            if parsed_json is None:
+                observe_gemini_attempt(attempt, 'invalid', started)
+                raise ValueError("Respuesta de Gemini sin la estructura esperada")
+            observe_gemini_attempt(attempt, 'ok', started)
+            return parsed_json
+
+    try:
+        parsed_json = await gemini_resilience.call_async(call_gemini, budget=budget, max_attempts=max_retries)
+        logger.info(f"NLU de Gemini exitoso: {parsed_json}")
+        return parsed_json
+    except CircuitOpenError:
+        logger.warning("Circuit breaker de Gemini abierto: se omite la llamada y se usa el fallback de RASA.")
+    except Exception as e:
+        logger.error(f"Fallaron todos los intentos de obtener NLU de Gemini para el mensaje: '{user_message}' ({e})")
+    return None
+
+
+async def request_intents_batch_from_gemini_async(user_messages, budget=None):
+    """
+    Clasifica varios mensajes con una sola llamada asíncrona a Gemini.
+    """
+    logger.info(f"NLU con Gemini para un lote de {len(user_messages)} mensajes (async).")
+    prompt = build_batch_intent_prompt(user_messages)
+    started = time.perf_counter()
+    try:
+        response = await gemini_resilience.call_async(
+            lambda timeout: gemini_model.generate_content_async(prompt, request_options={'timeout': timeout}), budget=budget, max_attempts=1)
+    except Exception:
+        observe_gemini_attempt('batch', 'error', started)
+        raise
+    observe_gemini_attempt('batch', 'ok', started)
+    return parse_gemini_nlu_batch(response.text, len(user_messages))
+
+
+# Micro-batching opcional de peticiones de NLU concurrentes (NLU_BATCH_ENABLED=1)
+_batch_config = batching_config_from_env()
+nlu_batcher = AsyncNLUBatcher(
+    request_intents_batch_from_gemini_async, request_intent_from_gemini_async, budget=gemini_resilience.budget, **_batch_config
+) if _batch_config else None
+
+
+async def admit_to_gemini_async(sender_id):
+    """Versión asíncrona de admit_to_gemini: la espera en la cola no bloquea el event loop"""
+    with tracer.span('admission.wait', root=False, sender=sender_id) as span:
+        started = time.perf_counter()
+        reason = await admission.admit_async(sender_id)
+        observe_admission(reason, started, span)
+    return reason
+
+
+async def get_intent_from_gemini_async(user_message, max_retries=2, sender_id=None):
+    """
+    Versión asíncrona de get_intent_from_gemini_robust: mismos reintentos y validación, sin bloquear el event loop.
+    """
+    with tracer.span('gemini.nlu', root=False) as span:
+        started = time.perf_counter()
+        parsed_json, outcome = await _intent_from_gemini_async(user_message, max_retries, sender_id)
+        GEMINI_NLU_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+        span.set_attribute('outcome', outcome)
+    return parsed_json
+
+
+async def _intent_from_gemini_async(user_message, max_retries, sender_id=None):
+    """Devuelve (nlu_data, resultado) con resultado 'unavailable', 'cache', 'shed', 'ok' o 'failed'"""
+    if not gemini_model:
+        logger.error("Se intentó usar el NLU de Gemini, pero el modelo no está disponible.")
+        return None, 'unavailable'
+
+    if nlu_cache is not None:
+        # Con NLU_CACHE_BACKEND=sqlite la consulta puede esperar al lock de otro worker: fuera del event loop
+        loop = asyncio.get_running_loop()
+        version = current_nlu_schema_version()
+        cached = await loop.run_in_executor(None, nlu_cache.get, user_message, version)
+        if cached is not None:
+            logger.info(f"NLU de Gemini servido desde cache: {cached}")
+            return cached, 'cache'
+
+    admitted = admission is not None and sender_id is not None
+    if admitted and await admit_to_gemini_async(sender_id) is not None:
+        return None, 'shed'
+    try:
+        if nlu_batcher is not None:
+            parsed_json = await nlu_batcher.classify(user_message)
+        else:
+            parsed_json = await request_intent_from_gemini_async(user_message, max_retries)
+    finally:
+        if admitted:
+            admission.release()
+
+    if parsed_json is None:
+        return None, 'failed'
+    if nlu_cache is not None:
+        await loop.run_in_executor(None, nlu_cache.set, user_message, version, parsed_json)
+    return parsed_json, 'ok'
+
+
+async def get_intent_hybrid_async(user_message, sender_id=None):
+    """
+    NLU del modo 'hybrid': clasificador local primero y Gemini (await) solo si hace falta.
+    """
+    with tracer.span('nlu.local', root=False) as span:
+        nlu_data, reason = nlu_router.local_decision(user_message)
+        span.set_attribute('reason', reason)
+    if nlu_data is not None:
+        nlu_router.record('local', reason)
+        return nlu_data
+
+    nlu_data = await get_intent_from_gemini_async(user_message, sender_id=sender_id)
+    nlu_router.record('gemini' if nlu_data is not None else 'gemini_fallido', reason)
+    return nlu_data
+
+
+async def get_rasa_response(sender_id, message, metadata=None):
+    """
+    Envía un mensaje a RASA de forma asíncrona y devuelve la respuesta.
+    """
+    with tracer.span('rasa.request', root=False) as span:
+        if span.traceparent:
+            metadata = dict(metadata or {}, **{TRACEPARENT_KEY: span.traceparent})
+        payload = {"sender": sender_id, "message": message}
+        if metadata:
+            payload["metadata"] = metadata
+        started = time.perf_counter()
+        try:
+            messages = await rasa_client.post(payload)
+            RASA_REQUEST_SECONDS.labels('ok').observe(time.perf_counter() - started)
+            return messages
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            RASA_REQUEST_SECONDS.labels('connection_error').observe(time.perf_counter() - started)
+            span.set_error(e)
+            logger.error(f"Error de conexión con el servidor de RASA: {e}")
+            return [{"text": RASA_CONNECTION_ERROR_TEXT}]
+        except Exception as e:
+            RASA_REQUEST_SECONDS.labels('error').observe(time.perf_counter() - started)
+            span.set_error(e)
+            logger.error(f"Ocurrió un error inesperado al comunicarse con RASA: {e}")
+            return [{"text": RASA_UNEXPECTED_ERROR_TEXT}]
+
+
+@app.before_serving
+async def open_clients():
+    global action_stream_session
+    action_stream_session = aiohttp.ClientSession()
+
+
+@app.after_serving
+async def close_clients():
+    await rasa_client.close()
+    if action_stream_session is not None:
+        await action_stream_session.close()
+
+
+@app.route('/')
+async def home():
+    return await render_template('index.html')
+
+@app.route('/stats/rasa-pool')
+async def rasa_pool_stats():
+    return jsonify(rasa_client.stats())
+
+@app.route('/stats/nlu-router')
+async def nlu_router_stats():
+    return jsonify(nlu_router.stats())
+
+@app.route('/stats/nlu-cache')
+async def nlu_cache_stats():
+    if nlu_cache is None:
+        return jsonify({'enabled': False})
+    # len() del backend sqlite es una consulta: tampoco en el event loop
+    return jsonify(await asyncio.get_running_loop().run_in_executor(None, nlu_cache.stats))
+
+@app.route('/stats/nlu-batch')
+async def nlu_batch_stats():
+    return jsonify(nlu_batcher.stats() if nlu_batcher is not None else {'enabled': False})
+
+async def handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata=None, trace=None):
+    """
+    Procesa un mensaje del usuario según el modo NLU y devuelve la lista de mensajes de RASA.
+    """
+    with tracer.span('gateway.message', context=trace, sender=sender_id, nlu_mode=nlu_mode):
+        with WEBHOOK_SECONDS.labels(nlu_mode if nlu_mode in NLU_MODES else 'rasa').time():
+            return await _handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata)
+
+
+async def _handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata):
+    logger.info(f"Mensaje: '{user_message}', Sender: '{sender_id}', Modo NLU: '{nlu_mode}'")
+
+    # Las emergencias no esperan a Gemini ni al clasificador, sea cual sea el modo
+    if detect_emergency(user_message) is not None:
+        remember_sender_domain(sender_id, EMERGENCY_NLU)
+        return await get_rasa_response(sender_id, build_rasa_message(EMERGENCY_NLU), rasa_metadata)
+
+    if nlu_mode in ('gemini', 'hybrid'):
+        if nlu_mode == 'hybrid':
+            nlu_data = await get_intent_hybrid_async(user_message, sender_id)
+        else:
+            nlu_data = await get_intent_from_gemini_async(user_message, sender_id=sender_id)
+        remember_sender_domain(sender_id, nlu_data)
+
+        # Si Gemini falla, cambiamos al modo RASA como fallback para esta petición
+        if nlu_data is None:
+            logger.warning("Fallback a NLU de RASA debido a un error de Gemini.")
+            rasa_messages = await get_rasa_response(sender_id, user_message, rasa_metadata)
+            rasa_messages.insert(0, {"text": GEMINI_FALLBACK_NOTICE})
+            return rasa_messages
+
+        rasa_message = build_rasa_message(nlu_data)
+        rasa_metadata = dict(rasa_metadata or {}, **{USER_TEXT_KEY: user_message})
+        # La generación especulativa corre en el pool del especulador, sin bloquear el event loop
+        rasa_metadata = start_speculation(sender_id, nlu_data, user_message, rasa_metadata)
+
+        logger.info(f"Inyectando a RASA Core: {rasa_message}")
+        return await get_rasa_response(sender_id, rasa_message, rasa_metadata)
+
+    # nlu_mode == 'rasa'
+    logger.info("Usando NLU de RASA.")
+    return await get_rasa_response(sender_id, user_message, rasa_metadata)
+
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    if admission is not None:
+        ADMISSION_QUEUE_DEPTH.set(admission.gate.depth)
+        ADMISSION_IN_FLIGHT.set(admission.gate.in_flight)
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/stats/resilience')
+async def resilience_stats():
+    return jsonify(gemini_resilience.stats())
+
+@app.route('/stats/tracing')
+async def tracing_stats():
+    return jsonify(tracer.stats())
+
+@app.route('/stats/admission')
+async def admission_stats():
+    return jsonify(admission.stats() if admission is not None else {'enabled': False})
+
+@app.route('/stats/speculation')
+async def speculation_stats():
+    return jsonify(speculator.stats() if speculator is not None else {'enabled': False})
+
+@app.route('/stats/emergency')
+async def emergency_stats():
+    return jsonify(emergency_detector.stats() if emergency_detector is not None else {'enabled': False})
+
+@app.route('/nlu/batch', methods=['POST'])
+async def nlu_batch():
+    """
+    Versión asíncrona de /nlu/batch: el cuerpo se lee por trozos y cada trozo de mensajes se
+    clasifica en un hilo para no bloquear el event loop.
+    """
+    classifier = nlu_router.classifier
+    if classifier is None:
+        return jsonify({'error': 'No hay modelo local entrenado'}), 503
+
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    top_k = request.args.get('top_k', 1, type=int)
+    # Se valida antes de empezar a responder: a mitad del stream ya no se puede devolver un 400
+    error = batch_params_error(chunk_size, top_k)
+    if error is not None:
+        return jsonify({'error': error}), 400
+    with_summary = request.args.get('summary') in ('1', 'true')
+    body = request.body
+
+    async def lines():
+        buffer = b""
+        async for data in body:
+            buffer += data
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line
+        if buffer:
+            yield buffer
+
+    async def results():
+        loop = asyncio.get_running_loop()
+        meter = ThroughputMeter()
+        chunk = []
+
+        async def flush():
+            scored = await loop.run_in_executor(None, score_chunk, classifier, chunk, top_k)
+            meter.add(len(chunk))
+            return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in scored)
+
+        async for line in lines():
+            record = parse_record(line)
+            if record is None:
+                continue
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield await flush()
+                chunk = []
+        if chunk:
+            yield await flush()
+
+        summary = meter.summary()
+        logger.info(f"/nlu/batch: {summary['messages']} mensajes en {summary['seconds']}s ({summary['messages_per_second']} msg/s)")
+        if with_summary:
+            yield json.dumps({'summary': summary}) + "\n"
+
+    response = Response(results(), mimetype='application/x-ndjson')
+    response.timeout = None
+    return response
+
+@app.route('/webhook', methods=['POST'])
+async def webhook():
+    data = await request.get_json()
+    user_message = data['message']
+    sender_id = data.get('sender', 'user')
+    nlu_mode = data.get('metadata', {}).get('nlu_mode', 'rasa')
+    trace = TraceContext.from_traceparent(request.headers.get(TRACEPARENT_KEY))
+
+    response = jsonify(await handle_user_message(user_message, sender_id, nlu_mode, trace=trace))
+    response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.route('/webhook/stream', methods=['POST'])
+async def webhook_stream():
+    """
+    Versión SSE de /webhook; mismo formato de eventos que en app.py.
+    """
+    data = await request.get_json()
+    user_message = data['message']
+    sender_id = data.get('sender', 'user')
+    nlu_mode = data.get('metadata', {}).get('nlu_mode', 'rasa')
+    trace = TraceContext.from_traceparent(request.headers.get(TRACEPARENT_KEY))
+
+    async def events():
+        rasa_messages = await handle_user_message(user_message, sender_id, nlu_mode, rasa_metadata={"stream": True}, trace=trace)
+        for message in rasa_messages:
+            stream_id = (message.get('custom') or {}).get('stream_id')
+            if not stream_id:
+                yield sse_event('message', message)
+                continue
+
+            yield sse_event('stream_start', {"stream_id": stream_id})
+            try:
+                async for token in iter_action_stream_async(action_stream_session, ACTION_STREAM_URL, stream_id):
+                    yield sse_event('token', {"stream_id": stream_id, "text": token})
+            except Exception as e:
+                logger.error(f"Error leyendo el stream {stream_id} del servidor de acciones: {e}")
+                yield sse_event('token', {"stream_id": stream_id, "text": RASA_UNEXPECTED_ERROR_TEXT})
+            yield sse_event('stream_end', {"stream_id": stream_id})
+        yield sse_event('done', {})
+
+    response = Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Trace-Id': trace.trace_id})
+    response.timeout = None
+    return response
@@ -0,0 +1,167 @@
+"""
+Latencia de busqueda del catalogo (src/catalog.py) con un catalogo sintetico de SKUs:
+carga desde SQLite, busqueda exacta normalizada y busqueda aproximada por trigramas frente
+al diccionario con clave en minusculas que usaban las acciones y a un recorrido lineal que
+puntua todos los productos (la respuesta ideal de la busqueda aproximada).
+
+Las consultas aproximadas se generan a partir de nombres reales del catalogo: sin espacios,
+sin una palabra, con una letra cambiada o en otro orden de mayusculas/acentos.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_catalog.py --skus 100000 500000 --queries 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.catalog import DEFAULT_FUZZY_BUDGET, CatalogIndex, compact_key, create_catalog, digit_tokens, trigrams  # noqa: E402
+
+BRANDS = ["Samsung", "Apple", "Xiaomi", "Lenovo", "Asus", "Acer", "HP", "Dell", "Logitech", "Razer",
+          "Sony", "LG", "Philips", "Corsair", "Keychron", "MSI", "Gigabyte", "Huawei", "Motorola", "JBL"]
+LINES = ["Galaxy", "iPhone", "Redmi", "ThinkPad", "ZenBook", "Aspire", "Pavilion", "XPS", "MX Master", "BlackWidow",
+         "Bravia", "UltraGear", "Hue", "Vengeance", "Mecánico", "Prestige", "Aorus", "MateBook", "Moto G", "Flip"]
+KINDS = ["smartphone", "portátil", "teclado", "ratón", "monitor", "auriculares", "altavoz", "tablet", "memoria", "televisor"]
+VARIANTS = ["Pro", "Max", "Lite", "Plus", "Ultra", "Mini", "SE", "Air", ""]
+COLORS = ["negro", "blanco", "azul", "rojo", "gris", "plata", "verde", ""]
+
+
+def synthetic_products(n, seed=42):
+    rng = random.Random(seed)
+    seen = set()
+    products = []
+    while len(products) < n:
+        words = [rng.choice(KINDS), rng.choice(BRANDS), rng.choice(LINES), str(rng.randint(1, 999)),
+                 rng.choice(VARIANTS), rng.choice(COLORS)]
+        name = " ".join(word for word in words if word)
+        if name.lower() in seen:
+            continue
+        seen.add(name.lower())
+        products.append((f"SKU-{len(products):07d}", name, words[0], rng.randint(0, 500)))
+    return products
+
+
+def perturb(name, rng):
+    """Variante de un nombre como la escribiria un usuario"""
+    words = name.split()
+    kind = rng.randrange(4)
+    if kind == 0:
+        return "".join(words[1:4]).lower()
+    if kind == 1 and len(words) > 3:
+        del words[rng.randrange(len(words))]
+        return " ".join(words)
+    if kind == 2:
+        chars = list(name)
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        return "".join(chars)
+    return name.upper().replace("Á", "A").replace("Ó", "O")
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6  # noqa: E731
+    return f"p50 {pick(0.50):8.1f}µs  p99 {pick(0.99):8.1f}µs  media {sum(samples) / len(samples) * 1e6:8.1f}µs"
+
+
+def timed_lookups(fn, queries):
+    samples, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(fn(query))
+        samples.append(time.perf_counter() - started)
+    return samples, results
+
+
+def linear_scan(index, query, threshold):
+    """Referencia sin indice: similitud de Dice contra todos los productos (con los mismos numeros)"""
+    key = compact_key(query)
+    grams = trigrams(key)
+    digits = digit_tokens(key)
+    best, best_score = None, -1.0
+    for product_id, key in enumerate(index.keys):
+        if digits and index.digits[product_id] != digits:
+            continue
+        other = trigrams(key)
+        score = 2.0 * len(grams & other) / (len(grams) + len(other))
+        # Mismo desempate que el indice: el nombre mas corto
+        if score > best_score or (score == best_score and len(key) < len(index.keys[best])):
+            best, best_score = product_id, score
+    return best if best_score >= threshold else None
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(n_skus, n_queries, scan_queries, threshold, budgets):
+    products = synthetic_products(n_skus)
+    rng = random.Random(7)
+    targets = [rng.randrange(n_skus) for _ in range(n_queries)]
+    exact_queries = [products[i][1] for i in targets]
+    fuzzy_queries = [perturb(products[i][1], rng) for i in targets]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'catalog.sqlite3')
+        create_catalog(path, products, [])
+        rss_before = max_rss_mb()
+        started = time.perf_counter()
+        index = CatalogIndex.load(path, fuzzy_threshold=threshold, fuzzy_budget=budgets[0])
+        load_seconds = time.perf_counter() - started
+        rss_growth = max_rss_mb() - rss_before
+
+    print(f"\n{n_skus} SKUs: carga {load_seconds:.2f}s, {len(index.postings)} trigramas, "
+          f"+{rss_growth:.0f} MB de RSS (maximo {max_rss_mb():.0f} MB)")
+
+    # Lo que hacian las acciones: diccionario con el nombre en minusculas
+    old_db = {name.lower(): stock for _, name, _, stock in products}
+    samples, found = timed_lookups(lambda q: old_db.get(q.lower()), fuzzy_queries)
+    print(f"  dict en minusculas (consultas aproximadas)  {percentiles(samples)}  "
+          f"encontrados {sum(r is not None for r in found) / n_queries:.1%}")
+
+    samples, found = timed_lookups(index.find_product, exact_queries)
+    print(f"  indice, nombre exacto                       {percentiles(samples)}  "
+          f"aciertos {sum(m is not None and m.sku == products[i][0] for m, i in zip(found, targets)) / n_queries:.1%}")
+
+    ideal = None
+    if scan_queries:
+        subset = fuzzy_queries[:scan_queries]
+        samples, ideal = timed_lookups(lambda q: linear_scan(index, q, threshold), subset)
+        print(f"  recorrido lineal ({len(subset)} consultas aprox.)  {percentiles(samples)}")
+
+    for budget in budgets:
+        index.fuzzy_budget = budget
+        samples, found = timed_lookups(index.find_product, fuzzy_queries)
+        hits = sum(m is not None and m.sku == products[i][0] for m, i in zip(found, targets))
+        answered = sum(m is not None for m in found)
+        line = (f"  indice, aproximadas (presupuesto {budget:>6})  {percentiles(samples)}  "
+                f"aciertos {hits / n_queries:.1%} (con respuesta {answered / n_queries:.1%}, "
+                f"correctas {hits / answered if answered else 0.0:.1%} de las respondidas)")
+        if ideal is not None:
+            agree = sum((m.sku if m else None) == (index.skus[i] if i is not None else None) for m, i in zip(found, ideal))
+            line += f", igual que el recorrido lineal {agree / len(ideal):.1%}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latencia del catalogo indexado con 100k+ SKUs")
+    parser.add_argument('--skus', type=int, nargs='+', default=[100000, 500000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--scan-queries', type=int, default=20, help="Consultas del recorrido lineal de referencia (0 lo omite)")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--budgets', type=int, nargs='+', default=[DEFAULT_FUZZY_BUDGET, 4 * DEFAULT_FUZZY_BUDGET],
+                        help="Valores de CATALOG_FUZZY_BUDGET a comparar")
+    args = parser.parse_args(argv)
+
+    for n_skus in args.skus:
+        run(n_skus, args.queries, args.scan_queries, args.threshold, args.budgets)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Latencia del detector de emergencias (src/emergency.py) por mensaje con la lista de
+data/emergency_terms.txt y con listas sinteticas de miles de terminos, frente a comprobar
+los terminos uno a uno y a una alternancia de expresiones regulares.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_emergency.py --terms 1000 5000 20000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.emergency import DEFAULT_TERMS_PATH, AhoCorasickMatcher, load_terms  # noqa: E402
+from src.nlu_data import iter_nlu_examples  # noqa: E402
+from src.text_normalization import clean_text  # noqa: E402
+
+SYLLABLES = ["ca", "me", "ti", "lo", "sa", "re", "do", "pu", "ne", "ga", "mo", "ri", "te", "bu", "la", "cho"]
+
+
+def synthetic_terms(n, seed=42):
+    """Frases de 1 a 4 palabras inventadas (no aparecen en los mensajes de data/nlu.yml)"""
+    rng = random.Random(seed)
+    word = lambda: "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + "x"  # noqa: E731
+    return [" ".join(word() for _ in range(rng.randint(1, 4))) for _ in range(n)]
+
+
+def naive_search(terms, text):
+    padded = f" {clean_text(text)} "
+    for term in terms:
+        if f" {term} " in padded:
+            return term
+    return None
+
+
+def regex_matcher(terms):
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + r')\b')
+    return lambda text: pattern.search(clean_text(text))
+
+
+def per_message_us(fn, messages, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for message in messages:
+            fn(message)
+        best = min(best, time.perf_counter() - started)
+    return best / len(messages) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latencia del detector de emergencias")
+    parser.add_argument('--intents', default='data/nlu.yml', help="Mensajes con los que se mide")
+    parser.add_argument('--terms', type=int, nargs='+', default=[1000, 5000, 20000], help="Tamanos de las listas sinteticas")
+    args = parser.parse_args(argv)
+
+    messages = [text for _, text in iter_nlu_examples(args.intents)]
+    base_terms = load_terms(DEFAULT_TERMS_PATH)
+    print(f"{len(messages)} mensajes de {args.intents}, longitud media {sum(map(len, messages)) / len(messages):.0f} caracteres")
+
+    print(f"{'terminos':>9} {'compilar':>10} {'aho-corasick':>13} {'regex':>10} {'uno a uno':>10}  detectados")
+    for extra in [0] + args.terms:
+        terms = base_terms + synthetic_terms(extra)
+        started = time.perf_counter()
+        matcher = AhoCorasickMatcher(terms)
+        build_ms = (time.perf_counter() - started) * 1000
+        plain = [clean_text(term.rstrip('*')) for term in terms]
+        regex = regex_matcher(plain)
+
+        detected = sum(matcher.search(message) is not None for message in messages)
+        ac_us = per_message_us(matcher.search, messages)
+        regex_us = per_message_us(regex, messages)
+        naive_us = per_message_us(lambda message: naive_search(plain, message), messages)
+        print(f"{len(terms):>9} {build_ms:>8.1f}ms {ac_us:>11.1f}µs {regex_us:>8.1f}µs {naive_us:>8.1f}µs  {detected}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
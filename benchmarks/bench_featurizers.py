@@ -0,0 +1,157 @@
+"""
+Comparacion de featurizadores de IntentVectorizer: TF-IDF frente a hashing (con y sin
+n-gramas de caracteres).
+
+- Precision: validacion cruzada estratificada con el SVC del entrenador sobre el corpus NLU.
+- Memoria y rendimiento: corpus sinteticos crecientes (vocabulario con distribucion de Zipf);
+  cada medida se hace en un proceso nuevo para que el pico de RSS sea comparable.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_featurizers.py --intents data/nlu.yml --sizes 10000 100000 500000
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import resource
+import warnings
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.preprocessing import IntentVectorizer  # noqa: E402
+
+FEATURIZERS = {
+    'tfidf': {'featurizer': 'tfidf'},
+    'hashing': {'featurizer': 'hashing', 'char_ngrams': False},
+    'hashing+char': {'featurizer': 'hashing', 'char_ngrams': True},
+}
+
+
+def build_vectorizer(name):
+    return IntentVectorizer(n_jobs=1, **FEATURIZERS[name])
+
+
+def cross_validate(intents_path, folds):
+    """Precision media por featurizador con el mismo preprocesado y el mismo clasificador"""
+    from sklearn.model_selection import StratifiedKFold
+    from sklearn.svm import SVC
+    from src.training import ChatbotTrainer
+
+    trainer = ChatbotTrainer()
+    trainer.load_intents(intents_path)
+    patterns, y = trainer.prepare_training_data()
+    y = np.asarray(y)
+    texts = trainer.vectorizer.preprocess(patterns)
+    folds = min(folds, int(np.bincount(y).min()))
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+
+    results = {}
+    for name in FEATURIZERS:
+        accuracies = []
+        for train_idx, test_idx in splitter.split(np.zeros(len(y)), y):
+            featurizer = build_vectorizer(name).vectorizer
+            X_train = featurizer.fit_transform([texts[i] for i in train_idx])
+            classifier = SVC(kernel='linear', random_state=42).fit(X_train, y[train_idx])
+            predicted = classifier.predict(featurizer.transform([texts[i] for i in test_idx]))
+            accuracies.append(float(np.mean(predicted == y[test_idx])))
+        results[name] = {'accuracy': float(np.mean(accuracies)), 'accuracy_std': float(np.std(accuracies))}
+    return results, folds
+
+
+def synthetic_corpus(n_docs, vocabulary_size=200000, words_per_doc=8, seed=42):
+    """Textos ya preprocesados con frecuencias de Zipf: el vocabulario visto crece con el corpus"""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.3, size=n_docs * words_per_doc), vocabulary_size) - 1
+    words = [f"w{rank:x}" for rank in range(vocabulary_size)]
+    tokens = [words[rank] for rank in ranks]
+    return [" ".join(tokens[i:i + words_per_doc]) for i in range(0, len(tokens), words_per_doc)]
+
+
+def max_rss_mb():
+    # ru_maxrss esta en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(name, n_docs, transform_docs):
+    """Se ejecuta en un proceso aparte: ajuste, memoria del estado y mensajes/s de transform"""
+    corpus = synthetic_corpus(n_docs)
+    messages = corpus[:transform_docs]
+    rss_before = max_rss_mb()
+
+    vectorizer = build_vectorizer(name).vectorizer
+    started = time.perf_counter()
+    vectorizer.fit_transform(corpus)
+    fit_seconds = time.perf_counter() - started
+    del corpus
+    rss_after = max_rss_mb()
+    # stop_words_ (terminos descartados por max_features) no se usa al transformar
+    if hasattr(vectorizer, 'stop_words_'):
+        del vectorizer.stop_words_
+
+    started = time.perf_counter()
+    for message in messages:
+        vectorizer.transform([message])
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorizer.transform(messages)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        'featurizer': name,
+        'docs': n_docs,
+        'fit_seconds': fit_seconds,
+        'fit_rss_mb': rss_after - rss_before,
+        'state_kb': len(pickle.dumps(vectorizer)) / 1024,
+        'single_msgs_per_s': len(messages) / single_seconds,
+        'batch_msgs_per_s': len(messages) / batch_seconds,
+    }
+
+
+def run_isolated(name, n_docs, transform_docs):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', name, str(n_docs), str(transform_docs)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TF-IDF frente a hashing: precision, memoria y rendimiento")
+    parser.add_argument('--intents', default='data/nlu.yml')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000], help="Documentos de los corpus sinteticos")
+    parser.add_argument('--transform-docs', type=int, default=2000, help="Mensajes con los que se mide transform")
+    parser.add_argument('--skip-accuracy', action='store_true')
+    parser.add_argument('--worker', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        name, n_docs, transform_docs = args.worker
+        print(json.dumps(measure(name, int(n_docs), int(transform_docs))))
+        return 0
+
+    warnings.simplefilter('ignore', FutureWarning)
+    if not args.skip_accuracy:
+        accuracy, folds = cross_validate(args.intents, args.folds)
+        print(f"Precision ({folds} folds, {args.intents}):")
+        for name, row in accuracy.items():
+            print(f"  {name:<13} {row['accuracy']:.4f} ± {row['accuracy_std']:.4f}")
+        print()
+
+    print(f"{'featurizador':<13} {'docs':>8} {'ajuste':>8} {'RSS ajuste':>11} {'estado':>11} {'msg/s (1 a 1)':>14} {'msg/s (lote)':>13}")
+    for n_docs in args.sizes:
+        for name in FEATURIZERS:
+            row = run_isolated(name, n_docs, args.transform_docs)
+            print(f"{name:<13} {n_docs:>8} {row['fit_seconds']:7.2f}s {row['fit_rss_mb']:9.1f}MB "
+                  f"{row['state_kb']:9.1f}KB {row['single_msgs_per_s']:14.0f} {row['batch_msgs_per_s']:13.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Paridad y microbenchmark: SVC(kernel='linear', probability=True).predict_proba de sklearn
+frente a LinearSVCModel (src/linear_model.py).
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_linear_scoring.py --classes 21 --features 1000 --batch 1000
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.svm import SVC
+from sklearn.preprocessing import normalize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.linear_model import LinearSVCModel  # noqa: E402
+
+
+def synthetic_tfidf(n_rows, n_features, n_classes, terms_per_row, rng):
+    """Matriz dispersa tipo TF-IDF (filas normalizadas L2) con terminos caracteristicos por clase"""
+    labels = rng.integers(0, n_classes, size=n_rows)
+    class_terms = rng.integers(0, n_features, size=(n_classes, terms_per_row))
+    rows, cols = [], []
+    for row, label in enumerate(labels):
+        own = rng.choice(class_terms[label], size=terms_per_row // 2, replace=False)
+        noise = rng.integers(0, n_features, size=terms_per_row - len(own))
+        terms = np.unique(np.concatenate([own, noise]))
+        rows.extend([row] * len(terms))
+        cols.extend(terms)
+    data = rng.random(len(rows)) + 0.1
+    X = sp.csr_matrix((data, (rows, cols)), shape=(n_rows, n_features))
+    X.sum_duplicates()
+    return normalize(X), labels
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=21)
+    parser.add_argument('--features', type=int, default=1000)
+    parser.add_argument('--train-rows', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--terms', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X_train, y_train = synthetic_tfidf(args.train_rows, args.features, args.classes, args.terms, rng)
+    X_batch, _ = synthetic_tfidf(args.batch, args.features, args.classes, args.terms, rng)
+
+    with warnings.catch_warnings():
+        # sklearn >= 1.9 avisa de que probability=True esta obsoleto; es el modelo que usa el trainer
+        warnings.simplefilter('ignore', FutureWarning)
+        svc = SVC(kernel='linear', probability=True, random_state=42).fit(X_train, y_train)
+        engine = LinearSVCModel.from_svc(svc)
+
+    print(f"{args.classes} clases, {args.features} terminos, lote de {args.batch} mensajes")
+
+    # Paridad
+    expected = svc.predict_proba(X_batch)
+    got = engine.predict_proba(X_batch)
+    max_diff = float(np.abs(expected - got).max())
+    same_top1 = float((expected.argmax(axis=1) == got.argmax(axis=1)).mean())
+    print(f"Paridad: diferencia maxima {max_diff:.2e}, top-1 coincidente {same_top1:.2%}")
+    if max_diff > args.tolerance:
+        print(f"ERROR: diferencia por encima de la tolerancia {args.tolerance:g}")
+        sys.exit(1)
+
+    # Rendimiento
+    single = X_batch[:1]
+    results = [
+        ("sklearn, 1 mensaje", timed(lambda: svc.predict_proba(single), args.repeat), 1),
+        ("numpy,   1 mensaje", timed(lambda: engine.predict_proba(single), args.repeat), 1),
+        ("sklearn, mensaje a mensaje", timed(lambda: [svc.predict_proba(X_batch[i]) for i in range(args.batch)], 1), args.batch),
+        ("sklearn, lote", timed(lambda: svc.predict_proba(X_batch), args.repeat), args.batch),
+        ("numpy,   lote", timed(lambda: engine.predict_proba(X_batch), args.repeat), args.batch),
+        ("numpy,   lote top-3", timed(lambda: engine.top_k(X_batch, 3), args.repeat), args.batch),
+    ]
+    for name, seconds, n in results:
+        print(f"{name:<28} {seconds * 1000:10.2f} ms  {n / seconds:12.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
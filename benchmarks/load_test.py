@@ -0,0 +1,315 @@
+"""
+Prueba de carga de extremo a extremo del gateway (/webhook) sin RASA ni cuota de Gemini.
+
+Arranca los stubs de benchmarks/stub_servers.py, lanza el gateway apuntando a ellos
+(RASA_API_URL, GEMINI_API_ENDPOINT y una clave ficticia) y envia peticiones a /webhook a un
+ritmo fijo en cada modo NLU. La carga es de lazo abierto: las peticiones salen a su hora
+aunque el gateway se retrase, y la latencia se mide desde la hora prevista, de modo que las
+colas del gateway cuentan en los percentiles.
+
+Cada respuesta se clasifica como:
+- ok: 200 con la respuesta del stub de RASA (en modo gemini, con la intencion inyectada).
+- fallback: solo en modo gemini; Gemini fallo y el gateway uso el NLU de RASA.
+- error: estado HTTP distinto de 200, timeout, o respuesta de error del propio gateway.
+
+Uso (desde la raiz del repo):
+    python benchmarks/load_test.py --modes rasa gemini --rate 50 --duration 30 \\
+        --rasa-latency lognormal:30,0.5 --gemini-latency lognormal:400,0.4 --gemini-error-rate 0.02 \\
+        --output load_test.json --baseline load_test_anterior.json
+
+La configuracion del gateway se puede ajustar con --env CLAVE=VALOR (p. ej.
+--env NLU_BATCH_ENABLED=1). Por defecto se desactiva la cache de NLU (NLU_CACHE_BACKEND=none)
+para medir siempre la llamada a Gemini.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.stub_servers import GeminiStub, RasaStub  # noqa: E402
+from src.nlu_data import iter_nlu_examples  # noqa: E402
+
+# Comandos para lanzar el gateway en el puerto {port}
+GATEWAY_COMMANDS = {
+    'flask': [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}', '--no-reload', '--no-debugger'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', '127.0.0.1:{port}', '--workers', '{workers}', '--threads', '8'],
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', '{port}', '--workers', '{workers}', '--log-level', 'warning'],
+}
+
+GATEWAY_START_TIMEOUT = 60.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_gateway(server, port, workers, env_overrides, log_path):
+    """Lanza el gateway en un subproceso y espera a que responda en /"""
+    command = [part.format(port=port, workers=workers) for part in GATEWAY_COMMANDS[server]]
+    env = dict(os.environ, **env_overrides)
+    log = open(log_path, 'w', encoding='utf-8')
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + GATEWAY_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El gateway termino al arrancar (codigo {process.returncode}); revisa {log_path}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1.0)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"El gateway no respondio en {GATEWAY_START_TIMEOUT}s; revisa {log_path}")
+
+
+def stop_gateway(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def classify(response, mode):
+    """'ok', 'fallback' o 'error' segun la respuesta del gateway"""
+    if response.status_code != 200:
+        return 'error'
+    try:
+        messages = response.json()
+    except ValueError:
+        return 'error'
+    stub_replies = [m for m in messages if isinstance(m, dict) and (m.get('custom') or {}).get('stub') == 'rasa']
+    if not stub_replies:
+        return 'error'
+    if mode != 'rasa' and stub_replies[0]['custom']['nlu'] != 'gemini':
+        return 'fallback'
+    return 'ok'
+
+
+def run_scenario(url, mode, messages, rate, duration, concurrency, timeout):
+    """Envia rate*duration peticiones a ritmo constante y devuelve (latencias, resultados, segundos)"""
+    local = threading.local()
+    total = max(1, int(rate * duration))
+    interval = 1.0 / rate
+
+    def send(index, scheduled):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        payload = {
+            'sender': f"load-{mode}-{index}",
+            'message': messages[index % len(messages)],
+            'metadata': {'nlu_mode': mode},
+        }
+        try:
+            outcome = classify(session.post(url, json=payload, timeout=timeout), mode)
+        except requests.RequestException:
+            outcome = 'error'
+        return time.perf_counter() - scheduled, outcome
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        futures = []
+        for index in range(total):
+            scheduled = started + index * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(send, index, scheduled))
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    outcomes = [outcome for _, outcome in results]
+    return latencies, outcomes, elapsed
+
+
+def summarize(mode, rate, latencies, outcomes, elapsed, stubs):
+    total = len(outcomes)
+    counts = {outcome: outcomes.count(outcome) for outcome in ('ok', 'fallback', 'error')}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'mode': mode,
+        'target_rps': rate,
+        'requests': total,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round((total - counts['error']) / elapsed, 2),
+        'error_rate': counts['error'] / total,
+        'fallback_rate': counts['fallback'] / total,
+        'outcomes': counts,
+        'latency_ms': {
+            'p50': round(float(p50), 2),
+            'p95': round(float(p95), 2),
+            'p99': round(float(p99), 2),
+            'mean': round(float(latencies.mean()), 2),
+            'max': round(float(latencies.max()), 2),
+        },
+        'stubs': {stub.name: stub.stats() for stub in stubs},
+    }
+
+
+def print_scenario(row):
+    latency = row['latency_ms']
+    print(f"  {row['mode']:<7} {row['requests']:>6} peticiones en {row['seconds']:.1f}s  {row['throughput_rps']:8.1f} req/s  "
+          f"p50 {latency['p50']:8.1f}ms  p95 {latency['p95']:8.1f}ms  p99 {latency['p99']:8.1f}ms  "
+          f"errores {row['error_rate']:.2%}  fallback {row['fallback_rate']:.2%}")
+
+
+def compare(results, baseline_path):
+    """Diferencias por modo frente a un fichero de resultados anterior"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {row['mode']: row for row in baseline['scenarios']}
+    print(f"\nComparacion con {baseline_path} (commit {baseline.get('commit')}):")
+    for row in results['scenarios']:
+        old = previous.get(row['mode'])
+        if old is None:
+            continue
+        deltas = []
+        for key in ('p50', 'p95', 'p99'):
+            before, after = old['latency_ms'][key], row['latency_ms'][key]
+            change = (after - before) / before if before else 0.0
+            deltas.append(f"{key} {before:.1f}->{after:.1f}ms ({change:+.1%})")
+        deltas.append(f"req/s {old['throughput_rps']:.1f}->{row['throughput_rps']:.1f}")
+        deltas.append(f"errores {old['error_rate']:.2%}->{row['error_rate']:.2%}")
+        print(f"  {row['mode']:<7} " + "  ".join(deltas))
+
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, separator, value = pair.partition('=')
+        if not separator:
+            raise argparse.ArgumentTypeError(f"--env espera CLAVE=VALOR: '{pair}'")
+        env[key] = value
+    return env
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del gateway con stubs de RASA y Gemini")
+    parser.add_argument('--modes', nargs='+', choices=['rasa', 'gemini', 'hybrid'], default=['rasa', 'gemini'])
+    parser.add_argument('--rate', type=float, default=20.0, help="Peticiones por segundo")
+    parser.add_argument('--duration', type=float, default=30.0, help="Segundos por modo")
+    parser.add_argument('--warmup', type=int, default=20, help="Peticiones de calentamiento por modo (no se miden)")
+    parser.add_argument('--concurrency', type=int, default=64, help="Peticiones en vuelo como maximo")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--server', choices=sorted(GATEWAY_COMMANDS), default='flask')
+    parser.add_argument('--workers', type=int, default=1, help="Workers de gunicorn/uvicorn")
+    parser.add_argument('--gateway-url', help="Usar un gateway ya arrancado (debe apuntar a los stubs por su cuenta)")
+    parser.add_argument('--env', action='append', default=[], help="Variable de entorno extra para el gateway (CLAVE=VALOR)")
+    parser.add_argument('--rasa-port', type=int, default=0)
+    parser.add_argument('--rasa-latency', default='lognormal:30,0.5')
+    parser.add_argument('--rasa-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-port', type=int, default=0)
+    parser.add_argument('--gemini-latency', default='lognormal:400,0.4')
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-invalid-rate', type=float, default=0.0)
+    parser.add_argument('--messages', default='data/nlu.yml', help="Corpus NLU del que salen los mensajes")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--baseline', help="Resultados anteriores con los que comparar")
+    args = parser.parse_args(argv)
+
+    if args.server == 'uvicorn' and 'gemini' in args.modes and not args.gateway_url:
+        # google-generativeai no admite generate_content_async con el transporte REST del stub
+        parser.error("El modo gemini con --server uvicorn no puede usar el stub de Gemini; usa flask o gunicorn")
+
+    messages_path = os.path.join(REPO_ROOT, args.messages)
+    messages = [text for _, text in iter_nlu_examples(messages_path)]
+    np.random.default_rng(args.seed).shuffle(messages)
+
+    rasa = RasaStub(port=args.rasa_port, latency=args.rasa_latency, error_rate=args.rasa_error_rate, seed=args.seed).start()
+    gemini = GeminiStub(messages_path, args.gemini_invalid_rate, port=args.gemini_port, latency=args.gemini_latency,
+                        error_rate=args.gemini_error_rate, seed=args.seed).start()
+    stubs = [rasa, gemini]
+    print(f"Stub de RASA en {rasa.url} ({args.rasa_latency}, errores {args.rasa_error_rate:.1%})")
+    print(f"Stub de Gemini en {gemini.url} ({args.gemini_latency}, errores {args.gemini_error_rate:.1%})")
+
+    gateway_env = {'NLU_CACHE_BACKEND': 'none'}
+    gateway_env.update(parse_env(args.env))
+    gateway_env.update({
+        'RASA_API_URL': f"{rasa.url}/webhooks/rest/webhook",
+        'GEMINI_API_ENDPOINT': gemini.url,
+        # Clave ficticia: nunca se usa la de .env (load_dotenv no sobrescribe el entorno)
+        'GEMINI_API_KEY': 'stub-key',
+    })
+
+    process = None
+    if args.gateway_url:
+        url = args.gateway_url.rstrip('/') + '/webhook'
+    else:
+        port = free_port()
+        log_path = os.path.join(tempfile.gettempdir(), f'load_test_gateway_{port}.log')
+        process = start_gateway(args.server, port, args.workers, gateway_env, log_path)
+        url = f"http://127.0.0.1:{port}/webhook"
+        print(f"Gateway ({args.server}) en http://127.0.0.1:{port} (log en {log_path})")
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {
+            'server': 'external' if args.gateway_url else args.server,
+            'workers': args.workers,
+            'rate': args.rate,
+            'duration': args.duration,
+            'concurrency': args.concurrency,
+            'rasa': {'latency': args.rasa_latency, 'error_rate': args.rasa_error_rate},
+            'gemini': {'latency': args.gemini_latency, 'error_rate': args.gemini_error_rate, 'invalid_rate': args.gemini_invalid_rate},
+            'gateway_env': {key: value for key, value in gateway_env.items() if key != 'GEMINI_API_KEY'},
+        },
+        'scenarios': [],
+    }
+
+    try:
+        print(f"\n{args.rate:g} req/s durante {args.duration:g}s por modo:")
+        for mode in args.modes:
+            if args.warmup:
+                run_scenario(url, mode, messages, args.rate, args.warmup / args.rate, args.concurrency, args.timeout)
+            for stub in stubs:
+                stub.reset_stats()
+            latencies, outcomes, elapsed = run_scenario(url, mode, messages, args.rate, args.duration, args.concurrency, args.timeout)
+            row = summarize(mode, args.rate, latencies, outcomes, elapsed, stubs)
+            results['scenarios'].append(row)
+            print_scenario(row)
+    finally:
+        if process is not None:
+            stop_gateway(process)
+        for stub in stubs:
+            stub.stop()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Servidores simulados para pruebas de carga del gateway sin RASA ni cuota de Gemini:
+
+- RASA: POST /webhooks/rest/webhook. Responde un mensaje marcado con custom.stub = 'rasa' e
+  indica si el mensaje llego ya clasificado por Gemini ('/intent...') o como texto libre.
+- Gemini: POST /v1beta/models/<modelo>:generateContent (API REST de google-generativeai).
+  Devuelve el JSON de NLU que pide el prompt (individual o por lotes) con la intencion del
+  ejemplo en data/nlu.yml, o 'nlu_fallback' si el texto no esta en el corpus.
+
+Cada stub tiene una distribucion de latencia y una tasa de error configurables. GET /stats
+devuelve los contadores. Uso independiente:
+    python benchmarks/stub_servers.py rasa --port 5005 --latency lognormal:30,0.5 --error-rate 0.01
+    python benchmarks/stub_servers.py gemini --port 8089 --latency lognormal:400,0.4
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.nlu_data import iter_nlu_examples  # noqa: E402
+
+SINGLE_PROMPT_PATTERN = re.compile(r'Texto del usuario: "(.*)"\s*JSON:\s*$', re.DOTALL)
+BATCH_LINE_PATTERN = re.compile(r'^(\d+)\. (".*")$', re.MULTILINE)
+
+
+class LatencyDistribution:
+    """
+    Latencia simulada en milisegundos a partir de una especificacion de texto:
+    'fixed:MS', 'uniform:MIN,MAX', 'normal:MEDIA,DESV' o 'lognormal:MEDIANA,SIGMA'.
+    """
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    def __init__(self, spec='fixed:0', seed=None):
+        kind, _, args = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError(f"Distribucion de latencia desconocida: '{spec}' (usa {', '.join(self.KINDS)})")
+        self.spec = spec
+        self.kind = kind
+        self.args = [float(value) for value in args.split(',')] if args else [0.0]
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == 'fixed':
+                ms = self.args[0]
+            elif self.kind == 'uniform':
+                ms = self.rng.uniform(self.args[0], self.args[1])
+            elif self.kind == 'normal':
+                ms = self.rng.gauss(self.args[0], self.args[1])
+            else:
+                ms = self.args[0] * self.rng.lognormvariate(0.0, self.args[1])
+        return max(ms, 0.0) / 1000.0
+
+
+class StubServer:
+    """Servidor HTTP con hilos que simula un servicio externo con latencia y errores"""
+
+    name = 'stub'
+    error_status = 500
+
+    def __init__(self, port=0, latency='fixed:0', error_rate=0.0, seed=None, host='127.0.0.1'):
+        self.latency = LatencyDistribution(latency, seed)
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path.rstrip('/') == '/stats':
+                    return self.send_json(200, stub.stats())
+                self.send_json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, payload = stub.handle(self.path, body)
+                self.send_json(status, payload)
+
+            def send_json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"{self.name}-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+
+    def stats(self):
+        return {
+            'stub': self.name,
+            'latency': self.latency.spec,
+            'error_rate': self.error_rate,
+            'requests': self.requests,
+            'errors': self.errors,
+        }
+
+    def handle(self, path, body):
+        """Simula la latencia, decide si falla y delega la respuesta en respond()"""
+        time.sleep(self.latency.sample())
+        with self._lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            return self.error_status, {'error': {'code': self.error_status, 'message': 'error simulado'}}
+        try:
+            return self.respond(path, json.loads(body or b'{}'))
+        except (ValueError, KeyError) as e:
+            return 400, {'error': {'code': 400, 'message': str(e)}}
+
+    def respond(self, path, payload):
+        raise NotImplementedError
+
+
+class RasaStub(StubServer):
+    """Sustituto de /webhooks/rest/webhook de RASA"""
+
+    name = 'rasa'
+
+    def respond(self, path, payload):
+        if not path.startswith('/webhooks/rest/webhook'):
+            return 404, {'error': 'not found'}
+        message = payload['message']
+        return 200, [{
+            'recipient_id': payload.get('sender', 'user'),
+            'text': f"stub: {message}",
+            'custom': {'stub': 'rasa', 'nlu': 'gemini' if message.startswith('/') else 'rasa'},
+        }]
+
+
+class GeminiStub(StubServer):
+    """Sustituto de generateContent de la API REST de Gemini (errores como 503 de la API)"""
+
+    name = 'gemini'
+    error_status = 503
+
+    def __init__(self, nlu_path=None, invalid_rate=0.0, **kwargs):
+        super().__init__(**kwargs)
+        # Proporcion de respuestas 200 con texto que no es JSON (fuerza reintentos de parseo)
+        self.invalid_rate = invalid_rate
+        self.intents = {}
+        if nlu_path:
+            for intent, text in iter_nlu_examples(nlu_path):
+                self.intents.setdefault(text, intent)
+
+    def nlu(self, text):
+        return {'intent': self.intents.get(text, 'nlu_fallback'), 'entities': []}
+
+    def respond(self, path, payload):
+        if ':generateContent' not in path:
+            return 404, {'error': {'code': 404, 'message': 'not found'}}
+        prompt = "".join(part.get('text', '') for content in payload['contents'] for part in content['parts'])
+
+        if self.rng.random() < self.invalid_rate:
+            text = "Lo siento, no puedo ayudar con eso."
+        elif 'Textos:' in prompt:
+            numbered = prompt.rsplit('Textos:', 1)[1]
+            text = json.dumps([
+                dict(self.nlu(json.loads(message)), id=int(index))
+                for index, message in BATCH_LINE_PATTERN.findall(numbered)
+            ], ensure_ascii=False)
+        else:
+            match = SINGLE_PROMPT_PATTERN.search(prompt)
+            text = json.dumps(self.nlu(match.group(1) if match else prompt), ensure_ascii=False)
+
+        return 200, {
+            'candidates': [{
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub de RASA o de Gemini para pruebas de carga")
+    parser.add_argument('service', choices=['rasa', 'gemini'])
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', default='fixed:0', help="fixed:MS, uniform:MIN,MAX, normal:MEDIA,DESV o lognormal:MEDIANA,SIGMA")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help="Solo Gemini: respuestas que no son JSON")
+    parser.add_argument('--nlu', default='data/nlu.yml', help="Solo Gemini: corpus con la intencion de cada ejemplo")
+    args = parser.parse_args(argv)
+
+    if args.service == 'rasa':
+        stub = RasaStub(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    else:
+        stub = GeminiStub(args.nlu, args.invalid_rate, port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"Stub de {args.service} escuchando en {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Control de admision del gateway para el trafico que usa Gemini (modos 'gemini' e 'hybrid').
+
+- Limite por sender: token bucket de ADMISSION_SENDER_RATE mensajes/s con rafagas de hasta
+  ADMISSION_SENDER_BURST. Un sender sin tokens no llega a Gemini: su mensaje se procesa con
+  el NLU de RASA.
+- Limite global de llamadas a Gemini en vuelo (ADMISSION_GEMINI_CONCURRENCY). Las que no caben
+  esperan en una cola acotada (ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT segundos)
+  ordenada por la prioridad del dominio de la conversacion (ADMISSION_PRIORITIES, emergencias y
+  salud primero) y despues por orden de llegada. Con la cola llena se descarta la espera de
+  menor prioridad, o la recien llegada si no mejora a ninguna. Lo descartado tambien se
+  degrada al NLU de RASA en lugar de fallar.
+
+Al liberar un hueco se entrega directamente a la mejor espera, asi que una peticion nueva no
+puede colarse delante de la cola. Las esperas funcionan con hilos (Flask) y con el event loop
+(Quart): cada una lleva su propia forma de despertarse.
+
+Ambos limites se aplican justo antes de llamar a Gemini: los mensajes resueltos por la cache
+o por el clasificador local del modo 'hybrid' no gastan tokens ni ocupan huecos. El dominio de
+cada sender se deduce de sus intenciones anteriores, porque el del mensaje actual no se conoce
+hasta despues del NLU.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITIES = ('emergencia', 'salud', 'banca', 'ecommerce', 'general')
+
+DOMAIN_BY_INTENT = {
+    'contacto_emergencia': 'emergencia',
+    'agendar_cita': 'salud', 'consultar_sintoma': 'salud', 'informacion_medicamento': 'salud',
+    'consultar_saldo': 'banca', 'realizar_transferencia': 'banca', 'bloquear_tarjeta': 'banca',
+    'asesor_financiero': 'banca',
+    'consultar_producto': 'ecommerce', 'verificar_stock': 'ecommerce', 'estado_pedido': 'ecommerce',
+    'recomendar_producto': 'ecommerce', 'finalizar_compra': 'ecommerce', 'pagar_pedido': 'ecommerce',
+}
+
+# Motivos de descarte (tambien son las claves de stats()['shed'])
+RATE_LIMITED = 'rate_limited'
+QUEUE_FULL = 'queue_full'
+EVICTED = 'evicted'
+TIMEOUT = 'timeout'
+SHED_REASONS = (RATE_LIMITED, QUEUE_FULL, EVICTED, TIMEOUT)
+
+_WAITING, _GRANTED, _SHED = 'waiting', 'granted', 'shed'
+
+
+def normalize_domain(value):
+    """'E-commerce' -> 'ecommerce'"""
+    return str(value).strip().lower().replace('-', '') if value else None
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class SenderRateLimiter:
+    """Token bucket por sender; se recuerdan como mucho max_senders (los menos recientes se olvidan)"""
+
+    def __init__(self, rate, burst, max_senders=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_senders = max_senders
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, sender_id, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(sender_id)
+            if bucket is None:
+                bucket = self._buckets[sender_id] = _Bucket(self.burst, now)
+                if len(self._buckets) > self.max_senders:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(sender_id)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True
+            return False
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SenderDomains:
+    """Ultimo dominio de cada sender segun sus resultados de NLU (como mucho max_senders, LRU)"""
+
+    def __init__(self, domain_by_intent=DOMAIN_BY_INTENT, max_senders=10000):
+        self.domain_by_intent = domain_by_intent
+        self.max_senders = max_senders
+        self._domains = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sender_id, default='general'):
+        with self._lock:
+            return self._domains.get(sender_id, default)
+
+    def remember(self, sender_id, nlu_data):
+        """Actualiza el dominio del sender con la intencion o, en switch_domain, la entidad dominio"""
+        if not nlu_data:
+            return
+        domain = self.domain_by_intent.get(nlu_data.get('intent'))
+        if nlu_data.get('intent') == 'switch_domain':
+            for entity in nlu_data.get('entities') or []:
+                if entity.get('entity') == 'dominio':
+                    domain = normalize_domain(entity.get('value'))
+        if not domain:
+            return
+        with self._lock:
+            self._domains[sender_id] = domain
+            self._domains.move_to_end(sender_id)
+            if len(self._domains) > self.max_senders:
+                self._domains.popitem(last=False)
+
+    def __len__(self):
+        return len(self._domains)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'wake', 'state', 'reason', 'enqueued')
+
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.state = _WAITING
+        self.reason = None
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class PriorityGate:
+    """
+    Semaforo de capacidad fija con cola de espera acotada por prioridad (menor valor = antes).
+    acquire()/acquire_async() devuelven None si se obtiene un hueco (liberarlo con release())
+    o el motivo del descarte.
+    """
+
+    def __init__(self, capacity, queue_size, timeout):
+        self.capacity = capacity
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = dict.fromkeys(SHED_REASONS[1:], 0)
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self):
+        return len(self._heap)
+
+    def _enter(self, priority, wake):
+        """Hueco inmediato (None), espera encolada (_Waiter) o motivo de descarte (str)"""
+        evicted = None
+        with self._lock:
+            if self.in_flight < self.capacity and not self._heap:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self._heap) >= self.queue_size:
+                worst = max(self._heap) if self._heap else None
+                if worst is None or worst.priority <= priority:
+                    self.shed[QUEUE_FULL] += 1
+                    return QUEUE_FULL
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self._finish(worst, _SHED, EVICTED)
+                evicted = worst
+            self._seq += 1
+            waiter = _Waiter(priority, self._seq, wake)
+            heapq.heappush(self._heap, waiter)
+            self.max_depth = max(self.max_depth, len(self._heap))
+        if evicted is not None:
+            evicted.wake()
+        return waiter
+
+    def _finish(self, waiter, state, reason=None):
+        """Cierra una espera (con el lock tomado)"""
+        waiter.state = state
+        waiter.reason = reason
+        wait = time.monotonic() - waiter.enqueued
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if state == _GRANTED:
+            self.admitted += 1
+            self.queued += 1
+        else:
+            self.shed[reason] += 1
+
+    def _abandon(self, waiter, reason):
+        """Saca de la cola una espera que se rinde; devuelve su estado final"""
+        with self._lock:
+            if waiter.state == _WAITING:
+                self._heap.remove(waiter)
+                heapq.heapify(self._heap)
+                self._finish(waiter, _SHED, reason)
+            return waiter.state
+
+    def acquire(self, priority):
+        event = threading.Event()
+        entered = self._enter(priority, event.set)
+        if not isinstance(entered, _Waiter):
+            return entered
+        event.wait(self.timeout)
+        # Si el hueco llega justo al vencer el plazo, _abandon ve el estado ya concedido
+        self._abandon(entered, TIMEOUT)
+        return entered.reason
+
+    async def acquire_async(self, priority):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def set_done():
+            if not future.done():
+                future.set_result(None)
+
+        entered = self._enter(priority, lambda: loop.call_soon_threadsafe(set_done))
+        if not isinstance(entered, _Waiter):
+            return entered
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._abandon(entered, TIMEOUT) == _GRANTED:
+                self.release()
+            raise
+        self._abandon(entered, TIMEOUT)
+        return entered.reason
+
+    def try_acquire(self):
+        """
+        Hueco sin esperar y sin adelantar a nadie: solo si hay uno libre y la cola esta vacia.
+        Para trabajo prescindible (la generacion especulativa); liberarlo con release().
+        """
+        with self._lock:
+            if self.in_flight < self.capacity and not self._heap:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            return False
+
+    def hold(self, future):
+        """
+        Mantiene ocupado un hueco hasta que termine future: una llamada que quien la admitio ya
+        no espera (intento abandonado por plazo o hedge perdedor) sigue gastando cuota.
+        """
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(lambda _: self.release())
+
+    def release(self):
+        with self._lock:
+            if self._heap and self.in_flight <= self.capacity:
+                # El hueco pasa a la mejor espera sin bajar in_flight
+                waiter = heapq.heappop(self._heap)
+                self._finish(waiter, _GRANTED)
+            else:
+                self.in_flight -= 1
+                return
+        waiter.wake()
+
+    def stats(self):
+        with self._lock:
+            waits = self.queued + sum(self.shed[reason] for reason in (EVICTED, TIMEOUT))
+            return {
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'queue_depth': len(self._heap),
+                'max_queue_depth': self.max_depth,
+                'queue_size': self.queue_size,
+                'admitted': self.admitted,
+                'admitted_after_wait': self.queued,
+                'avg_wait': (self.total_wait / waits) if waits else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+
+class AdmissionController:
+    """Limite por sender, cola con prioridad hacia Gemini y dominio conocido de cada sender"""
+
+    def __init__(self, sender_rate=1.0, sender_burst=5, gemini_concurrency=8, queue_size=32,
+                 queue_timeout=2.0, priorities=DEFAULT_PRIORITIES, max_senders=10000):
+        self.limiter = SenderRateLimiter(sender_rate, sender_burst, max_senders) if sender_rate > 0 else None
+        self.gate = PriorityGate(gemini_concurrency, queue_size, queue_timeout)
+        self.priorities = {domain: i for i, domain in enumerate(priorities)}
+        self.default_priority = self.priorities.get('general', len(self.priorities))
+        self.domains = SenderDomains(max_senders=max_senders)
+        self.rate_limited = 0
+
+    @classmethod
+    def from_env(cls):
+        """Controlador configurado con ADMISSION_*; None si ADMISSION_ENABLED=0"""
+        if os.getenv('ADMISSION_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+            return None
+        priorities = [d for d in (normalize_domain(p) for p in os.getenv('ADMISSION_PRIORITIES', '').split(',')) if d]
+        return cls(
+            sender_rate=float(os.getenv('ADMISSION_SENDER_RATE', 1.0)),
+            sender_burst=float(os.getenv('ADMISSION_SENDER_BURST', 5)),
+            gemini_concurrency=int(os.getenv('ADMISSION_GEMINI_CONCURRENCY', 8)),
+            queue_size=int(os.getenv('ADMISSION_QUEUE_SIZE', 32)),
+            queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2.0)),
+            priorities=priorities or DEFAULT_PRIORITIES,
+        )
+
+    def allow_sender(self, sender_id):
+        """False si el sender ha agotado sus tokens (su mensaje no debe ir a Gemini)"""
+        if self.limiter is None or self.limiter.allow(sender_id):
+            return True
+        self.rate_limited += 1
+        return False
+
+    def domain_for(self, sender_id):
+        return self.domains.get(sender_id)
+
+    def remember(self, sender_id, nlu_data):
+        self.domains.remember(sender_id, nlu_data)
+
+    def priority(self, domain):
+        return self.priorities.get(domain, self.default_priority)
+
+    def admit(self, sender_id):
+        """
+        Limite del sender y hueco hacia Gemini con la prioridad de su dominio. None si se admite
+        (hay que llamar a release() al terminar) o el motivo del descarte.
+        """
+        if not self.allow_sender(sender_id):
+            return RATE_LIMITED
+        return self.gate.acquire(self.priority(self.domain_for(sender_id)))
+
+    async def admit_async(self, sender_id):
+        """Version de admit() que espera sin bloquear el event loop"""
+        if not self.allow_sender(sender_id):
+            return RATE_LIMITED
+        return await self.gate.acquire_async(self.priority(self.domain_for(sender_id)))
+
+    def release(self):
+        self.gate.release()
+
+    def stats(self):
+        stats = self.gate.stats()
+        stats['shed'] = dict(self.gate.shed, **{RATE_LIMITED: self.rate_limited})
+        stats['priorities'] = sorted(self.priorities, key=self.priorities.get)
+        stats['tracked_senders'] = len(self.limiter) if self.limiter is not None else 0
+        if self.limiter is not None:
+            stats['sender_rate'] = self.limiter.rate
+            stats['sender_burst'] = self.limiter.burst
+        return stats
@@ -0,0 +1,151 @@
+"""
+Clasificacion de intenciones en lote sobre JSONL (endpoint /nlu/batch y linea de comandos).
+
+Cada linea de entrada es un objeto JSON con "text" (o "message") y, opcionalmente, "id";
+tambien se acepta una cadena JSON o texto plano. Cada linea de salida lleva id, texto,
+intencion y confianza. Se procesa en trozos de tamaño fijo, asi que la memoria no crece
+con el tamaño de la entrada.
+
+Uso:
+    python -m src.batch_scoring historico.jsonl -o intents.jsonl --model-dir models/
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 512
+
+
+def batch_params_error(chunk_size, top_k):
+    """Mensaje de error si chunk_size o top_k no son al menos 1; None si son validos"""
+    if chunk_size is None or chunk_size < 1:
+        return "chunk_size debe ser un entero mayor o igual que 1"
+    if top_k is None or top_k < 1:
+        return "top_k debe ser un entero mayor o igual que 1"
+    return None
+
+
+def parse_record(line):
+    """Convierte una linea de entrada en {'id', 'text'}; None si la linea esta vacia"""
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        value = json.loads(line)
+    except json.JSONDecodeError:
+        value = line
+    if isinstance(value, dict):
+        text = value.get('text', value.get('message'))
+        return {'id': value.get('id'), 'text': text if isinstance(text, str) else None}
+    if isinstance(value, str):
+        return {'id': None, 'text': value}
+    return {'id': None, 'text': None}
+
+
+def score_chunk(classifier, records, top_k=1):
+    """Clasifica un trozo de registros con una sola llamada a Chatbot.predict_intents"""
+    valid = [record for record in records if record['text'] is not None]
+    predictions = iter(classifier.predict_intents([record['text'] for record in valid], top_k=top_k))
+
+    results = []
+    for record in records:
+        if record['text'] is None:
+            results.append({'id': record['id'], 'error': "Falta el campo 'text'"})
+            continue
+        ranked = next(predictions)
+        intent, confidence = ranked[0] if ranked else (None, 0.0)
+        result = {'id': record['id'], 'text': record['text'], 'intent': intent, 'confidence': confidence}
+        if top_k > 1:
+            result['ranking'] = [{'intent': name, 'confidence': conf} for name, conf in ranked]
+        results.append(result)
+    return results
+
+
+def iter_chunks(lines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Agrupa las lineas de entrada en trozos de registros de tamaño chunk_size"""
+    records = (record for record in map(parse_record, lines) if record is not None)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ThroughputMeter:
+    """Cuenta mensajes procesados y calcula mensajes/segundo"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.messages = 0
+
+    def add(self, count):
+        self.messages += count
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'messages': self.messages,
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(self.messages / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def score_lines(classifier, lines, chunk_size=DEFAULT_CHUNK_SIZE, top_k=1, meter=None):
+    """Generador de resultados (dicts) para un iterable de lineas JSONL"""
+    for chunk in iter_chunks(lines, chunk_size):
+        results = score_chunk(classifier, chunk, top_k)
+        if meter is not None:
+            meter.add(len(chunk))
+        yield from results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clasifica en lote un fichero JSONL con el modelo local de intenciones")
+    parser.add_argument('input', nargs='?', default='-', help="Fichero JSONL de entrada ('-' para stdin)")
+    parser.add_argument('-o', '--output', default='-', help="Fichero JSONL de salida ('-' para stdout)")
+    parser.add_argument('--model-dir', default='models/')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--top-k', type=int, default=1)
+    parser.add_argument('--progress-every', type=int, default=100000, help="Informar del progreso cada N mensajes")
+    args = parser.parse_args(argv)
+    error = batch_params_error(args.chunk_size, args.top_k)
+    if error is not None:
+        parser.error(error.replace('chunk_size', '--chunk-size').replace('top_k', '--top-k'))
+
+    from .chatbot import Chatbot
+
+    classifier = Chatbot(model_dir=args.model_dir)
+    if not classifier.model:
+        print("No hay modelo local entrenado; ejecuta el entrenamiento primero.", file=sys.stderr)
+        return 1
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    meter = ThroughputMeter()
+    next_report = args.progress_every
+    try:
+        for result in score_lines(classifier, source, args.chunk_size, args.top_k, meter):
+            target.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if meter.messages >= next_report:
+                print(f"{meter.messages} mensajes ({meter.summary()['messages_per_second']} msg/s)", file=sys.stderr)
+                next_report += args.progress_every
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    summary = meter.summary()
+    print(f"Clasificados {summary['messages']} mensajes en {summary['seconds']}s ({summary['messages_per_second']} msg/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Catalogo de productos y pedidos para las acciones de e-commerce.
+
+Sustituto local (SQLite) del sistema de inventario y de pedidos real. Se carga una vez por
+proceso del servidor de acciones en un indice en memoria:
+- nombre normalizado y compacto (sin acentos, signos ni espacios) -> producto, para que
+  "iphone15", "iPhone 15" o "IPHONE-15" resuelvan igual sin coste;
+- indice invertido de trigramas de caracteres para la busqueda aproximada ("teclado keychron"
+  -> "Teclado mecánico Keychron") por similitud de Dice. Los candidatos salen de las listas de
+  trigramas mas raros de la consulta (hasta CATALOG_FUZZY_BUDGET entradas) y solo los
+  FUZZY_CANDIDATES con mas trigramas en comun se puntuan exactamente, asi que el coste no
+  crece con el numero de SKUs; con catalogos muy grandes y nombres muy parecidos entre si
+  conviene subir el presupuesto (ver benchmarks/bench_catalog.py).
+
+Los numeros identifican el modelo ("iPhone 14" no es "iPhone 15" aunque compartan casi todos
+los trigramas): si la consulta lleva numeros, la busqueda aproximada solo acepta productos con
+exactamente los mismos. Una coincidencia aproximada (score < 1) es una sugerencia que la accion
+confirma con el usuario, no un resultado.
+
+Los numeros de pedido solo se resuelven de forma exacta (normalizados): una coincidencia
+aproximada podria mostrar el pedido de otro cliente.
+
+El indice es inmutable; refresh() construye uno nuevo y lo intercambia de una vez, asi que las
+acciones en curso terminan con el que tenian. Con CATALOG_REFRESH_INTERVAL > 0 un hilo vigila
+la base de datos (PRAGMA data_version) y recarga solo cuando ha cambiado.
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import heapq
+import threading
+from array import array
+from collections import Counter, namedtuple
+
+from .text_normalization import clean_text
+
+logger = logging.getLogger(__name__)
+
+# Datos de ejemplo con los que se crea la base de datos si no existe
+SEED_PRODUCTS = [
+    ("SKU-0001", "iPhone 15", "smartphones", 50),
+    ("SKU-0002", "Samsung Galaxy S24", "smartphones", 35),
+    ("SKU-0003", "RTX 4080", "componentes", 0),
+    ("SKU-0004", "Teclado mecánico Keychron", "perifericos", 120),
+    ("SKU-0005", "Monitor ultrawide", "monitores", 15),
+    ("SKU-0006", "Auriculares Bluetooth", "audio", 200),
+]
+SEED_ORDERS = [
+    ("123-ABC-789", "Enviado. Se espera que llegue en 2 días hábiles."),
+    ("XYZ-987-654", "Procesando. Tu pedido está siendo preparado en nuestro almacén."),
+    ("ORD-001", "Retrasado. Lamentamos el inconveniente, la nueva fecha estimada es el 15 de Octubre."),
+    ("ORD-456-111", "Entregado. ¡Esperamos que lo disfrutes!"),
+]
+
+# Entradas de listas de trigramas que se recorren como maximo por busqueda aproximada
+DEFAULT_FUZZY_BUDGET = 2000
+# Candidatos (los de mas trigramas en comun) que se puntuan con la similitud exacta
+FUZZY_CANDIDATES = 16
+
+ProductMatch = namedtuple('ProductMatch', 'sku name category stock score')
+
+
+def compact_key(text):
+    """Clave de nombre: normalizada y sin espacios ("iPhone 15" == "iphone15")"""
+    return clean_text(text).replace(' ', '')
+
+
+def order_key(order_id):
+    """Clave de pedido: solo letras y digitos en minusculas ("ORD-001" == "ord 001")"""
+    return ''.join(c for c in order_id.lower() if c.isalnum())
+
+
+def digit_tokens(key):
+    """Numeros de la clave en orden, sin ceros a la izquierda ("rtx4080" -> ('4080',))"""
+    return tuple(token.lstrip('0') or '0' for token in re.findall(r'\d+', key))
+
+
+def trigrams(key):
+    """Trigramas de la clave compacta con marcas de inicio y fin (tambien para claves cortas)"""
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def create_catalog(path, products=SEED_PRODUCTS, orders=SEED_ORDERS):
+    """Crea las tablas y carga productos (sku, nombre, categoria, stock) y pedidos (id, estado)"""
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                "sku TEXT PRIMARY KEY, name TEXT NOT NULL, category TEXT, stock INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS orders (order_id TEXT PRIMARY KEY, status TEXT NOT NULL)")
+            conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)", products)
+            conn.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?)", orders)
+    finally:
+        conn.close()
+
+
+class CatalogIndex:
+    """Instantanea inmutable del catalogo con sus indices exacto y de trigramas"""
+
+    def __init__(self, products, orders, fuzzy_threshold=0.5, fuzzy_budget=DEFAULT_FUZZY_BUDGET):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_budget = fuzzy_budget
+        self.skus = []
+        self.names = []
+        self.categories = []
+        self.stocks = array('l')
+        self.keys = []
+        self.digits = []
+        self.by_key = {}
+        self.by_digits = {}
+        postings = {}
+
+        for sku, name, category, stock in products:
+            key = compact_key(name)
+            if not key:
+                continue
+            product_id = len(self.skus)
+            self.skus.append(sku)
+            self.names.append(name)
+            self.categories.append(category)
+            self.stocks.append(int(stock or 0))
+            self.keys.append(key)
+            self.digits.append(digit_tokens(key))
+            self.by_key.setdefault(key, product_id)
+            self.by_digits.setdefault(self.digits[-1], set()).add(product_id)
+            for gram in trigrams(key):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array('I')
+                posting.append(product_id)
+        self.postings = postings
+        self.orders = {order_key(order_id): status for order_id, status in orders}
+
+    @classmethod
+    def load(cls, path, fuzzy_threshold=0.5, fuzzy_budget=DEFAULT_FUZZY_BUDGET):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            products = conn.execute("SELECT sku, name, category, stock FROM products ORDER BY rowid").fetchall()
+            orders = conn.execute("SELECT order_id, status FROM orders").fetchall()
+        finally:
+            conn.close()
+        return cls(products, orders, fuzzy_threshold, fuzzy_budget)
+
+    def __len__(self):
+        return len(self.skus)
+
+    def _match(self, product_id, score):
+        return ProductMatch(self.skus[product_id], self.names[product_id], self.categories[product_id],
+                            self.stocks[product_id], score)
+
+    def find_product(self, name, threshold=None):
+        """Producto con ese nombre o el mas parecido por trigramas; None si ninguno supera el umbral"""
+        key = compact_key(name or '')
+        if not key:
+            return None
+        product_id = self.by_key.get(key)
+        if product_id is not None:
+            return self._match(product_id, 1.0)
+        return self._fuzzy(key, self.fuzzy_threshold if threshold is None else threshold)
+
+    def _fuzzy(self, key, threshold):
+        grams = trigrams(key)
+        lists = sorted((self.postings[g] for g in grams if g in self.postings), key=len)
+
+        # Conteo de trigramas comunes en las listas mas selectivas (al menos dos, aunque sean largas)
+        counts = Counter()
+        used = 0
+        for i, posting in enumerate(lists):
+            if i >= 2 and used + len(posting) > self.fuzzy_budget:
+                break
+            counts.update(posting)
+            used += len(posting)
+
+        # Con numeros en la consulta solo valen productos con los mismos (otro modelo no es una variante)
+        digits = digit_tokens(key)
+        candidates = counts.keys() if not digits else self.by_digits.get(digits, set()).intersection(counts)
+
+        best_id, best_score = None, 0.0
+        keys = self.keys
+        for product_id in heapq.nlargest(FUZZY_CANDIDATES, candidates, key=counts.__getitem__):
+            other = trigrams(keys[product_id])
+            score = 2.0 * len(grams & other) / (len(grams) + len(other))
+            # A igual similitud gana el nombre mas corto (el modelo base antes que sus variantes)
+            if score > best_score or (score == best_score and len(keys[product_id]) < len(keys[best_id])):
+                best_id, best_score = product_id, score
+        if best_id is None or best_score < threshold:
+            return None
+        return self._match(best_id, round(best_score, 3))
+
+    def get_order_status(self, order_id):
+        return self.orders.get(order_key(order_id or ''))
+
+
+class CatalogStore:
+    """
+    Catalogo compartido por las acciones del proceso. Las lecturas no toman locks: usan la
+    instantanea vigente, que refresh() sustituye por una nueva ya construida.
+    """
+
+    def __init__(self, path, fuzzy_threshold=0.5, fuzzy_budget=DEFAULT_FUZZY_BUDGET, refresh_interval=0):
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_budget = fuzzy_budget
+        self.refresh_interval = refresh_interval
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+        self.last_refresh = None
+        self.last_refresh_seconds = None
+        self.lookups = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        if not os.path.exists(path):
+            logger.info(f"Catalogo '{path}' no encontrado: se crea con los datos de ejemplo.")
+            create_catalog(path)
+        self._index = None
+        self.refresh()
+        if refresh_interval > 0:
+            threading.Thread(target=self._watch, name='catalog-refresh', daemon=True).start()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv('CATALOG_DB_PATH', 'catalog.sqlite3'),
+            fuzzy_threshold=float(os.getenv('CATALOG_FUZZY_THRESHOLD', 0.5)),
+            fuzzy_budget=int(os.getenv('CATALOG_FUZZY_BUDGET', DEFAULT_FUZZY_BUDGET)),
+            refresh_interval=float(os.getenv('CATALOG_REFRESH_INTERVAL', 60)),
+        )
+
+    @property
+    def index(self):
+        return self._index
+
+    def refresh(self):
+        """Recarga el catalogo de SQLite y publica el nuevo indice cuando ya esta completo"""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            index = CatalogIndex.load(self.path, self.fuzzy_threshold, self.fuzzy_budget)
+            self._index = index
+            self.refreshes += 1
+            self.last_refresh = time.time()
+            self.last_refresh_seconds = time.perf_counter() - started
+        logger.info(f"Catalogo cargado: {len(index)} productos y {len(index.orders)} pedidos en {self.last_refresh_seconds:.3f}s")
+        return index
+
+    def _watch(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                # data_version cambia cuando otra conexion confirma escrituras en la base de datos
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version = current
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Error recargando el catalogo: {e}")
+
+    def find_product(self, name):
+        match = self._index.find_product(name)
+        self.lookups += 1
+        if match is None:
+            self.misses += 1
+        elif match.score < 1.0:
+            self.fuzzy_hits += 1
+        return match
+
+    def get_order_status(self, order_id):
+        return self._index.get_order_status(order_id)
+
+    def stats(self):
+        index = self._index
+        return {
+            'path': self.path,
+            'products': len(index),
+            'orders': len(index.orders),
+            'trigrams': len(index.postings),
+            'refreshes': self.refreshes,
+            'last_refresh': self.last_refresh,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'lookups': self.lookups,
+            'fuzzy_hits': self.fuzzy_hits,
+            'misses': self.misses,
+        }
@@ -3,6 +3,9 @@ import random
 import os 
 import numpy as np
 
+from .model_artifact import ARTIFACT_FILENAME, ArtifactError, import_model
+from .linear_model import top_k as select_top_k
+
 class Chatbot:
     def __init__(self, model_dir='models/'):
         self.model_dir = model_dir
@@ -12,6 +15,24 @@ class Chatbot:
         self.load_model()
 
     def load_model(self):
+        """Carga el artefacto del modelo (mapeado en memoria); si no existe, los pickles antiguos"""
+        artifact_path = os.path.join(self.model_dir, ARTIFACT_FILENAME)
+        if not os.path.exists(artifact_path):
+            return self.load_legacy_model()
+
+        try:
+            self.vectorizer, self.model, metadata = import_model(artifact_path)
+            self.intent_labels = metadata['intent_labels']
+            self.intents = metadata['intents']
+            print("Modelo cargado exitosamente")
+            return True
+        except ArtifactError as e:
+            print(f"Artefacto de modelo invalido: {e}")
+            self.model = None
+            return False
+
+    def load_legacy_model(self):
+        """Formato anterior (tres pickles). Solo debe usarse con ficheros de confianza"""
         try:
             model_path = os.path.join(self.model_dir, 'chatbot_model.pkl')
             with open(model_path, 'rb') as f:
@@ -29,7 +50,7 @@ class Chatbot:
                 self.intent_labels = metadata['intent_labels']
                 self.intents = metadata['intents']
             
-            print("Modelo cargado exitosamente")
+            print("Modelo cargado exitosamente (formato pickle antiguo; reentrena para generar el artefacto)")
             return True
         except FileNotFoundError:
             print("No se encontro modelo entrenado. Ejecuta el entrenamiento primero.")
@@ -53,7 +74,24 @@ class Chatbot:
         intent = self.intent_labels[predicted_class]
 
         return intent, confidence
-    
+
+    def predict_intents(self, messages, top_k=1):
+        """
+        Clasifica un lote de mensajes de una vez. Devuelve, por mensaje, una lista con las
+        top_k intenciones mas probables como tuplas (intencion, confianza).
+        """
+        if not self.model or not self.vectorizer:
+            return [[] for _ in messages]
+        if not len(messages):
+            return []
+
+        probabilities = self.model.predict_proba(self.vectorizer.transform(messages))
+        indices, confidences = select_top_k(probabilities, top_k)
+        return [
+            [(self.intent_labels[i], float(c)) for i, c in zip(row_indices, row_confidences)]
+            for row_indices, row_confidences in zip(indices, confidences)
+        ]
+
     def get_fallback_response(self):
         """Respuesta cuando no se puede clasificar la intencion"""
         fallback_responses = [
@@ -0,0 +1,137 @@
+"""
+Deteccion de emergencias en el gateway antes de cualquier NLU.
+
+Los terminos (data/emergency_terms.txt, uno por linea) se normalizan igual que el texto del
+usuario (src/text_normalization.py: minusculas, sin acentos ni signos) y se compilan en un
+automata de Aho-Corasick, que recorre el mensaje una sola vez sea cual sea el numero de
+terminos. Solo cuentan las coincidencias de palabras completas; un '*' final convierte el
+termino en prefijo ("convulsion*" tambien detecta "convulsiones").
+
+Con una coincidencia el gateway envia /contacto_emergencia directamente a RASA sin esperar
+a Gemini ni al clasificador.
+"""
+import os
+import logging
+from collections import deque
+
+from .text_normalization import clean_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TERMS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'emergency_terms.txt')
+
+
+def load_terms(path):
+    """Terminos del fichero, ignorando lineas vacias y comentarios (#)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class AhoCorasickMatcher:
+    """
+    Automata de Aho-Corasick sobre caracteres. Cada estado es un dict de transiciones; las
+    salidas de cada estado incluyen ya las de sus enlaces de fallo.
+    """
+
+    def __init__(self, terms, normalize=clean_text):
+        self.normalize = normalize
+        self._goto = [{}]
+        # Por estado: tuplas (termino original, longitud normalizada, es prefijo)
+        self._outputs = [()]
+        self.terms = []
+        for term in terms:
+            self._add(term)
+        self._build_failure_links()
+
+    def _add(self, term):
+        prefix = term.endswith('*')
+        key = self.normalize(term.rstrip('*'))
+        if not key:
+            return
+        self.terms.append(term)
+        state = 0
+        for char in key:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._outputs.append(())
+            state = next_state
+        self._outputs[state] += ((term, len(key), prefix),)
+
+    def _build_failure_links(self):
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+
+    def _scan(self, text):
+        """Genera (termino, inicio, fin) de las coincidencias de palabras completas en el texto normalizado"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        length = len(text)
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term, size, prefix in outputs[state]:
+                start = end - size
+                if (start == 0 or text[start - 1] == ' ') and (prefix or end == length or text[end] == ' '):
+                    yield term, start, end
+
+    def search(self, text):
+        """Primer termino encontrado en el texto (sin normalizar) o None"""
+        for term, _, _ in self._scan(self.normalize(text)):
+            return term
+        return None
+
+    def find_all(self, text):
+        return [term for term, _, _ in self._scan(self.normalize(text))]
+
+    def __len__(self):
+        return len(self.terms)
+
+
+class EmergencyDetector:
+    """Detector del gateway: el matcher mas contadores para /stats"""
+
+    def __init__(self, terms, intent='contacto_emergencia'):
+        self.matcher = AhoCorasickMatcher(terms)
+        self.intent = intent
+        self.checked = 0
+        self.detected = 0
+
+    @classmethod
+    def from_env(cls):
+        """Detector con EMERGENCY_TERMS_PATH; None si EMERGENCY_FAST_PATH_ENABLED=0 o no hay terminos"""
+        if os.getenv('EMERGENCY_FAST_PATH_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+            return None
+        path = os.getenv('EMERGENCY_TERMS_PATH', DEFAULT_TERMS_PATH)
+        try:
+            terms = load_terms(path)
+        except OSError as e:
+            logger.error(f"No se pudo leer la lista de emergencias '{path}': {e}. Detector desactivado.")
+            return None
+        detector = cls(terms)
+        logger.info(f"Detector de emergencias con {len(detector.matcher)} terminos de '{path}'")
+        return detector
+
+    def detect(self, text):
+        """Termino de emergencia del mensaje o None"""
+        term = self.matcher.search(text)
+        self.checked += 1
+        if term is not None:
+            self.detected += 1
+        return term
+
+    def stats(self):
+        return {'terms': len(self.matcher), 'checked': self.checked, 'detected': self.detected}
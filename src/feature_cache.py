@@ -0,0 +1,127 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+
+from .nlu_cache import schema_version
+
+logger = logging.getLogger(__name__)
+
+# Subir si cambia la logica de TextPreprocessor: invalida todas las entradas
+PREPROCESSING_VERSION = 1
+
+
+def preprocessor_fingerprint(preprocessor):
+    """Identifica la configuracion del preprocesado (stopwords, stemmer y version del codigo)"""
+    return schema_version(PREPROCESSING_VERSION, sorted(preprocessor.stop_words), 'snowball-spanish')
+
+
+class FeatureCache:
+    """
+    Cache en disco (SQLite) del texto preprocesado de cada ejemplo de entrenamiento, con clave
+    el hash del contenido del ejemplo y de la configuracion del preprocesado. Un reentreno solo
+    limpia y reduce (stemming) los ejemplos nuevos o modificados. Al terminar cada entrenamiento
+    se borran las entradas que ningun entrenamiento ha usado en max_age_days dias (0: nunca).
+    """
+
+    def __init__(self, path, max_age_days=30):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            "key TEXT PRIMARY KEY, processed TEXT NOT NULL, seconds REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.reset_stats()
+
+    @classmethod
+    def from_env(cls):
+        """Construye la cache segun FEATURE_CACHE_*; devuelve None si esta desactivada"""
+        if os.getenv('FEATURE_CACHE_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+            return None
+        return cls(
+            os.getenv('FEATURE_CACHE_PATH', 'feature_cache.sqlite3'),
+            max_age_days=float(os.getenv('FEATURE_CACHE_MAX_AGE_DAYS', 30)),
+        )
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.seconds_spent = 0.0
+
+    @staticmethod
+    def key(fingerprint, text):
+        return hashlib.sha256(f"{fingerprint}\x1f{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        # SQLite limita el numero de parametros por consulta
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, processed, seconds in self.conn.execute(
+                f"SELECT key, processed, seconds FROM features WHERE key IN ({placeholders})", batch
+            ):
+                found[key] = (processed, seconds)
+        return found
+
+    def preprocess(self, texts, preprocessor, n_jobs=1):
+        """Devuelve los textos preprocesados, calculando solo los que no estan en cache"""
+        fingerprint = preprocessor_fingerprint(preprocessor)
+        keys = [self.key(fingerprint, text) for text in texts]
+        found = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            started = time.perf_counter()
+            processed = list(preprocessor.preprocess_batch(missing.values(), n_jobs=n_jobs))
+            elapsed = time.perf_counter() - started
+            self.seconds_spent += elapsed
+            per_example = elapsed / len(missing)
+            for key, value in zip(missing, processed):
+                found[key] = (value, per_example)
+
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO features (key, processed, seconds, used) VALUES (?, ?, ?, ?)",
+                [(key, value, seconds, now) for key, (value, seconds) in found.items()],
+            )
+
+        for key in keys:
+            if key in missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.seconds_saved += found[key][1]
+        return [found[key][0] for key in keys]
+
+    def prune(self, older_than_days=None):
+        """Borra las entradas que ningun entrenamiento ha usado en los ultimos dias (por defecto max_age_days)"""
+        older_than_days = self.max_age_days if older_than_days is None else older_than_days
+        if older_than_days <= 0:
+            return 0
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM features WHERE used < ?", (time.time() - older_than_days * 86400,))
+        return cursor.rowcount
+
+    def report(self):
+        total = self.hits + self.misses
+        return {
+            'examples': total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else 0.0,
+            'seconds_saved': self.seconds_saved,
+            'seconds_spent': self.seconds_spent,
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,82 @@
+"""
+Prompts de generacion de respuestas con Gemini, compartidos por el servidor de acciones y el
+gateway (generacion especulativa, src/speculation.py). Los dos lados construyen el prompt con
+estas funciones, asi que un resultado especulativo sirve a la accion solo si su prompt coincide
+exactamente (prompt_fingerprint).
+
+En los modos 'gemini' e 'hybrid' el texto que recibe RASA es la intencion inyectada
+("/pregunta_abierta"); el gateway envia el mensaje original en metadata.user_text y la accion lo
+lee con user_text() para preguntar a Gemini lo mismo que el usuario (y lo mismo que la especulacion).
+"""
+import hashlib
+
+DOMAIN_SYSTEM_PROMPTS = {
+    "ecommerce": "Eres un asistente experto para una tienda online de tecnología. Responde de forma clara y útil sobre productos, stock o pedidos. Siempre mantén un tono comercial pero amigable.",
+    "banca": "Eres un asistente bancario. Responde con precisión sobre saldos, transferencias, bloqueos de tarjeta o asesoramiento financiero. Prioriza la seguridad y la claridad en la información.",
+    "salud": "Eres un asistente de salud. Proporciona información general sobre síntomas, citas o medicamentos. NO eres un médico, no hagas diagnósticos ni prescribas tratamientos. Siempre recomienda consultar a un profesional de la salud en caso de emergencia o dudas médicas.",
+}
+DEFAULT_SYSTEM_PROMPT = "Eres un asistente general y útil."
+
+# Intenciones cuya accion genera la respuesta con Gemini a partir de la intencion y sus entidades
+SPECULATIVE_INTENTS = ('pregunta_abierta', 'consultar_sintoma', 'informacion_medicamento', 'recomendar_producto')
+
+# Clave de los metadatos del mensaje a RASA con el texto original del usuario
+USER_TEXT_KEY = 'user_text'
+
+
+def user_text(latest_message):
+    """Texto original del usuario de tracker.latest_message (metadata.user_text si el gateway inyecto la intencion)"""
+    metadata = latest_message.get('metadata') or {}
+    return metadata.get(USER_TEXT_KEY) or latest_message.get('text') or ''
+
+
+def build_domain_prompt(prompt, domain="general"):
+    """Prompt completo que se envia a Gemini: instrucciones del dominio y la pregunta"""
+    system_prompt = DOMAIN_SYSTEM_PROMPTS.get(domain, DEFAULT_SYSTEM_PROMPT)
+    return f"{system_prompt}\n\nPregunta del usuario: \"{prompt}\""
+
+
+def symptom_prompt(sintoma):
+    # Es crucial que el prompt indique a Gemini que NO DEBE HACER DIAGNÓSTICOS
+    return (
+        "Eres un asistente de salud que proporciona información general sobre síntomas. NO ERES UN MÉDICO, NO DIAGNOSTICAS NI PRESCRIBES.\n"
+        f"Explica brevemente y de forma informativa sobre el siguiente síntoma: {sintoma}.\n"
+        "Siempre termina tu respuesta recomendando consultar a un profesional de la salud si los síntomas persisten o empeoran."
+    )
+
+
+def medication_prompt(medicamento):
+    return (
+        "Eres un asistente de salud que proporciona información general sobre medicamentos. NO ERES UN MÉDICO, NO DIAGNOSTICAS NI PRESCRIBES.\n"
+        f"Explica brevemente para qué sirve y cuáles son los usos comunes del medicamento: {medicamento}.\n"
+        "Aclara que siempre se debe consultar a un médico o farmacéutico antes de tomar cualquier medicamento."
+    )
+
+
+def recommendation_prompt(categoria, interes):
+    return (
+        f"El usuario busca una recomendación de {categoria or 'producto'} para {interes or 'uso general'}. "
+        "Como experto en ventas, sugiere 2-3 productos populares de tu tienda y explica brevemente por qué son buenas opciones."
+    )
+
+
+def prompt_for_intent(intent, entities, user_message, current_domain="general"):
+    """
+    (prompt, dominio) que generara la accion de la intencion con esas entidades ({entidad: valor}),
+    o None si la accion no llamara a Gemini (intencion sin generacion o faltan entidades).
+    """
+    if intent == 'pregunta_abierta':
+        return user_message, current_domain or "general"
+    if intent == 'consultar_sintoma' and entities.get('sintoma'):
+        return symptom_prompt(entities['sintoma']), "salud"
+    if intent == 'informacion_medicamento' and entities.get('medicamento'):
+        return medication_prompt(entities['medicamento']), "salud"
+    if intent == 'recomendar_producto' and (entities.get('categoria') or entities.get('interes')):
+        return recommendation_prompt(entities.get('categoria'), entities.get('interes')), "ecommerce"
+    return None
+
+
+def prompt_fingerprint(model_name, full_prompt):
+    """Huella de (modelo, prompt completo) con la que la accion comprueba un resultado especulativo"""
+    model_name = model_name[len('models/'):] if model_name.startswith('models/') else model_name
+    return hashlib.sha256(f"{model_name}\x1f{full_prompt}".encode('utf-8')).hexdigest()[:32]
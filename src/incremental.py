@@ -0,0 +1,243 @@
+"""
+Entrenamiento incremental del clasificador local de intenciones.
+
+El modelo incremental usa el vocabulario TF-IDF congelado de la ultima reconstruccion y un
+SGDClassifier(loss='log_loss'), que admite partial_fit: los ejemplos nuevos se incorporan al
+modelo existente sin reajustar todo el corpus. Los terminos que no estaban en el vocabulario
+se ignoran hasta la siguiente reconstruccion completa, salvo con el featurizador de hashing
+(--featurizer hashing), que no tiene vocabulario y los tiene en cuenta desde el primer lote.
+
+Uso:
+    python -m src.incremental rebuild --intents data/nlu.yml --model-dir models/ [--featurizer hashing]
+    python -m src.incremental update nuevos.jsonl --model-dir models/ [--intents data/nlu.yml --rebuild-every 20]
+
+Los ejemplos nuevos son JSONL con {"text": ..., "intent": ...}.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score
+
+from .preprocessing import IntentVectorizer
+from .training import ChatbotTrainer
+from .linear_model import LinearOvRModel, dense_weights
+from .model_artifact import ARTIFACT_FILENAME, export_model, import_model
+
+HOLDOUT_FILENAME = 'holdout.jsonl'
+INCREMENTS_FILENAME = 'increments.jsonl'
+
+# Pasadas de partial_fit sobre cada lote de ejemplos nuevos
+DEFAULT_EPOCHS = 5
+
+
+class IncrementalModelError(Exception):
+    """El modelo actual no admite actualizacion incremental (o los datos no encajan en el)"""
+
+
+def read_examples(path):
+    """Lee ejemplos etiquetados {"text", "intent"} de un fichero JSONL"""
+    texts, labels = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            example = json.loads(line)
+            texts.append(example['text'])
+            labels.append(example['intent'])
+    return texts, labels
+
+
+def write_examples(path, texts, labels, mode='w'):
+    with open(path, mode, encoding='utf-8') as f:
+        for text, label in zip(texts, labels):
+            f.write(json.dumps({'text': text, 'intent': label}, ensure_ascii=False) + "\n")
+
+
+class IncrementalTrainer:
+    def __init__(self, model_dir='models/', alpha=1e-4, epochs=DEFAULT_EPOCHS, random_state=42, featurizer=None):
+        self.model_dir = model_dir
+        # Featurizador de las reconstrucciones; las actualizaciones usan el del artefacto
+        self.featurizer = featurizer
+        self.alpha = alpha
+        self.epochs = epochs
+        self.random_state = random_state
+
+    @property
+    def artifact_path(self):
+        return os.path.join(self.model_dir, ARTIFACT_FILENAME)
+
+    def _path(self, filename):
+        return os.path.join(self.model_dir, filename)
+
+    def _new_classifier(self):
+        return SGDClassifier(loss='log_loss', alpha=self.alpha, random_state=self.random_state)
+
+    def _holdout_accuracy(self, vectorizer, linear_model, label_to_index):
+        path = self._path(HOLDOUT_FILENAME)
+        if not os.path.exists(path):
+            return None
+        texts, labels = read_examples(path)
+        known = [(text, label_to_index[label]) for text, label in zip(texts, labels) if label in label_to_index]
+        if not known:
+            return None
+        X = vectorizer.transform([text for text, _ in known])
+        predicted = linear_model.predict_proba(X).argmax(axis=1)
+        return accuracy_score([label for _, label in known], predicted)
+
+    def rebuild(self, intents_filepath):
+        """
+        Reconstruccion completa: reajusta el vectorizador y el clasificador con el corpus
+        de intents mas todos los ejemplos incorporados de forma incremental.
+        """
+        started = time.perf_counter()
+        trainer = ChatbotTrainer()
+        trainer.load_intents(intents_filepath)
+        texts, y = trainer.prepare_training_data()
+        labels = [trainer.intent_labels[i] for i in y]
+
+        increments_path = self._path(INCREMENTS_FILENAME)
+        if os.path.exists(increments_path):
+            extra_texts, extra_labels = read_examples(increments_path)
+            texts += extra_texts
+            labels += extra_labels
+        intent_labels = sorted(set(labels))
+        label_to_index = {label: idx for idx, label in enumerate(intent_labels)}
+
+        vectorizer = IntentVectorizer(featurizer=self.featurizer)
+        X = vectorizer.fit_transform(texts, trainer.feature_cache)
+        if trainer.feature_cache is not None:
+            trainer.feature_cache.prune()
+        y = np.array([label_to_index[label] for label in labels])
+        indices = np.arange(len(texts))
+        stratify = y if np.bincount(y).min() >= 2 else None
+        # Igual que ChatbotTrainer: al menos un ejemplo de hold-out por intencion
+        test_size = max(0.2, len(intent_labels) / len(texts)) if stratify is not None else 0.2
+        train_idx, holdout_idx = train_test_split(indices, test_size=test_size, random_state=self.random_state, stratify=stratify)
+
+        classifier = self._new_classifier()
+        classifier.fit(X[train_idx], y[train_idx])
+        linear_model = LinearOvRModel.from_sgd(classifier)
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        write_examples(self._path(HOLDOUT_FILENAME), [texts[i] for i in holdout_idx], [labels[i] for i in holdout_idx])
+        training = {'t': classifier.t_, 'examples': len(train_idx), 'increments_since_rebuild': 0}
+        export_model(self.artifact_path, vectorizer, linear_model, intent_labels, trainer.intents, training=training)
+
+        report = {
+            'mode': 'rebuild',
+            'seconds': round(time.perf_counter() - started, 3),
+            'examples': len(texts),
+            'holdout_accuracy': self._holdout_accuracy(vectorizer, linear_model, label_to_index),
+        }
+        print(f"Reconstruccion completa: {report['examples']} ejemplos en {report['seconds']}s, precision en hold-out {report['holdout_accuracy']:.4f}")
+        return report
+
+    def _load(self):
+        vectorizer, linear_model, metadata = import_model(self.artifact_path)
+        if linear_model.artifact_type != LinearOvRModel.artifact_type or 'training' not in metadata:
+            raise IncrementalModelError("El modelo actual no es incremental; ejecuta primero una reconstruccion (rebuild)")
+
+        classifier = self._new_classifier()
+        classifier.classes_ = np.arange(linear_model.n_classes)
+        classifier.coef_ = np.ascontiguousarray(dense_weights(linear_model.weights).T)
+        classifier.intercept_ = np.array(linear_model.intercept)
+        classifier.t_ = metadata['training']['t']
+        classifier.n_features_in_ = linear_model.weights.shape[0]
+        return vectorizer, linear_model, classifier, metadata
+
+    def update(self, texts, labels, intents_filepath=None, rebuild_every=None):
+        """
+        Incorpora ejemplos nuevos con partial_fit. Devuelve un informe con el tiempo empleado y
+        la precision en el hold-out antes y despues. Si se indica rebuild_every y se alcanza ese
+        numero de incrementos, hace ademas una reconstruccion completa.
+        """
+        started = time.perf_counter()
+        vectorizer, linear_model, classifier, metadata = self._load()
+        intent_labels = metadata['intent_labels']
+        label_to_index = {label: idx for idx, label in enumerate(intent_labels)}
+
+        unknown = sorted(set(labels) - set(label_to_index))
+        if unknown:
+            raise IncrementalModelError(f"Intenciones nuevas {unknown}: requieren una reconstruccion completa")
+
+        accuracy_before = self._holdout_accuracy(vectorizer, linear_model, label_to_index)
+
+        X = vectorizer.transform(texts)
+        y = np.array([label_to_index[label] for label in labels])
+        rng = np.random.default_rng(self.random_state)
+        for _ in range(self.epochs):
+            order = rng.permutation(len(y))
+            classifier.partial_fit(X[order], y[order])
+
+        updated_model = LinearOvRModel.from_sgd(classifier)
+        training = dict(metadata['training'])
+        training.update(
+            t=classifier.t_,
+            examples=training['examples'] + len(texts),
+            increments_since_rebuild=training['increments_since_rebuild'] + 1,
+        )
+        export_model(self.artifact_path, vectorizer, updated_model, intent_labels, metadata['intents'], training=training)
+        write_examples(self._path(INCREMENTS_FILENAME), texts, labels, mode='a')
+
+        accuracy_after = self._holdout_accuracy(vectorizer, updated_model, label_to_index)
+        report = {
+            'mode': 'incremental',
+            'seconds': round(time.perf_counter() - started, 3),
+            'examples': len(texts),
+            'holdout_accuracy_before': accuracy_before,
+            'holdout_accuracy_after': accuracy_after,
+            'accuracy_delta': None if accuracy_before is None else accuracy_after - accuracy_before,
+            'increments_since_rebuild': training['increments_since_rebuild'],
+        }
+        if report['accuracy_delta'] is not None:
+            print(f"Incremento: {len(texts)} ejemplos en {report['seconds']}s, precision en hold-out "
+                  f"{accuracy_before:.4f} -> {accuracy_after:.4f} ({report['accuracy_delta']:+.4f})")
+        else:
+            print(f"Incremento: {len(texts)} ejemplos en {report['seconds']}s (sin hold-out)")
+
+        if rebuild_every and intents_filepath and training['increments_since_rebuild'] >= rebuild_every:
+            print(f"{training['increments_since_rebuild']} incrementos desde la ultima reconstruccion: reconstruyendo")
+            if self.featurizer is None:
+                self.featurizer = vectorizer.featurizer
+            report['rebuild'] = self.rebuild(intents_filepath)
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrenamiento incremental del clasificador local de intenciones")
+    parser.add_argument('--model-dir', default='models/')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser('rebuild', help="Reconstruccion completa del modelo incremental")
+    rebuild_parser.add_argument('--intents', required=True)
+    rebuild_parser.add_argument('--featurizer', choices=['tfidf', 'hashing'], help="Por defecto NLU_FEATURIZER")
+
+    update_parser = subparsers.add_parser('update', help="Incorpora ejemplos nuevos (JSONL) al modelo actual")
+    update_parser.add_argument('examples')
+    update_parser.add_argument('--intents', help="Corpus completo, para las reconstrucciones programadas")
+    update_parser.add_argument('--rebuild-every', type=int, default=int(os.getenv('INCREMENTAL_REBUILD_EVERY', 0)),
+                               help="Reconstruir tras N incrementos (0 = nunca)")
+    update_parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS)
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        IncrementalTrainer(args.model_dir, featurizer=args.featurizer).rebuild(args.intents)
+        return 0
+
+    texts, labels = read_examples(args.examples)
+    try:
+        IncrementalTrainer(args.model_dir, epochs=args.epochs).update(texts, labels, args.intents, args.rebuild_every)
+    except IncrementalModelError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
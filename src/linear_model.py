@@ -0,0 +1,268 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.special import expit
+
+# Igual que libsvm: probabilidades por pareja acotadas a [MIN_PROB, 1 - MIN_PROB]
+MIN_PROB = 1e-7
+
+# Por encima de este tamaño los pesos se guardan dispersos (CSR), p. ej. con el featurizador
+# de hashing, donde hay muchos mas buckets que terminos vistos en el entrenamiento
+DENSE_WEIGHTS_MAX_BYTES = 16 * 1024 * 1024
+
+
+def as_weights(matrix):
+    """Matriz de pesos (n_terminos, n_salidas): densa si cabe en DENSE_WEIGHTS_MAX_BYTES, CSR si no"""
+    rows, cols = matrix.shape
+    if rows * cols * 8 <= DENSE_WEIGHTS_MAX_BYTES:
+        dense = matrix.toarray() if sp.issparse(matrix) else matrix
+        return np.ascontiguousarray(dense, dtype=np.float64)
+    return sp.csr_matrix(matrix, dtype=np.float64)
+
+
+def weights_to_arrays(weights):
+    """Arrays con los que se guarda la matriz de pesos en el artefacto"""
+    if not sp.issparse(weights):
+        return {'weights': weights}
+    index_dtype = np.int32 if weights.nnz < 2 ** 31 else np.int64
+    return {
+        'weights_data': weights.data,
+        'weights_indices': weights.indices.astype(index_dtype, copy=False),
+        'weights_indptr': weights.indptr.astype(index_dtype, copy=False),
+        'weights_shape': np.array(weights.shape, dtype=np.int64),
+    }
+
+
+def weights_from_arrays(arrays):
+    """Inversa de weights_to_arrays: reconstruye los pesos sobre los arrays (sin copiarlos)"""
+    if 'weights' in arrays:
+        return arrays['weights']
+    shape = tuple(int(n) for n in arrays['weights_shape'])
+    return sp.csr_matrix((arrays['weights_data'], arrays['weights_indices'], arrays['weights_indptr']), shape=shape, copy=False)
+
+
+def dense_weights(weights):
+    return weights.toarray() if sp.issparse(weights) else np.asarray(weights)
+
+
+def _scores(X, weights, intercept):
+    scores = X @ weights
+    if sp.issparse(scores):
+        scores = scores.toarray()
+    return np.asarray(scores) + intercept
+
+
+def sigmoid_predict(decision, prob_a, prob_b):
+    """Calibracion de Platt de libsvm, estable numericamente"""
+    f_apb = decision * prob_a + prob_b
+    positive = f_apb >= 0
+    exp_term = np.exp(-np.abs(f_apb))
+    return np.where(positive, exp_term / (1.0 + exp_term), 1.0 / (1.0 + exp_term))
+
+
+def _coupling_matrix(pairwise):
+    # Q[t][j] = -r[j][t] * r[t][j];  Q[t][t] = suma de r[j][t]^2
+    q = -np.swapaxes(pairwise, -1, -2) * pairwise
+    diagonal = np.arange(pairwise.shape[-1])
+    q[..., diagonal, diagonal] = (pairwise ** 2).sum(axis=-2)
+    return q
+
+
+def _couple_row(pairwise):
+    """Un solo mensaje: mismas operaciones que el caso por lotes, con escalares de Python"""
+    k = pairwise.shape[0]
+    max_iter = max(100, k)
+    eps = 0.005 / k
+    q = _coupling_matrix(pairwise)
+    q_diag = q.diagonal().tolist()
+
+    p = np.full(k, 1.0 / k)
+    for _ in range(max_iter):
+        qp = q @ p
+        pqp = float(p @ qp)
+        if np.max(np.abs(qp - pqp)) < eps:
+            break
+        for t in range(k):
+            qp_t = float(qp[t])
+            diff = (-qp_t + pqp) / q_diag[t]
+            p[t] += diff
+            pqp = (pqp + diff * (diff * q_diag[t] + 2 * qp_t)) / (1 + diff) / (1 + diff)
+            qp += diff * q[t]
+            qp /= (1 + diff)
+            p /= (1 + diff)
+    return p
+
+
+def multiclass_probability(pairwise):
+    """
+    Acoplamiento por parejas (Wu, Lin y Weng, metodo 2), port de libsvm vectorizado por lotes.
+    pairwise[n, i, j] es la probabilidad de que en el mensaje n gane la clase i frente a la j.
+    Cada fila deja de iterar cuando converge, igual que libsvm.
+    """
+    n, k, _ = pairwise.shape
+    if n == 1:
+        return _couple_row(pairwise[0])[None, :]
+    max_iter = max(100, k)
+    eps = 0.005 / k
+    q = _coupling_matrix(pairwise)
+    q_diag = q.diagonal(axis1=1, axis2=2)
+
+    p = np.full((n, k), 1.0 / k)
+    active = np.ones(n, dtype=bool)
+    for _ in range(max_iter):
+        qp = np.einsum('ntj,nj->nt', q, p)
+        pqp = (p * qp).sum(axis=1)
+        active &= np.abs(qp - pqp[:, None]).max(axis=1) >= eps
+        rows = np.flatnonzero(active)
+        if not len(rows):
+            break
+        if len(rows) < n:
+            q_rows, q_diag_rows, p_rows, qp, pqp = q[rows], q_diag[rows], p[rows], qp[rows], pqp[rows]
+        else:
+            q_rows, q_diag_rows, p_rows = q, q_diag, p
+        for t in range(k):
+            qp_t = qp[:, t]
+            diff = (-qp_t + pqp) / q_diag_rows[:, t]
+            p_rows[:, t] += diff
+            pqp = (pqp + diff * (diff * q_diag_rows[:, t] + 2 * qp_t)) / (1 + diff) / (1 + diff)
+            scale = (1 + diff)[:, None]
+            qp = (qp + diff[:, None] * q_rows[:, t]) / scale
+            p_rows /= scale
+        p[rows] = p_rows
+    return p
+
+
+def top_k(probabilities, k=1):
+    """Indices y probabilidades de las k clases mas probables de cada fila, de mayor a menor"""
+    k = min(k, probabilities.shape[1])
+    if k < probabilities.shape[1]:
+        candidates = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(probabilities.shape[1]), (probabilities.shape[0], 1))
+    candidate_probs = np.take_along_axis(probabilities, candidates, axis=1)
+    order = np.argsort(-candidate_probs, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_probs, order, axis=1)
+
+
+class LinearSVCModel:
+    """
+    SVC de kernel lineal reducido a matrices densas: un vector de pesos por pareja de clases
+    (uno contra uno, en el orden de libsvm) mas los parametros de Platt de cada pareja.
+    Reproduce SVC.predict_proba sin sklearn ni libsvm.
+
+    weights tiene forma (n_terminos, n_parejas), densa o CSR: un lote TF-IDF disperso se
+    puntua con un unico producto X @ weights.
+    """
+
+    artifact_type = 'linear_svc_ovo'
+
+    def __init__(self, weights, intercept, prob_a, prob_b, n_classes):
+        self.weights = weights
+        self.intercept = intercept
+        self.prob_a = prob_a
+        self.prob_b = prob_b
+        self.n_classes = n_classes
+        # Indices (i, j) de cada pareja, en el orden de libsvm
+        self.pair_i, self.pair_j = np.triu_indices(n_classes, k=1)
+
+    @classmethod
+    def from_svc(cls, svc):
+        """Exporta un sklearn.svm.SVC(kernel='linear', probability=True) ya entrenado"""
+        if svc.kernel != 'linear' or not getattr(svc, 'probability', False):
+            raise ValueError("Solo se puede exportar un SVC lineal entrenado con probability=True")
+        coef = svc.coef_
+        intercept = np.asarray(svc.intercept_, dtype=np.float64)
+        if len(svc.classes_) == 2:
+            # sklearn invierte el signo en binario; libsvm calibra sobre el valor original
+            coef, intercept = -coef, -intercept
+        return cls(
+            as_weights(coef.T),
+            intercept,
+            np.asarray(svc.probA_, dtype=np.float64),
+            np.asarray(svc.probB_, dtype=np.float64),
+            len(svc.classes_),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays, n_classes):
+        return cls(weights_from_arrays(arrays), arrays['intercept'], arrays['prob_a'], arrays['prob_b'], n_classes)
+
+    def arrays(self):
+        """Arrays numericos del modelo, para guardarlos en el artefacto"""
+        return dict(
+            weights_to_arrays(self.weights),
+            intercept=self.intercept,
+            prob_a=self.prob_a,
+            prob_b=self.prob_b,
+        )
+
+    def decision_function(self, X):
+        """Valor de decision de cada pareja (filas = mensajes)"""
+        return _scores(X, self.weights, self.intercept)
+
+    def predict_proba(self, X):
+        """
+        Probabilidad de cada clase, como SVC.predict_proba, para todo el lote a la vez:
+        un producto matricial, calibracion de Platt vectorizada y acoplamiento por lotes.
+        """
+        decisions = self.decision_function(X)
+        pair_probs = np.clip(sigmoid_predict(decisions, self.prob_a, self.prob_b), MIN_PROB, 1 - MIN_PROB)
+        pairwise = np.zeros((decisions.shape[0], self.n_classes, self.n_classes))
+        pairwise[:, self.pair_i, self.pair_j] = pair_probs
+        pairwise[:, self.pair_j, self.pair_i] = 1 - pair_probs
+        return multiclass_probability(pairwise)
+
+    def top_k(self, X, k=1):
+        """Las k clases mas probables de cada mensaje: (indices, probabilidades)"""
+        return top_k(self.predict_proba(X), k)
+
+
+class LinearOvRModel:
+    """
+    Clasificador lineal uno contra el resto con salida logistica, como un
+    SGDClassifier(loss='log_loss'). Es el modelo del entrenamiento incremental.
+    weights tiene forma (n_terminos, n_clases), o (n_terminos, 1) si solo hay dos clases.
+    """
+
+    artifact_type = 'linear_ovr_logistic'
+
+    def __init__(self, weights, intercept, n_classes):
+        self.weights = weights
+        self.intercept = intercept
+        self.n_classes = n_classes
+
+    @classmethod
+    def from_sgd(cls, clf):
+        """Exporta un SGDClassifier(loss='log_loss') ya entrenado"""
+        coef = clf.coef_
+        return cls(
+            as_weights(sp.csr_matrix(coef.T) if coef.size * 8 > DENSE_WEIGHTS_MAX_BYTES else coef.T),
+            np.asarray(clf.intercept_, dtype=np.float64),
+            len(clf.classes_),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays, n_classes):
+        return cls(weights_from_arrays(arrays), arrays['intercept'], n_classes)
+
+    def arrays(self):
+        """Arrays numericos del modelo, para guardarlos en el artefacto"""
+        return dict(weights_to_arrays(self.weights), intercept=self.intercept)
+
+    def decision_function(self, X):
+        """Valor de decision de cada clase (filas = mensajes)"""
+        return _scores(X, self.weights, self.intercept)
+
+    def predict_proba(self, X):
+        """Probabilidad de cada clase, como SGDClassifier.predict_proba"""
+        probabilities = expit(self.decision_function(X))
+        if self.n_classes == 2:
+            return np.hstack([1 - probabilities, probabilities])
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def top_k(self, X, k=1):
+        """Las k clases mas probables de cada mensaje: (indices, probabilidades)"""
+        return top_k(self.predict_proba(X), k)
+
+
+# Tipos de clasificador que puede contener un artefacto
+MODEL_TYPES = {model.artifact_type: model for model in (LinearSVCModel, LinearOvRModel)}
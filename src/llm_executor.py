@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedLLMExecutor:
+    """
+    Pool de hilos dedicado a las llamadas bloqueantes al SDK de Gemini.
+
+    El numero de hilos actua como semaforo: nunca hay mas de max_concurrency peticiones
+    en vuelo, y las demas esperan en cola sin ocupar el event loop del servidor de acciones.
+    Se mide el tiempo de espera en cola de cada llamada; on_wait(segundos), si se indica,
+    la recibe (p. ej. para observarla en un histograma).
+
+    Las llamadas que siguen en curso aunque quien las hizo ya no las espere (hold(), p. ej. un
+    intento abandonado por la capa de resiliencia) cuentan contra el limite hasta que terminan.
+    """
+
+    def __init__(self, max_concurrency=8, slow_wait_threshold=0.5, on_wait=None):
+        self.max_concurrency = max_concurrency
+        self.slow_wait_threshold = slow_wait_threshold
+        self.on_wait = on_wait
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='gemini')
+        self._lock = threading.Lock()
+        self._capacity = threading.Condition(self._lock)
+        self.in_flight = 0
+        self.abandoned = 0
+        self.queued = 0
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    def from_env(cls, on_wait=None):
+        return cls(
+            max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', 8)),
+            slow_wait_threshold=float(os.getenv('GEMINI_SLOW_WAIT_THRESHOLD', 0.5)),
+            on_wait=on_wait,
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        """Encola la llamada y devuelve un concurrent.futures.Future"""
+        enqueued = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            with self._capacity:
+                self._capacity.wait_for(lambda: self.in_flight + self.abandoned < self.max_concurrency)
+                wait = time.monotonic() - enqueued
+                self.queued -= 1
+                self.in_flight += 1
+                self.calls += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            if self.on_wait is not None:
+                self.on_wait(wait)
+            if wait >= self.slow_wait_threshold:
+                logger.warning(f"Llamada a Gemini esperó {wait:.3f}s en cola (límite de concurrencia {self.max_concurrency}).")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                # Despierta a la siguiente llamada que espera hueco (bloqueada en wait_for)
+                with self._capacity:
+                    self.in_flight -= 1
+                    self._capacity.notify()
+
+        # El hilo del pool hereda el contexto de quien encola (p. ej. el span de traza actual)
+        return self._executor.submit(contextvars.copy_context().run, run)
+
+    def hold(self, future):
+        """Ocupa un hueco del limite hasta que termine future (una llamada ya abandonada)"""
+        with self._lock:
+            self.abandoned += 1
+
+        def release(_):
+            with self._capacity:
+                self.abandoned -= 1
+                self._capacity.notify()
+
+        future.add_done_callback(release)
+
+    async def run(self, fn, *args, **kwargs):
+        """Ejecuta la llamada bloqueante en el pool y la espera sin bloquear el event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'abandoned': self.abandoned,
+                'queued': self.queued,
+                'calls': self.calls,
+                'avg_queue_wait': (self.total_wait / self.calls) if self.calls else 0.0,
+                'max_queue_wait': self.max_wait,
+            }
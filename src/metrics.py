@@ -0,0 +1,319 @@
+"""
+Metricas de latencia por etapa (contadores e histogramas) expuestas en formato de texto de
+Prometheus en /metrics del gateway y del servidor de acciones.
+
+Cada observacion cuesta una busqueda binaria del bucket y un lock (~1µs), asi que se puede
+dejar activado en produccion; METRICS_ENABLED=0 lo convierte en no-op. Las metricas son por
+proceso: con varios workers de gunicorn cada uno expone las suyas.
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets en segundos: del modelo local (milisegundos) a Gemini con reintentos (decenas de segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+
+def _escape(value):
+    return _escape_help(value).replace('"', r'\"')
+
+
+def _escape_help(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _NoopChild:
+    """Serie de una metrica desactivada: todas las operaciones se ignoran"""
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def set_function(self, function):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager que observa la duracion del bloque"""
+
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ('function',)
+
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def set_function(self, function):
+        """El valor se lee llamando a function() en cada /metrics (p. ej. el tamano de una cola)"""
+        self.function = function
+
+    def current(self):
+        return self.function() if self.function is not None else self.value
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        # Un contador por bucket (no acumulados) mas el de +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), enabled=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.enabled = enabled
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Serie de la combinacion de etiquetas indicada (se crea la primera vez)"""
+        if not self.enabled:
+            return _NOOP
+        # Camino rapido: etiquetas que ya son str y una serie que ya existe
+        child = self._children.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, recibio {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape_help(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in self._items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    """Valor que sube y baja (p. ej. profundidad de una cola)"""
+
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def _samples(self):
+        for values, child in self._items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.current())}"
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, enabled=True):
+        super().__init__(name, documentation, labelnames, enabled)
+        self.upper_bounds = tuple(sorted(float(bound) for bound in buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, extra=[('le', _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+_NOOP = _NoopChild()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(enabled=os.getenv('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes'))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Reimportar un modulo (p. ej. app desde asgi) devuelve la metrica ya registrada
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames, enabled=self.enabled))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames, enabled=self.enabled))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets, enabled=self.enabled))
+
+    def render(self):
+        """Todas las metricas en formato de texto de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registro global del proceso
+REGISTRY = MetricsRegistry.from_env()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Sirve GET /metrics con el registro global (se puede montar en otros servidores http.server)"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0].rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        send_metrics(self)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def send_metrics(handler, registry=REGISTRY):
+    """Escribe la respuesta de /metrics en un BaseHTTPRequestHandler"""
+    body = registry.render().encode('utf-8')
+    handler.send_response(200)
+    handler.send_header('Content-Type', CONTENT_TYPE)
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def start_metrics_server(host='0.0.0.0', port=5056):
+    """Arranca en un hilo un servidor HTTP que solo expone /metrics"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Servidor de metricas escuchando en {host}:{port}")
+    return server
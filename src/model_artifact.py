@@ -0,0 +1,174 @@
+import os
+import json
+import struct
+import hashlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FILENAME = 'intent_model.bin'
+ARTIFACT_MAGIC = b'CBINTENT'
+# v2: pesos del clasificador traspuestos (n_terminos, n_parejas) para puntuar lotes sin copias
+# v3: featurizador de hashing y pesos dispersos (CSR); los artefactos v2 se siguen leyendo
+SCHEMA_VERSION = 3
+SUPPORTED_SCHEMA_VERSIONS = (2, 3)
+
+# magic (8) + version de esquema (uint32) + longitud de la cabecera (uint64) + sha256 (32)
+_PREAMBLE = struct.Struct('<8sIQ32s')
+# Alineacion de cada array dentro del fichero (permite vistas sin copia sobre el mmap)
+_ALIGNMENT = 64
+
+# Parametros del TfidfVectorizer que se guardan para reconstruirlo al cargar
+VECTORIZER_PARAMS = ('lowercase', 'ngram_range', 'norm', 'use_idf', 'smooth_idf', 'sublinear_tf', 'max_features', 'analyzer', 'token_pattern')
+
+
+class ArtifactError(Exception):
+    """El artefacto no existe, esta corrupto o tiene un esquema no soportado"""
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save_artifact(path, arrays, metadata):
+    """
+    Escribe el artefacto: un preambulo fijo, una cabecera JSON (metadata + descripcion de los arrays)
+    y los arrays numericos en crudo, alineados. El sha256 cubre cabecera y datos.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    header = dict(metadata, schema_version=SCHEMA_VERSION, arrays=layout)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    # Los datos empiezan alineados respecto al inicio del fichero
+    data_start = _align(_PREAMBLE.size + len(header_bytes))
+    header_bytes += b' ' * (data_start - _PREAMBLE.size - len(header_bytes))
+
+    data = bytearray(offset)
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        data[start:start + array.nbytes] = array.tobytes()
+
+    digest = hashlib.sha256(header_bytes)
+    digest.update(data)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(ARTIFACT_MAGIC, SCHEMA_VERSION, len(header_bytes), digest.digest()))
+        f.write(header_bytes)
+        f.write(data)
+    # Reemplazo atomico: los procesos que ya tienen el fichero mapeado conservan la version anterior
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_artifact(path, verify_checksum=True):
+    """
+    Mapea el artefacto en memoria y devuelve (metadata, arrays). Los arrays son vistas de solo
+    lectura sobre el mmap, asi que todos los procesos que cargan el mismo fichero comparten paginas.
+    """
+    try:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"No se pudo abrir el artefacto '{path}': {e}") from e
+
+    if len(buffer) < _PREAMBLE.size:
+        raise ArtifactError(f"Artefacto '{path}' truncado")
+    magic, version, header_len, expected_digest = _PREAMBLE.unpack(buffer[:_PREAMBLE.size].tobytes())
+    if magic != ARTIFACT_MAGIC:
+        raise ArtifactError(f"'{path}' no es un artefacto de modelo de intenciones")
+    if version not in SUPPORTED_SCHEMA_VERSIONS:
+        raise ArtifactError(f"Version de esquema {version} no soportada (se esperaba {SCHEMA_VERSION}); reentrena el modelo")
+
+    data_start = _PREAMBLE.size + header_len
+    if len(buffer) < data_start:
+        raise ArtifactError(f"Artefacto '{path}' truncado")
+    if verify_checksum:
+        digest = hashlib.sha256(memoryview(buffer)[_PREAMBLE.size:])
+        if digest.digest() != expected_digest:
+            raise ArtifactError(f"Checksum invalido en '{path}': el fichero esta corrupto o fue modificado")
+
+    try:
+        header = json.loads(buffer[_PREAMBLE.size:data_start].tobytes().decode('utf-8'))
+    except ValueError as e:
+        raise ArtifactError(f"Cabecera ilegible en '{path}': {e}") from e
+
+    data = buffer[data_start:]
+    arrays = {}
+    for name, spec in header.pop('arrays').items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = spec['offset']
+        end = start + count * dtype.itemsize
+        if end > len(data):
+            raise ArtifactError(f"Array '{name}' fuera de los limites del artefacto '{path}'")
+        arrays[name] = data[start:end].view(dtype).reshape(spec['shape'])
+    return header, arrays
+
+
+def export_model(path, vectorizer, linear_model, intent_labels, intents=None, training=None):
+    """
+    Guarda el IntentVectorizer ajustado y el modelo lineal (LinearSVCModel o LinearOvRModel) en un unico artefacto.
+    De los intents solo se conservan etiqueta y respuestas, no los patrones de entrenamiento.
+    training guarda el estado necesario para seguir entrenando de forma incremental.
+    """
+    arrays = dict(linear_model.arrays())
+    featurizer = getattr(vectorizer, 'featurizer', 'tfidf')
+    if featurizer == 'hashing':
+        # Sin estado: basta con los parametros
+        vectorizer_spec = {'type': 'hashing', 'params': vectorizer.vectorizer.get_params()}
+    else:
+        tfidf = vectorizer.vectorizer
+        params = tfidf.get_params()
+        vectorizer_spec = {
+            'type': 'tfidf',
+            'params': {name: params[name] for name in VECTORIZER_PARAMS},
+            'vocabulary': sorted(tfidf.vocabulary_, key=tfidf.vocabulary_.get),
+        }
+        arrays['idf'] = np.asarray(tfidf.idf_, dtype=np.float64)
+
+    metadata = {
+        'intent_labels': list(intent_labels),
+        'intents': [{k: v for k, v in intent.items() if k != 'patterns'} for intent in intents or []],
+        'vectorizer': vectorizer_spec,
+        'classifier': {'type': linear_model.artifact_type, 'n_classes': linear_model.n_classes},
+    }
+    if training is not None:
+        metadata['training'] = training
+    return save_artifact(path, arrays, metadata)
+
+
+def import_model(path, verify_checksum=True):
+    """Carga un artefacto y devuelve (vectorizer, linear_model, metadata)"""
+    from .preprocessing import IntentVectorizer
+    from .linear_model import MODEL_TYPES
+
+    metadata, arrays = load_artifact(path, verify_checksum=verify_checksum)
+
+    vectorizer_spec = metadata['vectorizer']
+    if vectorizer_spec.get('type', 'tfidf') == 'hashing':
+        params = vectorizer_spec['params']
+        vectorizer = IntentVectorizer(featurizer='hashing', n_features=params['n_features'], char_ngrams=params['char_ngrams'])
+        features = f"{params['n_features']} buckets de hashing"
+    else:
+        params = dict(vectorizer_spec['params'], ngram_range=tuple(vectorizer_spec['params']['ngram_range']))
+        vectorizer = IntentVectorizer(featurizer='tfidf')
+        vectorizer.vectorizer.set_params(**params)
+        vectorizer.vectorizer.vocabulary_ = {term: idx for idx, term in enumerate(vectorizer_spec['vocabulary'])}
+        vectorizer.vectorizer.idf_ = arrays['idf']
+        features = f"{len(vectorizer_spec['vocabulary'])} terminos"
+
+    classifier = metadata['classifier']
+    if classifier['type'] not in MODEL_TYPES:
+        raise ArtifactError(f"Tipo de clasificador desconocido en '{path}': {classifier['type']}")
+    linear_model = MODEL_TYPES[classifier['type']].from_arrays(arrays, classifier['n_classes'])
+    logger.info(f"Artefacto '{path}' cargado (esquema v{metadata['schema_version']}, {len(metadata['intent_labels'])} intenciones, {features})")
+    return vectorizer, linear_model, metadata
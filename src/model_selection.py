@@ -0,0 +1,234 @@
+"""
+Seleccion de modelo para el clasificador local: busqueda en rejilla o aleatoria con validacion
+cruzada estratificada, repartida entre todos los nucleos con un pool de procesos.
+
+El corpus se preprocesa (limpieza + stemming) una sola vez; cada fold solo ajusta el TF-IDF y
+el clasificador. El resultado es una tabla con precision, latencia de inferencia y tamaño del
+modelo de cada configuracion.
+
+Uso:
+    python -m src.model_selection --intents data/nlu.yml --folds 5 --jobs -1
+    python -m src.model_selection --intents data/nlu.yml --search random --n-iter 20 --latency-budget-ms 1
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+from sklearn.svm import SVC
+
+from .linear_model import LinearOvRModel, LinearSVCModel
+
+# Espacio de busqueda por defecto: vectorizador x clasificador
+PARAM_GRID = [
+    {
+        'max_features': [500, 1000, 2000, None],
+        'ngram_range': [(1, 1), (1, 2), (1, 3)],
+        'classifier': ['svc'],
+        'C': [0.1, 1.0, 10.0],
+    },
+    {
+        'max_features': [500, 1000, 2000, None],
+        'ngram_range': [(1, 1), (1, 2), (1, 3)],
+        'classifier': ['sgd'],
+        'alpha': [1e-5, 1e-4, 1e-3],
+    },
+]
+
+# Mensajes por fold con los que se mide la latencia de inferencia (uno a uno, como en el webhook)
+LATENCY_SAMPLES = 50
+
+# Datos compartidos con cada proceso del pool (se envian una vez, no con cada tarea)
+_worker_texts = None
+_worker_labels = None
+
+
+def _init_worker(texts, labels):
+    global _worker_texts, _worker_labels
+    _worker_texts = texts
+    _worker_labels = labels
+    warnings.simplefilter('ignore', FutureWarning)
+
+
+def build_candidate(params):
+    """Crea el vectorizador TF-IDF y el clasificador de una configuracion"""
+    vectorizer = TfidfVectorizer(max_features=params['max_features'], ngram_range=tuple(params['ngram_range']))
+    if params['classifier'] == 'svc':
+        classifier = SVC(kernel='linear', C=params['C'], probability=True, random_state=42)
+    else:
+        classifier = SGDClassifier(loss='log_loss', alpha=params['alpha'], random_state=42)
+    return vectorizer, classifier
+
+
+def export_engine(classifier):
+    """Modelo lineal en NumPy con el que se sirve la configuracion (el mismo que va al artefacto)"""
+    if isinstance(classifier, SVC):
+        return LinearSVCModel.from_svc(classifier)
+    return LinearOvRModel.from_sgd(classifier)
+
+
+def model_size(vectorizer, engine):
+    """Bytes aproximados del artefacto: arrays numericos mas vocabulario"""
+    arrays = sum(array.nbytes for array in engine.arrays().values()) + vectorizer.idf_.nbytes
+    vocabulary = len(json.dumps(sorted(vectorizer.vocabulary_), ensure_ascii=False).encode('utf-8'))
+    return arrays + vocabulary
+
+
+def evaluate_fold(task):
+    """Entrena y evalua una configuracion en un fold (se ejecuta en un proceso del pool)"""
+    candidate_id, params, train_idx, test_idx = task
+    texts, labels = _worker_texts, _worker_labels
+    vectorizer, classifier = build_candidate(params)
+
+    started = time.perf_counter()
+    X_train = vectorizer.fit_transform([texts[i] for i in train_idx])
+    classifier.fit(X_train, labels[train_idx])
+    train_seconds = time.perf_counter() - started
+
+    engine = export_engine(classifier)
+    test_texts = [texts[i] for i in test_idx]
+    predicted = engine.predict_proba(vectorizer.transform(test_texts)).argmax(axis=1)
+    accuracy = accuracy_score(labels[test_idx], classifier.classes_[predicted])
+
+    latencies = []
+    for text in test_texts[:LATENCY_SAMPLES]:
+        started = time.perf_counter()
+        engine.predict_proba(vectorizer.transform([text]))
+        latencies.append(time.perf_counter() - started)
+
+    return {
+        'candidate': candidate_id,
+        'accuracy': accuracy,
+        'train_seconds': train_seconds,
+        'latency_ms': float(np.median(latencies)) * 1000 if latencies else None,
+        'size_bytes': model_size(vectorizer, engine),
+    }
+
+
+def candidates(search='grid', n_iter=20, random_state=42):
+    if search == 'grid':
+        return list(ParameterGrid(PARAM_GRID))
+    return list(ParameterSampler(PARAM_GRID, n_iter=n_iter, random_state=random_state))
+
+
+def run_search(texts, labels, params_list, folds=5, jobs=None):
+    """
+    Evalua todas las configuraciones en todos los folds en paralelo y devuelve la tabla
+    ordenada por precision media (y latencia en caso de empate).
+    """
+    labels = np.asarray(labels)
+    folds = min(folds, int(np.bincount(np.unique(labels, return_inverse=True)[1]).min()))
+    if folds < 2:
+        raise ValueError("Se necesitan al menos 2 ejemplos por intencion para la validacion cruzada")
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    splits = list(splitter.split(np.zeros(len(labels)), labels))
+
+    tasks = [
+        (candidate_id, params, train_idx, test_idx)
+        for candidate_id, params in enumerate(params_list)
+        for train_idx, test_idx in splits
+    ]
+    workers = os.cpu_count() if jobs is None or jobs < 1 else jobs
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(texts, labels)) as executor:
+        results = list(executor.map(evaluate_fold, tasks))
+
+    leaderboard = []
+    for candidate_id, params in enumerate(params_list):
+        fold_results = [r for r in results if r['candidate'] == candidate_id]
+        accuracies = [r['accuracy'] for r in fold_results]
+        leaderboard.append({
+            'params': params,
+            'accuracy': float(np.mean(accuracies)),
+            'accuracy_std': float(np.std(accuracies)),
+            'latency_ms': float(np.median([r['latency_ms'] for r in fold_results])),
+            'size_kb': float(np.mean([r['size_bytes'] for r in fold_results])) / 1024,
+            'train_seconds': float(np.mean([r['train_seconds'] for r in fold_results])),
+        })
+    leaderboard.sort(key=lambda row: (-row['accuracy'], row['latency_ms']))
+    return leaderboard
+
+
+def describe(params):
+    if params['classifier'] == 'svc':
+        model = f"svc C={params['C']}"
+    else:
+        model = f"sgd alpha={params['alpha']}"
+    return f"{model}, max_features={params['max_features']}, ngram={tuple(params['ngram_range'])}"
+
+
+def print_leaderboard(leaderboard, latency_budget_ms=None, top=20):
+    print(f"{'#':>3}  {'precision':>16}  {'latencia':>10}  {'tamaño':>9}  {'entreno':>8}  configuracion")
+    for position, row in enumerate(leaderboard[:top], start=1):
+        over_budget = latency_budget_ms is not None and row['latency_ms'] > latency_budget_ms
+        print(f"{position:>3}  {row['accuracy']:.4f} ± {row['accuracy_std']:.4f}  {row['latency_ms']:8.3f}ms  "
+              f"{row['size_kb']:7.1f}KB  {row['train_seconds']:7.2f}s  {describe(row['params'])}"
+              f"{'  (fuera de presupuesto)' if over_budget else ''}")
+
+    if latency_budget_ms is not None:
+        within = [row for row in leaderboard if row['latency_ms'] <= latency_budget_ms]
+        if within:
+            print(f"\nMejor configuracion dentro de {latency_budget_ms}ms: {describe(within[0]['params'])} "
+                  f"(precision {within[0]['accuracy']:.4f})")
+        else:
+            print(f"\nNinguna configuracion cumple el presupuesto de {latency_budget_ms}ms")
+
+
+def write_leaderboard(path, leaderboard):
+    """Guarda la tabla completa en CSV o JSON segun la extension"""
+    if path.endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(leaderboard, f, indent=2, default=list)
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['accuracy', 'accuracy_std', 'latency_ms', 'size_kb', 'train_seconds', 'params'])
+        for row in leaderboard:
+            writer.writerow([row['accuracy'], row['accuracy_std'], row['latency_ms'], row['size_kb'], row['train_seconds'], json.dumps(row['params'], default=list)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seleccion de modelo con validacion cruzada en paralelo")
+    parser.add_argument('--intents', required=True)
+    parser.add_argument('--search', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--n-iter', type=int, default=20, help="Configuraciones a probar en la busqueda aleatoria")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=-1, help="Procesos (-1 = todos los nucleos)")
+    parser.add_argument('--latency-budget-ms', type=float)
+    parser.add_argument('--output', help="Guardar la tabla completa (.csv o .json)")
+    args = parser.parse_args(argv)
+
+    from .training import ChatbotTrainer
+
+    trainer = ChatbotTrainer()
+    trainer.load_intents(args.intents)
+    patterns, y = trainer.prepare_training_data()
+    labels = [trainer.intent_labels[i] for i in y]
+
+    started = time.perf_counter()
+    texts = trainer.vectorizer.preprocess(patterns, trainer.feature_cache)
+    print(f"{len(texts)} ejemplos preprocesados en {time.perf_counter() - started:.2f}s (una sola vez para todos los folds)")
+
+    params_list = candidates(args.search, args.n_iter)
+    print(f"Evaluando {len(params_list)} configuraciones con {args.folds} folds")
+    started = time.perf_counter()
+    leaderboard = run_search(texts, labels, params_list, folds=args.folds, jobs=args.jobs)
+    print(f"Busqueda completada en {time.perf_counter() - started:.1f}s\n")
+
+    print_leaderboard(leaderboard, args.latency_budget_ms)
+    if args.output:
+        write_leaderboard(args.output, leaderboard)
+        print(f"\nTabla guardada en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
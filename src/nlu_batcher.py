@@ -0,0 +1,263 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def batching_config_from_env():
+    """Lee la configuracion del micro-batching; devuelve None si esta desactivado"""
+    if os.getenv('NLU_BATCH_ENABLED', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    return {
+        'window': float(os.getenv('NLU_BATCH_WINDOW_MS', 20)) / 1000.0,
+        'max_batch': int(os.getenv('NLU_BATCH_MAX_SIZE', 16)),
+    }
+
+
+class _BatchStats:
+    """Contadores comunes a las dos variantes del batcher"""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.batched_messages = 0
+        self.batch_failures = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+
+    def _record_batch(self, size, failed, fallbacks):
+        with self._stats_lock:
+            self.batches += 1
+            self.batched_messages += size
+            self.batch_failures += int(failed)
+            self.fallbacks += fallbacks
+        logger.info(f"Lote de NLU: {size} mensajes, {fallbacks} reenviados individualmente")
+
+    def _record_timeout(self):
+        with self._stats_lock:
+            self.timeouts += 1
+        logger.warning("NLU por lotes sin respuesta dentro del presupuesto: se usa el fallback de RASA.")
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'batched_messages': self.batched_messages,
+                'avg_batch_size': (self.batched_messages / self.batches) if self.batches else 0.0,
+                'batch_failures': self.batch_failures,
+                'fallbacks': self.fallbacks,
+                'timeouts': self.timeouts,
+            }
+
+
+def _remaining(deadline_at):
+    """Segundos que quedan hasta deadline_at (None si no hay plazo)"""
+    return None if deadline_at is None else deadline_at - time.monotonic()
+
+
+def _batch_budget(deadlines):
+    """Presupuesto de la llamada por lotes: el del mensaje con menos tiempo (None si ninguno tiene plazo)"""
+    remaining = [_remaining(deadline_at) for deadline_at in deadlines if deadline_at is not None]
+    return min(remaining) if remaining else None
+
+
+class NLUBatcher(_BatchStats):
+    """
+    Agrupa las peticiones de NLU que llegan casi a la vez (hilos del servidor WSGI) y las
+    clasifica con una sola llamada al LLM.
+
+    batch_fn(mensajes, budget=segundos) devuelve una lista con un resultado (o None) por mensaje;
+    single_fn(mensaje, budget=segundos) es la llamada individual que se usa para los elementos que
+    el lote no pudo resolver. Cada mensaje tiene un presupuesto total (budget, p. ej.
+    GEMINI_NLU_BUDGET) para el lote y su reenvio individual: al agotarse classify() devuelve None
+    (fallback de RASA) y el mensaje ya no se reenvia.
+    """
+
+    def __init__(self, batch_fn, single_fn, window=0.02, max_batch=16, max_workers=4, budget=None):
+        super().__init__()
+        self.batch_fn = batch_fn
+        self.single_fn = single_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.max_workers = max_workers
+        self.budget = budget
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._executor = None
+        self._pid = None
+
+    def _ensure_started(self):
+        """Arranca el hilo colector en el proceso actual (tambien tras un fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._queue = queue.Queue()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='nlu-batch')
+            threading.Thread(target=self._collect, name='nlu-batch-collector', daemon=True).start()
+            self._pid = pid
+
+    def classify(self, message, timeout=None):
+        """Encola el mensaje y espera su resultado de NLU (o None si falla o se agota el presupuesto)"""
+        self._ensure_started()
+        timeout = self.budget if timeout is None else timeout
+        future = Future()
+        self._queue.put((message, future, None if timeout is None else time.monotonic() + timeout))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._record_timeout()
+            return None
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    @staticmethod
+    def _settle(future, result=None, error=None):
+        """Resuelve el future salvo que quien esperaba ya se haya rendido (cancelado)"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _dispatch(self, batch):
+        batch = [item for item in batch if not item[1].cancelled()]
+        messages = [message for message, _, _ in batch]
+        budget = _batch_budget(deadline_at for _, _, deadline_at in batch)
+        if len(batch) <= 1 or (budget is not None and budget <= 0):
+            results, failed = [None] * len(batch), False
+        else:
+            try:
+                results, failed = list(self.batch_fn(messages, budget=budget)), False
+            except Exception as e:
+                logger.error(f"Error en el lote de NLU, se reenvía mensaje a mensaje: {e}")
+                results, failed = [None] * len(batch), True
+
+        fallbacks = 0
+        for index, (message, future, deadline_at) in enumerate(batch):
+            result = results[index] if index < len(results) else None
+            if result is not None:
+                self._settle(future, result)
+                continue
+            remaining = _remaining(deadline_at)
+            if future.cancelled() or (remaining is not None and remaining <= 0):
+                # Sin presupuesto no se reenvia: classify() ya devuelve (o devolvera) None
+                self._settle(future, None)
+                continue
+            fallbacks += int(len(batch) > 1)
+            self._executor.submit(self._resolve_single, message, future, remaining)
+        if len(batch) > 1:
+            self._record_batch(len(batch), failed, fallbacks)
+
+    def _resolve_single(self, message, future, budget):
+        if future.cancelled():
+            return
+        try:
+            self._settle(future, self.single_fn(message, budget=budget))
+        except Exception as e:
+            self._settle(future, error=e)
+
+
+class AsyncNLUBatcher(_BatchStats):
+    """
+    Variante asyncio del batcher para el modo ASGI. batch_fn y single_fn son corrutinas
+    con el mismo contrato (y el mismo presupuesto por mensaje) que en NLUBatcher.
+    """
+
+    def __init__(self, batch_fn, single_fn, window=0.02, max_batch=16, budget=None):
+        super().__init__()
+        self.batch_fn = batch_fn
+        self.single_fn = single_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.budget = budget
+        self._pending = []
+        self._timer = None
+
+    async def classify(self, message, timeout=None):
+        """Encola el mensaje y espera su resultado de NLU (o None si falla o se agota el presupuesto)"""
+        loop = asyncio.get_running_loop()
+        timeout = self.budget if timeout is None else timeout
+        future = loop.create_future()
+        self._pending.append((message, future, None if timeout is None else time.monotonic() + timeout))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self._record_timeout()
+            return None
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        batch = [item for item in batch if not item[1].done()]
+        messages = [message for message, _, _ in batch]
+        budget = _batch_budget(deadline_at for _, _, deadline_at in batch)
+        if len(batch) <= 1 or (budget is not None and budget <= 0):
+            results, failed = [None] * len(batch), False
+        else:
+            try:
+                results, failed = list(await self.batch_fn(messages, budget=budget)), False
+            except Exception as e:
+                logger.error(f"Error en el lote de NLU, se reenvía mensaje a mensaje: {e}")
+                results, failed = [None] * len(batch), True
+
+        retries = []
+        for index, (message, future, deadline_at) in enumerate(batch):
+            result = results[index] if index < len(results) else None
+            remaining = _remaining(deadline_at)
+            if future.done():
+                continue
+            if result is not None:
+                future.set_result(result)
+            elif remaining is not None and remaining <= 0:
+                future.set_result(None)
+            else:
+                retries.append(self._resolve_single(message, future, remaining))
+        if len(batch) > 1:
+            self._record_batch(len(batch), failed, len(retries))
+        if retries:
+            await asyncio.gather(*retries)
+
+    async def _resolve_single(self, message, future, budget):
+        try:
+            result = await self.single_fn(message, budget=budget)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
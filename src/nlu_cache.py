@@ -0,0 +1,215 @@
+import os
+import json
+import copy
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from .text_normalization import key_text
+
+logger = logging.getLogger(__name__)
+
+def schema_version(*parts):
+    """Huella corta del esquema de intenciones/entidades (y del prompt) usado por el NLU"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+class MemoryCacheBackend:
+    """Backend en memoria del proceso: LRU acotado con TTL"""
+
+    def __init__(self, max_size=1024, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Devuelve (valor, expirado). valor es None si no esta o ha caducado"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None, False
+            value, created = item
+            if self.ttl and time.time() - created > self.ttl:
+                del self._data[key]
+                return None, True
+            self._data.move_to_end(key)
+            return copy.deepcopy(value), False
+
+    def set(self, key, value):
+        """Guarda el valor y devuelve cuantas entradas se han desalojado"""
+        evicted = 0
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCacheBackend:
+    """
+    Backend compartido entre workers de la misma maquina, sobre un fichero SQLite (modo WAL).
+    El LRU se aproxima con la marca de ultimo acceso de cada fila.
+    """
+
+    def __init__(self, path, max_size=1024, ttl=3600, table='nlu_cache'):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.table = table
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, False
+        value, created = row
+        now = time.time()
+        if self.ttl and now - created > self.ttl:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            return None, True
+        conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value), False
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now, now),
+        )
+        excess = len(self) - self.max_size
+        if excess <= 0:
+            return 0
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY accessed ASC LIMIT ?)",
+            (excess,),
+        )
+        return excess
+
+    def clear(self):
+        self._connect().execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class NLUCache:
+    """
+    Cache de resultados de NLU de Gemini, con clave = version del esquema + texto normalizado.
+
+    Si la version del esquema cambia (VALID_INTENTS / VALID_ENTITIES), el backend se vacia
+    automaticamente.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls):
+        """Construye la cache segun NLU_CACHE_BACKEND ('memory', 'sqlite' o 'none')"""
+        kind = os.getenv('NLU_CACHE_BACKEND', 'memory').lower()
+        max_size = int(os.getenv('NLU_CACHE_SIZE', 1024))
+        ttl = float(os.getenv('NLU_CACHE_TTL', 3600))
+        if kind == 'none':
+            return None
+        if kind == 'sqlite':
+            backend = SQLiteCacheBackend(os.getenv('NLU_CACHE_PATH', 'nlu_cache.sqlite3'), max_size, ttl)
+        else:
+            backend = MemoryCacheBackend(max_size, ttl)
+        logger.info(f"Cache de NLU activa (backend={kind}, tamaño={max_size}, ttl={ttl}s)")
+        return cls(backend)
+
+    def _check_version(self, version):
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"Esquema de NLU cambiado ({self._version} -> {version}); vaciando la cache.")
+                    self.backend.clear()
+                    self.invalidations += 1
+                self._version = version
+
+    def key(self, text, version):
+        """Clave del mensaje normalizado; None si no queda texto (solo emojis o signos)"""
+        text = key_text(text)
+        return f"{version}:{text}" if text else None
+
+    def get(self, text, version):
+        self._check_version(version)
+        key = self.key(text, version)
+        if key is None:
+            # Mensajes distintos sin texto normalizado ("👍", "😡") compartirian la clave vacia
+            with self._lock:
+                self.misses += 1
+            return None
+        value, expired = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self.expirations += int(expired)
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, text, version, value):
+        self._check_version(version)
+        key = self.key(text, version)
+        if key is None:
+            return
+        evicted = self.backend.set(key, value)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'size': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'schema_version': self._version,
+        }
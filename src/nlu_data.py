@@ -0,0 +1,62 @@
+import os
+import re
+
+import yaml
+
+# [texto](entidad), [texto](entidad:valor) y [texto]{"entity": ...}
+ENTITY_ANNOTATION = re.compile(r'\[([^\]]+)\](?:\([^)]*\)|\{[^}]*\})')
+
+
+def strip_entity_annotations(text):
+    """Quita las anotaciones de entidades de Rasa y deja solo el texto plano"""
+    return ENTITY_ANNOTATION.sub(r'\1', text).strip()
+
+
+def _iter_block_examples(examples):
+    """Ejemplos en formato bloque ("- ejemplo" por linea) o lista de {text: ...}"""
+    if isinstance(examples, str):
+        for line in examples.splitlines():
+            line = line.strip()
+            if line.startswith('- '):
+                yield line[2:]
+        return
+    for example in examples or []:
+        text = example.get('text') if isinstance(example, dict) else example
+        if isinstance(text, str):
+            yield text
+
+
+def _nlu_files(path):
+    if os.path.isdir(path):
+        for root, _, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                if name.endswith(('.yml', '.yaml')):
+                    yield os.path.join(root, name)
+    else:
+        yield path
+
+
+def iter_nlu_examples(path):
+    """
+    Recorre los ficheros NLU de Rasa (un .yml o un directorio como data/) y va devolviendo
+    (intencion, texto) con las anotaciones de entidades eliminadas. Ignora sinonimos,
+    regex y lookups, y los ficheros sin seccion 'nlu' (stories, rules...).
+    """
+    for filename in _nlu_files(path):
+        with open(filename, 'r', encoding='utf-8') as f:
+            document = yaml.safe_load(f) or {}
+        for item in document.get('nlu') or []:
+            if not isinstance(item, dict) or 'intent' not in item:
+                continue
+            for example in _iter_block_examples(item.get('examples')):
+                text = strip_entity_annotations(example)
+                if text:
+                    yield item['intent'], text
+
+
+def load_nlu_intents(path):
+    """Agrupa los ejemplos en el formato de intents del entrenador: [{'tag', 'patterns'}]"""
+    intents = {}
+    for intent, text in iter_nlu_examples(path):
+        intents.setdefault(intent, []).append(text)
+    return [{'tag': tag, 'patterns': patterns} for tag, patterns in intents.items()]
@@ -0,0 +1,101 @@
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Intenciones que suelen llevar entidades (el modelo local no las extrae) o que son
+# delicadas: siempre se envian a Gemini aunque el modelo local este seguro.
+DEFAULT_ESCALATE_INTENTS = [
+    "switch_domain", "consultar_producto", "verificar_stock", "estado_pedido", "recomendar_producto",
+    "consultar_saldo", "realizar_transferencia", "bloquear_tarjeta",
+    "agendar_cita", "consultar_sintoma", "informacion_medicamento", "contacto_emergencia",
+    "pregunta_abierta", "nlu_fallback",
+]
+
+
+def load_local_classifier(model_dir):
+    """Carga el clasificador local (SVC) si existe un modelo entrenado; devuelve None si no"""
+    try:
+        from .chatbot import Chatbot
+    except ImportError as e:
+        logger.warning(f"No se pudo importar el clasificador local: {e}")
+        return None
+
+    chatbot = Chatbot(model_dir=model_dir)
+    if not chatbot.model:
+        logger.warning(f"No hay modelo local en '{model_dir}'. El modo hybrid escalará todo a Gemini.")
+        return None
+    return chatbot
+
+
+class HybridNLURouter:
+    """
+    Enrutador NLU por confianza: primero el modelo local y, solo si hace falta, Gemini.
+
+    Lleva la cuenta de que camino toma cada peticion para medir cuantas llamadas
+    al LLM se ahorran.
+    """
+
+    def __init__(self, classifier, valid_intents, threshold=0.75, escalate_intents=None):
+        self.classifier = classifier
+        self.valid_intents = set(valid_intents)
+        self.threshold = threshold
+        self.escalate_intents = set(DEFAULT_ESCALATE_INTENTS if escalate_intents is None else escalate_intents)
+
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    @classmethod
+    def from_env(cls, valid_intents):
+        """Construye el enrutador leyendo la configuracion de variables de entorno"""
+        escalate = os.getenv('HYBRID_ESCALATE_INTENTS')
+        return cls(
+            load_local_classifier(os.getenv('LOCAL_NLU_MODEL_DIR', 'models/')),
+            valid_intents,
+            threshold=float(os.getenv('HYBRID_CONFIDENCE_THRESHOLD', 0.75)),
+            escalate_intents=[i.strip() for i in escalate.split(',') if i.strip()] if escalate is not None else None,
+        )
+
+    def local_decision(self, user_message):
+        """
+        Clasifica con el modelo local. Devuelve (nlu_data, motivo); nlu_data es None
+        cuando hay que escalar a Gemini y el motivo explica por que.
+        """
+        if self.classifier is None:
+            return None, 'sin_modelo_local'
+
+        intent, confidence = self.classifier.predict_intent(user_message)
+        confidence = float(confidence)
+
+        if intent is None or intent not in self.valid_intents:
+            return None, 'intent_desconocido'
+        if intent in self.escalate_intents:
+            return None, 'intent_escalado'
+        if confidence < self.threshold:
+            return None, 'baja_confianza'
+
+        return {"intent": intent, "entities": [], "confidence": confidence}, 'confianza_alta'
+
+    def record(self, path, reason):
+        """Registra el camino tomado por una peticion ('local', 'gemini' o 'gemini_fallido')"""
+        key = f"{path}:{reason}"
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+        logger.info(f"Router NLU hybrid: camino={path}, motivo={reason}")
+
+    def stats(self):
+        """Resumen de caminos tomados y llamadas al LLM ahorradas"""
+        with self._lock:
+            counters = dict(self.counters)
+        total = sum(counters.values())
+        local = sum(v for k, v in counters.items() if k.startswith('local:'))
+        return {
+            'total': total,
+            'local': local,
+            'escalated': total - local,
+            'llm_calls_saved_ratio': (local / total) if total else 0.0,
+            'threshold': self.threshold,
+            'local_model_loaded': self.classifier is not None,
+            'paths': counters,
+        }
@@ -1,8 +1,15 @@
-import re
+import os
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
 import nltk
 from nltk.stem import SnowballStemmer
 from nltk.corpus import stopwords
-from sklearn.feature_extraction.text import TfidfVectorizer
+from nltk.tokenize import NLTKWordTokenizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from .text_normalization import clean_text, remove_accents
 
 #Descarga recursos necesarios de NLTK
 try:
@@ -15,39 +22,75 @@ try:
 except LookupError:
     nltk.download('punkt')
 
+# Tamaño de la cache de stems (palabras distintas que se recuerdan ya reducidas)
+STEM_CACHE_SIZE = 50000
+
+# Por debajo de este numero de textos no compensa arrancar procesos
+PARALLEL_MIN_TEXTS = 2000
+
+# Featurizador por defecto de IntentVectorizer ('tfidf' o 'hashing')
+DEFAULT_FEATURIZER = 'tfidf'
+
+# Buckets del featurizador de hashing (potencia de 2; la memoria no depende del vocabulario)
+HASHING_FEATURES = 2 ** 18
+
+# Tras clean_text solo quedan letras ASCII, digitos y espacios, asi que word_tokenize equivale
+# a separar por espacios salvo en las contracciones inglesas que su tokenizador parte ("cannot")
+_word_tokenizer = NLTKWordTokenizer()
+_CONTRACTION_PATTERNS = NLTKWordTokenizer.CONTRACTIONS2 + NLTKWordTokenizer.CONTRACTIONS3
+
+
+def _init_worker(preprocessor):
+    global _worker_preprocessor
+    _worker_preprocessor = preprocessor
+
+
+def _preprocess_in_worker(text):
+    return _worker_preprocessor.preprocess(text)
+
+
 class TextPreprocessor:
-    def __init__(self):
+    def __init__(self, stem_cache_size=STEM_CACHE_SIZE):
         self.stemmer = SnowballStemmer('spanish')
         self.stop_words = set(stopwords.words('spanish'))
+        self.stem_cache_size = stem_cache_size
 
-    def clean_text(self, text):
-        """Limpia y normaliza el texto"""
-        #Convertir a minusculas
-        text = text.lower()
-
-        #Remover acentos
-        text = self.remove_accents(text)
-
-        #Remover caracteres especiales pero mantener espacios
-        text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
+    def __getstate__(self):
+        # La cache de stems no se guarda con el modelo (ni se envia a los procesos)
+        state = self.__dict__.copy()
+        state.pop('_cached_stem', None)
+        return state
 
-        #Remover espacios extra
-        text = re.sub(r'\s+', ' ', text).strip()
+    def clean_text(self, text):
+        """Limpia y normaliza el texto (minusculas, sin acentos ni caracteres especiales)"""
+        # Compartida con el detector de emergencias del gateway (src/text_normalization.py)
+        return clean_text(text)
 
-        return text
-    
     def remove_accents(self, text):
         """Remueve acentos del texto"""
-        return ''.join(c for c in unicodedata.normalize('NFD', text)
-                       if unicodedata.category(c) != 'Mn')
+        return remove_accents(text)
+
+    def stem(self, token):
+        """Stem de una palabra, memorizado en una cache LRU acotada"""
+        cached_stem = self.__dict__.get('_cached_stem')
+        if cached_stem is None:
+            # Los modelos guardados antes de existir la cache no tienen stem_cache_size
+            size = getattr(self, 'stem_cache_size', STEM_CACHE_SIZE)
+            cached_stem = self._cached_stem = lru_cache(maxsize=size)(self.stemmer.stem)
+        return cached_stem(token)
     
     #Separa cada palabra de la oracion
     def tokenize(self, text):
         """Tokeniza el texto"""
-        tokens = nltk.word_tokenize(text)
+        # El tokenizador de NLTK rodea el texto de espacios antes de aplicar sus patrones
+        padded = f" {text} "
+        if any(pattern.search(padded) for pattern in _CONTRACTION_PATTERNS):
+            tokens = _word_tokenizer.tokenize(text)
+        else:
+            tokens = text.split()
         # Filtrar stopwords y aplicar stemming
         stemmed_tokens = [
-            self.stemmer.stem(token)
+            self.stem(token)
             for token in tokens
             if token not in self.stop_words and len(token) > 2
         ]
@@ -59,25 +102,104 @@ class TextPreprocessor:
         processed = self.tokenize(cleaned)
         return processed
 
-class IntentVectorizer:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            ngram_range=(1, 2),
-            stop_words=None #Ya se manejo stopwors en este mismo archivo
+    def preprocess_batch(self, texts, n_jobs=1, chunksize=256):
+        """
+        Preprocesa un iterable de textos y devuelve los resultados en el mismo orden, a medida
+        que estan listos. Con n_jobs > 1 y corpus grandes reparte el trabajo entre procesos.
+        """
+        if n_jobs == 1:
+            for text in texts:
+                yield self.preprocess(text)
+            return
+
+        texts = list(texts)
+        if len(texts) < PARALLEL_MIN_TEXTS:
+            for text in texts:
+                yield self.preprocess(text)
+            return
+
+        workers = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+            yield from executor.map(_preprocess_in_worker, texts, chunksize=chunksize)
+
+class HashingFeaturizer:
+    """
+    Alternativa sin estado al TF-IDF: cada palabra y bigrama (y opcionalmente cada n-grama de
+    caracteres) se asigna a uno de n_features buckets con un hash. No guarda vocabulario, asi
+    que la memoria es fija aunque crezca el corpus, transform no depende del ajuste y los
+    terminos nuevos cuentan desde el primer momento (util con el entrenamiento incremental).
+    """
+
+    def __init__(self, n_features=HASHING_FEATURES, char_ngrams=False, ngram_range=(1, 2), char_ngram_range=(3, 5)):
+        self.n_features = n_features
+        self.char_ngrams = char_ngrams
+        self.ngram_range = tuple(ngram_range)
+        self.char_ngram_range = tuple(char_ngram_range)
+        self.word_vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=self.ngram_range, alternate_sign=False, norm='l2'
         )
-        self.preprocessor = TextPreprocessor()
+        # Los n-gramas de caracteres comparten los mismos buckets que las palabras
+        self.char_vectorizer = HashingVectorizer(
+            n_features=n_features, analyzer='char_wb', ngram_range=self.char_ngram_range, alternate_sign=False, norm='l2'
+        ) if char_ngrams else None
+
+    def get_params(self):
+        return {
+            'n_features': self.n_features,
+            'char_ngrams': self.char_ngrams,
+            'ngram_range': list(self.ngram_range),
+            'char_ngram_range': list(self.char_ngram_range),
+        }
+
+    def transform(self, texts):
+        X = self.word_vectorizer.transform(texts)
+        if self.char_vectorizer is not None:
+            X = normalize(X + self.char_vectorizer.transform(texts))
+        return X
 
     def fit_transform(self, texts):
+        """No hay nada que ajustar: equivale a transform"""
+        return self.transform(texts)
+
+
+class IntentVectorizer:
+    def __init__(self, n_jobs=None, featurizer=None, n_features=None, char_ngrams=None):
+        # Featurizador: 'tfidf' (vocabulario de 1000 terminos) o 'hashing' (NLU_FEATURIZER)
+        self.featurizer = (featurizer or os.getenv('NLU_FEATURIZER', DEFAULT_FEATURIZER)).lower()
+        if self.featurizer == 'hashing':
+            self.vectorizer = HashingFeaturizer(
+                n_features=int(os.getenv('NLU_HASHING_FEATURES', HASHING_FEATURES)) if n_features is None else n_features,
+                char_ngrams=os.getenv('NLU_HASHING_CHAR_NGRAMS', '0').lower() in ('1', 'true', 'yes') if char_ngrams is None else char_ngrams,
+            )
+        elif self.featurizer == 'tfidf':
+            self.vectorizer = TfidfVectorizer(
+                max_features=1000,
+                ngram_range=(1, 2),
+                stop_words=None #Ya se manejo stopwors en este mismo archivo
+            )
+        else:
+            raise ValueError(f"Featurizador desconocido: {self.featurizer} (usa 'tfidf' o 'hashing')")
+        self.preprocessor = TextPreprocessor()
+        # Procesos para preprocesar corpus grandes (PREPROCESS_JOBS; -1 = todos los nucleos)
+        self.n_jobs = int(os.getenv('PREPROCESS_JOBS', 1)) if n_jobs is None else n_jobs
+
+    def preprocess(self, texts, feature_cache=None):
+        """Preprocesa los textos en lote; con feature_cache solo se procesan los que no esten en ella"""
+        n_jobs = getattr(self, 'n_jobs', 1)
+        if feature_cache is not None:
+            return feature_cache.preprocess(list(texts), self.preprocessor, n_jobs=n_jobs)
+        return list(self.preprocessor.preprocess_batch(texts, n_jobs=n_jobs))
+
+    def fit_transform(self, texts, feature_cache=None):
         """Ajusta el vectorizador y transforma los textos"""
-        processed_texts = [self.preprocessor.preprocess(text) for text in texts]
+        processed_texts = self.preprocess(texts, feature_cache)
         return self.vectorizer.fit_transform(processed_texts)
     
     def transform(self, texts):
         """Transforma los textos usando el vectorizador"""
         if isinstance(texts, str):
             texts = [texts]
-        processed_texts = [self.preprocessor.preprocess(text) for text in texts]
+        processed_texts = self.preprocess(texts)
         return self.vectorizer.transform(processed_texts)
 
 
@@ -0,0 +1,264 @@
+import os
+import socket
+import asyncio
+import threading
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # Solo es necesario para el modo ASGI
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class RasaPoolTimeout(requests.exceptions.Timeout):
+    """Se agoto el plazo total esperando una conexion libre del pool"""
+
+
+def limit_reads(response, deadline_at, read_timeout):
+    """
+    Limita cada lectura del socket de esta respuesta al tiempo que queda hasta deadline_at. El
+    timeout de lectura de requests es por lectura: un cuerpo que llega poco a poco lo cumple en
+    cada una y aun asi supera el plazo total. Solo se envuelve el fichero (socket.SocketIO) que
+    http.client abrio para esta respuesta, asi que la conexion no se toca una vez devuelta al
+    pool. Devuelve False si urllib3 no expone ese fichero.
+    """
+    fp = getattr(response.raw, '_fp', None)  # http.client.HTTPResponse
+    raw = getattr(getattr(fp, 'fp', None), 'raw', None)
+    sock = getattr(raw, '_sock', None)
+    if sock is None:
+        return False
+    readinto = raw.readinto
+
+    def limited_readinto(buffer):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("Plazo total agotado leyendo la respuesta")
+        sock.settimeout(min(read_timeout, remaining))
+        return readinto(buffer)
+
+    raw.readinto = limited_readinto
+    return True
+
+
+class RasaClient:
+    """
+    Cliente HTTP con conexiones persistentes (keep-alive) hacia el servidor de RASA.
+
+    Cada proceso (worker de gunicorn) crea su propia sesion de forma perezosa, de modo
+    que los sockets nunca se comparten entre procesos despues de un fork.
+    """
+
+    def __init__(self, url, pool_size=10, connect_timeout=2.0, read_timeout=15.0, deadline=20.0):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._session = None
+        self._pid = None
+
+        # Estadisticas del pool
+        self.in_use = 0
+        self.waits = 0
+        self.requests = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls, url):
+        """Construye el cliente leyendo la configuracion de variables de entorno"""
+        return cls(
+            url,
+            pool_size=int(os.getenv('RASA_POOL_SIZE', 10)),
+            connect_timeout=float(os.getenv('RASA_CONNECT_TIMEOUT', 2.0)),
+            read_timeout=float(os.getenv('RASA_READ_TIMEOUT', 15.0)),
+            deadline=float(os.getenv('RASA_REQUEST_DEADLINE', 20.0)),
+        )
+
+    def _get_session(self):
+        """Devuelve la sesion del proceso actual, creandola si es necesario"""
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=self.pool_size,
+                        pool_block=True,
+                        max_retries=0,
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = pid
+                    self._slots = threading.BoundedSemaphore(self.pool_size)
+                    self.in_use = 0
+        return self._session
+
+    def _acquire(self, budget):
+        """Reserva una conexion del pool respetando el plazo total"""
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            self.waits += 1
+        if not self._slots.acquire(timeout=max(budget, 0)):
+            with self._lock:
+                self.timeouts += 1
+            raise RasaPoolTimeout(f"No hay conexiones libres hacia RASA tras {budget:.2f}s")
+
+    def post(self, payload, deadline=None):
+        """Envia un mensaje a RASA y devuelve la respuesta JSON"""
+        deadline = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        deadline_at = start + deadline
+        session = self._get_session()
+
+        self._acquire(deadline)
+        with self._lock:
+            self.in_use += 1
+            self.requests += 1
+        try:
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                with self._lock:
+                    self.timeouts += 1
+                raise requests.exceptions.Timeout(f"Plazo de {deadline:.2f}s agotado antes de llamar a RASA")
+            timeout = (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+            try:
+                response = session.post(self.url, json=payload, timeout=timeout, stream=True)
+            except requests.exceptions.Timeout:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+            limit_reads(response, deadline_at, self.read_timeout)
+            try:
+                response.content  # lee el cuerpo completo dentro del plazo
+            except requests.exceptions.RequestException:
+                # La lectura cortada por el plazo llega como ConnectionError de requests
+                if time.monotonic() >= deadline_at:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise requests.exceptions.Timeout(f"Plazo de {deadline:.2f}s agotado leyendo la respuesta de RASA")
+                raise
+            finally:
+                response.close()
+            response.raise_for_status()
+            return response.json()
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def _idle_connections(self):
+        """Cuenta las conexiones abiertas que esperan en el pool de urllib3"""
+        if self._session is None:
+            return 0
+        adapter = self._session.get_adapter(self.url)
+        idle = 0
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None and conn.sock is not None)
+        return idle
+
+    def stats(self):
+        """Estadisticas del pool para dimensionarlo frente al numero de workers"""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'pool_size': self.pool_size,
+                'in_use': self.in_use,
+                'idle': self._idle_connections(),
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'requests': self.requests,
+            }
+
+
+class AsyncRasaClient:
+    """
+    Version asincrona del cliente de RASA (aiohttp) para el modo ASGI del gateway.
+
+    La sesion se crea dentro del event loop en la primera peticion y mantiene un pool
+    keep-alive limitado a pool_size conexiones simultaneas.
+    """
+
+    def __init__(self, url, pool_size=100, connect_timeout=2.0, read_timeout=15.0, deadline=20.0):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self._session = None
+
+        self.in_use = 0
+        self.requests = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls, url):
+        """Construye el cliente leyendo la configuracion de variables de entorno"""
+        return cls(
+            url,
+            pool_size=int(os.getenv('RASA_ASYNC_POOL_SIZE', 100)),
+            connect_timeout=float(os.getenv('RASA_CONNECT_TIMEOUT', 2.0)),
+            read_timeout=float(os.getenv('RASA_READ_TIMEOUT', 15.0)),
+            deadline=float(os.getenv('RASA_REQUEST_DEADLINE', 20.0)),
+        )
+
+    def _get_session(self):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp no esta instalado; es necesario para el modo ASGI del gateway")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def post(self, payload, deadline=None):
+        """Envia un mensaje a RASA y devuelve la respuesta JSON"""
+        session = self._get_session()
+        deadline = self.deadline if deadline is None else deadline
+        timeout = aiohttp.ClientTimeout(
+            total=deadline,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self.in_use += 1
+        self.requests += 1
+        try:
+            async with session.post(self.url, json=payload, timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.json()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.in_use -= 1
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def stats(self):
+        """Estadisticas del pool asincrono"""
+        connector = self._session.connector if self._session is not None else None
+        waits = len(getattr(connector, '_waiters', None) or ()) if connector is not None else 0
+        return {
+            'pid': os.getpid(),
+            'pool_size': self.pool_size,
+            'in_use': self.in_use,
+            'idle': sum(len(conns) for conns in getattr(connector, '_conns', {}).values()) if connector is not None else 0,
+            'waits': waits,
+            'timeouts': self.timeouts,
+            'requests': self.requests,
+        }
@@ -0,0 +1,404 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+
+logger = logging.getLogger(__name__)
+
+# Estados del circuit breaker; su posicion es el valor numerico que se exporta como metrica
+BREAKER_STATES = ('closed', 'half_open', 'open')
+
+
+class CircuitOpenError(Exception):
+    """El circuit breaker esta abierto: se falla rapido sin llamar al servicio"""
+
+
+class DeadlineExceeded(Exception):
+    """Se agoto el presupuesto de latencia de la peticion"""
+
+
+class Deadline:
+    """Presupuesto de latencia de una peticion"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias de exito para estimar el p95"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de error sobre las ultimas `window` llamadas.
+
+    closed -> open cuando la tasa de error supera el umbral (con al menos min_calls llamadas);
+    open -> half_open tras open_seconds; half_open deja pasar una llamada de prueba y vuelve a
+    closed si tiene exito o a open si falla. on_transition(anterior, nuevo), si se indica, recibe
+    cada cambio de estado (p. ej. para contarlo en una metrica).
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=20, open_seconds=30.0, on_transition=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.on_transition = on_transition
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.transitions = {}
+        self.short_circuited = 0
+        self.successes = 0
+        self.failures = 0
+
+    def _transition(self, new_state):
+        old_state, self.state = self.state, new_state
+        key = f"{old_state}->{new_state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        if new_state == 'open':
+            self._opened_at = time.monotonic()
+            logger.warning(f"Circuit breaker '{self.name}': {old_state} -> open (fallando rápido durante {self.open_seconds:.0f}s)")
+        else:
+            logger.info(f"Circuit breaker '{self.name}': {old_state} -> {new_state}")
+        if self.on_transition is not None:
+            self.on_transition(old_state, new_state)
+
+    @property
+    def state_value(self):
+        """0 closed, 1 half_open, 2 open"""
+        return BREAKER_STATES.index(self.state)
+
+    def allow(self):
+        """Indica si se puede llamar al servicio ahora"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.short_circuited += 1
+                    return False
+                self._transition('half_open')
+            if self.state == 'half_open':
+                if self._probe_in_flight:
+                    self.short_circuited += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._outcomes.append(True)
+            if self.state == 'half_open':
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                self._transition('closed')
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._outcomes.append(False)
+            if self.state == 'half_open':
+                self._probe_in_flight = False
+                self._transition('open')
+                return
+            if self.state == 'closed' and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._transition('open')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'successes': self.successes,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited,
+                'transitions': dict(self.transitions),
+            }
+
+
+class ResilientCaller:
+    """
+    Capa de resiliencia para llamadas a Gemini, compartida por el gateway y el servidor de acciones.
+
+    - Presupuesto de latencia por peticion: ningun intento ni espera lo supera.
+    - Reintentos con backoff exponencial y jitter, solo si queda presupuesto.
+    - Circuit breaker que falla rapido (CircuitOpenError) cuando la tasa de error se dispara.
+    - Peticion de cobertura (hedge) opcional lanzada tras el p95 observado.
+
+    Las excepciones de `breaker_ignores` (p. ej. JSON mal formado) se reintentan pero no cuentan
+    como caida del servicio.
+
+    La funcion de cada intento recibe el tiempo que le queda (fn(timeout)) para pasarlo como
+    timeout al SDK. Un hilo no se puede interrumpir: si el intento sigue en curso cuando vence el
+    plazo o gana el hedge, se abandona y on_abandon(future), si se indica, lo recibe para que siga
+    contando contra el limite de concurrencia hasta que termine.
+    """
+
+    def __init__(self, name, budget=8.0, max_attempts=2, backoff_base=0.25, backoff_max=2.0,
+                 breaker=None, hedge=False, hedge_min_delay=0.2, breaker_ignores=(ValueError,), on_abandon=None):
+        self.name = name
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(name)
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker_ignores = breaker_ignores
+        self.on_abandon = on_abandon
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix=f"{name}-call")
+
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.abandoned = 0
+        self.abandoned_in_flight = 0
+
+    @classmethod
+    def from_env(cls, name, prefix='GEMINI', budget=8.0, max_attempts=2, on_abandon=None, on_transition=None):
+        """Construye la capa leyendo <prefix>_BUDGET, <prefix>_MAX_ATTEMPTS, GEMINI_BREAKER_* y GEMINI_HEDGE_*"""
+        breaker = CircuitBreaker(
+            name,
+            failure_rate=float(os.getenv('GEMINI_BREAKER_FAILURE_RATE', 0.5)),
+            min_calls=int(os.getenv('GEMINI_BREAKER_MIN_CALLS', 10)),
+            window=int(os.getenv('GEMINI_BREAKER_WINDOW', 20)),
+            open_seconds=float(os.getenv('GEMINI_BREAKER_OPEN_SECONDS', 30)),
+            on_transition=on_transition,
+        )
+        return cls(
+            name,
+            budget=float(os.getenv(f'{prefix}_BUDGET', budget)),
+            max_attempts=int(os.getenv(f'{prefix}_MAX_ATTEMPTS', max_attempts)),
+            backoff_base=float(os.getenv('GEMINI_BACKOFF_BASE', 0.25)),
+            backoff_max=float(os.getenv('GEMINI_BACKOFF_MAX', 2.0)),
+            breaker=breaker,
+            hedge=os.getenv('GEMINI_HEDGE_ENABLED', '0').lower() in ('1', 'true', 'yes'),
+            hedge_min_delay=float(os.getenv('GEMINI_HEDGE_MIN_DELAY', 0.2)),
+            on_abandon=on_abandon,
+        )
+
+    def _count(self, attr, amount=1):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + amount)
+
+    def _backoff(self, attempt):
+        """Backoff exponencial con jitter completo"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _hedge_delay(self):
+        p95 = self.latency.percentile(0.95)
+        return max(self.hedge_min_delay, p95) if p95 is not None else None
+
+    def record(self, error, latency=None):
+        """Registra el resultado de una llamada hecha fuera de call() (p. ej. un stream)"""
+        if error is None:
+            self.breaker.record_success()
+            if latency is not None:
+                self.latency.record(latency)
+        elif isinstance(error, self.breaker_ignores):
+            # El servicio respondió (aunque mal): no es una caída
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def _abandon(self, future):
+        """Deja de esperar una llamada que sigue en curso (plazo vencido o hedge perdedor)"""
+        if future.cancel():
+            # Aun no habia empezado: no llega a llamar al servicio
+            return
+        with self._lock:
+            self.abandoned += 1
+            self.abandoned_in_flight += 1
+        future.add_done_callback(lambda _: self._count('abandoned_in_flight', -1))
+        if self.on_abandon is not None:
+            self.on_abandon(future)
+
+    def _attempt(self, fn, remaining):
+        """Un intento síncrono (con hedge opcional) limitado al tiempo restante"""
+        started = time.monotonic()
+        # Cada hilo del pool recibe una copia del contexto (p. ej. el span de traza actual)
+        futures = [self._executor.submit(contextvars.copy_context().run, fn, remaining)]
+        submitted = list(futures)
+        try:
+            hedge_delay = self._hedge_delay() if self.hedge else None
+            if hedge_delay is not None and hedge_delay < remaining:
+                done, _ = wait_futures(futures, timeout=hedge_delay)
+                if not done:
+                    self._count('hedges')
+                    futures.append(self._executor.submit(contextvars.copy_context().run, fn, remaining - (time.monotonic() - started)))
+                    submitted.append(futures[-1])
+
+            error = None
+            while futures:
+                timeout = remaining - (time.monotonic() - started)
+                if timeout <= 0:
+                    break
+                done, pending = wait_futures(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if len(submitted) > 1 and future is submitted[1]:
+                        self._count('hedge_wins')
+                    return result
+                futures = list(pending)
+            if error is not None:
+                raise error
+            raise DeadlineExceeded(f"{self.name}: sin respuesta en {remaining:.2f}s")
+        finally:
+            for future in submitted:
+                if not future.done():
+                    self._abandon(future)
+
+    def call(self, fn, budget=None, max_attempts=None):
+        """
+        Ejecuta fn(timeout) con reintentos dentro del presupuesto. Lanza CircuitOpenError si el
+        breaker está abierto, o la última excepción si se agotan intentos o presupuesto.
+        """
+        deadline = Deadline(self.budget if budget is None else budget)
+        max_attempts = self.max_attempts if max_attempts is None else max_attempts
+        last_error = None
+        for attempt in range(max_attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit breaker '{self.name}' abierto")
+            self._count('attempts')
+            started = time.monotonic()
+            try:
+                result = self._attempt(fn, deadline.remaining())
+                self.record(None, time.monotonic() - started)
+                return result
+            except Exception as e:
+                last_error = e
+                self.record(e)
+                logger.warning(f"{self.name}: intento {attempt + 1} fallido: {e}")
+
+            pause = self._backoff(attempt)
+            if attempt + 1 >= max_attempts or deadline.remaining() <= pause:
+                break
+            self._count('retries')
+            time.sleep(pause)
+
+        if deadline.expired():
+            self._count('deadline_exceeded')
+        raise last_error
+
+    async def _attempt_async(self, coro_fn, remaining):
+        """Un intento asíncrono (con hedge opcional) limitado al tiempo restante"""
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(coro_fn(remaining))]
+        hedge_delay = self._hedge_delay() if self.hedge else None
+        if hedge_delay is not None and hedge_delay < remaining:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self._count('hedges')
+                tasks.append(asyncio.ensure_future(coro_fn(remaining - (time.monotonic() - started))))
+
+        hedge_task = tasks[1] if len(tasks) > 1 else None
+        error = None
+        try:
+            while tasks:
+                timeout = remaining - (time.monotonic() - started)
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is hedge_task:
+                        self._count('hedge_wins')
+                    return task.result()
+                tasks = list(pending)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if error is not None:
+            raise error
+        raise DeadlineExceeded(f"{self.name}: sin respuesta en {remaining:.2f}s")
+
+    async def call_async(self, coro_fn, budget=None, max_attempts=None):
+        """Versión asíncrona de call(); coro_fn(timeout) debe devolver una corrutina nueva en cada intento"""
+        deadline = Deadline(self.budget if budget is None else budget)
+        max_attempts = self.max_attempts if max_attempts is None else max_attempts
+        last_error = None
+        for attempt in range(max_attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit breaker '{self.name}' abierto")
+            self._count('attempts')
+            started = time.monotonic()
+            try:
+                result = await self._attempt_async(coro_fn, deadline.remaining())
+                self.record(None, time.monotonic() - started)
+                return result
+            except Exception as e:
+                last_error = e
+                self.record(e)
+                logger.warning(f"{self.name}: intento {attempt + 1} fallido: {e}")
+
+            pause = self._backoff(attempt)
+            if attempt + 1 >= max_attempts or deadline.remaining() <= pause:
+                break
+            self._count('retries')
+            await asyncio.sleep(pause)
+
+        if deadline.expired():
+            self._count('deadline_exceeded')
+        raise last_error
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'budget': self.budget,
+                'attempts': self.attempts,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'deadline_exceeded': self.deadline_exceeded,
+                'abandoned': self.abandoned,
+                'abandoned_in_flight': self.abandoned_in_flight,
+                'p95_latency': self.latency.percentile(0.95),
+            }
+        stats['breaker'] = self.breaker.stats()
+        return stats
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import logging
+import threading
+
+from .nlu_cache import SQLiteCacheBackend
+from .text_normalization import key_text
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Deduplica llamadas concurrentes con la misma clave: el primer hilo ejecuta la funcion y
+    los demas esperan su resultado en lugar de repetir la llamada al LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+            else:
+                self.shared += 1
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class ResponseCache:
+    """
+    Cache persistente (SQLite en disco) de respuestas generadas por Gemini, con clave
+    (modelo, dominio, prompt normalizado). Sobrevive a reinicios del servidor de acciones.
+    """
+
+    def __init__(self, path, max_size=5000, ttl=86400, disabled_domains=()):
+        self.backend = SQLiteCacheBackend(path, max_size, ttl, table='gemini_responses')
+        self.disabled_domains = set(disabled_domains)
+        self.single_flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        """Construye la cache segun GEMINI_CACHE_*; devuelve None si esta desactivada"""
+        if os.getenv('GEMINI_CACHE_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+            return None
+        disabled = os.getenv('GEMINI_CACHE_DISABLED_DOMAINS', '')
+        cache = cls(
+            os.getenv('GEMINI_CACHE_PATH', 'gemini_cache.sqlite3'),
+            max_size=int(os.getenv('GEMINI_CACHE_SIZE', 5000)),
+            ttl=float(os.getenv('GEMINI_CACHE_TTL', 86400)),
+            disabled_domains=[d.strip() for d in disabled.split(',') if d.strip()],
+        )
+        logger.info(f"Cache de respuestas de Gemini en '{cache.backend.path}' (dominios excluidos: {sorted(cache.disabled_domains)})")
+        return cache
+
+    def enabled_for(self, domain):
+        return domain not in self.disabled_domains
+
+    def key(self, model_name, domain, prompt):
+        raw = "\x1f".join((model_name, domain, key_text(prompt)))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value, _ = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        evicted = self.backend.set(key, value)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def get_or_generate(self, key, generate):
+        """Devuelve la respuesta cacheada o la genera una sola vez aunque haya peticiones concurrentes"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        def generate_and_store():
+            value = generate()
+            self.set(key, value)
+            return value
+
+        return self.single_flight.do(key, generate_and_store)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else 0.0,
+            'evictions': self.evictions,
+            'single_flight_shared': self.single_flight.shared,
+        }
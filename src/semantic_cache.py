@@ -0,0 +1,249 @@
+"""
+Cache semantica de respuestas de Gemini para las preguntas abiertas (accion_pregunta_gemini).
+
+Cada pregunta se representa en el espacio del IntentVectorizer del modelo local
+(models/intent_model.bin): mismo preprocesado (sin acentos, signos ni stopwords, con stems) y
+mismo TF-IDF (o hashing) que el clasificador. "¿Qué es una tarjeta de crédito?" y "que es la
+tarjeta de credito" quedan a similitud coseno 1.
+
+Por dominio (slot current_domain) hay un indice invertido termino -> {entrada: peso} sobre los
+vectores normalizados: la similitud coseno exacta con todas las entradas sale de recorrer solo
+las listas de los terminos de la pregunta. Se sirve la respuesta de la entrada mas parecida si
+supera SEMANTIC_CACHE_THRESHOLD.
+
+Las palabras fuera del vocabulario TF-IDF no aparecen en el vector ("como bloqueo mi tarjeta de
+credito" tendria el mismo vector que "que es una tarjeta de credito" si "bloque" no esta en el
+vocabulario), asi que una entrada solo se sirve a preguntas con exactamente las mismas palabras
+fuera del vocabulario. Las preguntas sin ningun termino del vocabulario no usan la cache.
+
+El preprocesado quita las stopwords, y entre ellas estan las negaciones y preposiciones que
+cambian el sentido de la pregunta ("puedo tomar ibuprofeno con alcohol" y "... sin alcohol", o
+"no puedo ..." y "puedo ..." tienen el mismo vector). Por eso una entrada solo se sirve a
+preguntas con exactamente las mismas palabras de GUARD_WORDS, igual que con las palabras fuera
+del vocabulario.
+
+Los dominios de SEMANTIC_CACHE_DISABLED_DOMAINS (por defecto salud) no usan la cache: ahi una
+respuesta de una pregunta parecida pero no equivalente puede hacer dano.
+
+Capacidad acotada por dominio (SEMANTIC_CACHE_SIZE, expulsion LRU) y caducidad
+(SEMANTIC_CACHE_TTL). Cada acierto y fallo se registra en el log con su similitud para poder
+ajustar el umbral. Necesita scikit-learn, nltk y un modelo entrenado; si faltan, la cache se
+desactiva.
+"""
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from .text_normalization import clean_text
+
+logger = logging.getLogger(__name__)
+
+# Resultado de una consulta: answer es None si no hay entrada por encima del umbral
+SemanticLookup = namedtuple('SemanticLookup', 'answer similarity question')
+
+# Negaciones y preposiciones (ya normalizadas) que deben coincidir para servir una entrada
+GUARD_WORDS = frozenset((
+    'no', 'ni', 'nunca', 'jamas', 'tampoco', 'nada', 'nadie', 'ningun', 'ninguno', 'ninguna',
+    'a', 'ante', 'bajo', 'con', 'contra', 'de', 'desde', 'durante', 'en', 'entre', 'hacia',
+    'hasta', 'mediante', 'para', 'por', 'segun', 'sin', 'sobre', 'tras', 'antes', 'despues',
+))
+
+
+def load_vectorizer(model_dir):
+    """IntentVectorizer del artefacto del modelo local; None si no hay modelo o dependencias"""
+    try:
+        from .model_artifact import ARTIFACT_FILENAME, ArtifactError, import_model
+    except ImportError as e:
+        logger.warning(f"Cache semantica desactivada: no se pudo importar el vectorizador ({e}).")
+        return None
+
+    path = os.path.join(model_dir, ARTIFACT_FILENAME)
+    try:
+        vectorizer, _, _ = import_model(path)
+    except (ArtifactError, OSError) as e:
+        logger.warning(f"Cache semantica desactivada: no hay un modelo valido en '{path}' ({e}).")
+        return None
+    return vectorizer
+
+
+class _Entry:
+    __slots__ = ('text', 'vector', 'oov', 'question', 'answer', 'created')
+
+    def __init__(self, text, vector, oov, question, answer, created):
+        self.text = text
+        self.vector = vector
+        # Palabras que deben coincidir con las de la pregunta: fuera del vocabulario y GUARD_WORDS
+        self.oov = oov
+        self.question = question
+        self.answer = answer
+        self.created = created
+
+
+class _DomainIndex:
+    """Entradas de un dominio (orden LRU) y su indice invertido"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.by_text = {}
+        self.postings = {}
+        self._next_id = 0
+
+    def nearest(self, vector, oov, min_created):
+        """(id, similitud) de la entrada mas parecida con las mismas palabras fuera del vocabulario"""
+        scores = {}
+        for term, weight in vector.items():
+            for entry_id, other in self.postings.get(term, {}).items():
+                scores[entry_id] = scores.get(entry_id, 0.0) + weight * other
+
+        best_id, best_score = None, 0.0
+        for entry_id, score in scores.items():
+            entry = self.entries[entry_id]
+            if entry.created < min_created:
+                self.remove(entry_id)
+            elif entry.oov == oov and score > best_score:
+                best_id, best_score = entry_id, score
+        return best_id, min(best_score, 1.0)
+
+    def add(self, entry):
+        """Anade la entrada; la de la misma pregunta preprocesada (y mismas palabras a coincidir), si existe, se sustituye"""
+        entry_id = self.by_text.get((entry.text, entry.oov))
+        if entry_id is not None:
+            self.remove(entry_id)
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = entry
+        self.by_text[(entry.text, entry.oov)] = entry_id
+        for term, weight in entry.vector.items():
+            self.postings.setdefault(term, {})[entry_id] = weight
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id)
+        for term in entry.vector:
+            posting = self.postings[term]
+            del posting[entry_id]
+            if not posting:
+                del self.postings[term]
+        del self.by_text[(entry.text, entry.oov)]
+
+    def evict_oldest(self):
+        self.remove(next(iter(self.entries)))
+
+    def touch(self, entry_id):
+        self.entries.move_to_end(entry_id)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SemanticAnswerCache:
+    """Cache en memoria de (dominio, pregunta) -> respuesta servida por similitud coseno"""
+
+    def __init__(self, vectorizer, threshold=0.9, capacity=1000, ttl=86400, disabled_domains=()):
+        self.vectorizer = vectorizer
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self.disabled_domains = set(disabled_domains)
+        # Solo el TF-IDF tiene vocabulario; con hashing no hay palabras fuera de el
+        self.vocabulary = getattr(vectorizer.vectorizer, 'vocabulary_', None)
+        self._domains = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        """Cache configurada con SEMANTIC_CACHE_*; None si esta desactivada o no hay vectorizador"""
+        if os.getenv('SEMANTIC_CACHE_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+            return None
+        vectorizer = load_vectorizer(os.getenv('SEMANTIC_CACHE_MODEL_DIR', os.getenv('LOCAL_NLU_MODEL_DIR', 'models/')))
+        if vectorizer is None:
+            return None
+        disabled = os.getenv('SEMANTIC_CACHE_DISABLED_DOMAINS', 'salud')
+        cache = cls(
+            vectorizer,
+            threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9)),
+            capacity=int(os.getenv('SEMANTIC_CACHE_SIZE', 1000)),
+            ttl=float(os.getenv('SEMANTIC_CACHE_TTL', 86400)),
+            disabled_domains=[d.strip() for d in disabled.split(',') if d.strip()],
+        )
+        logger.info(f"Cache semantica de respuestas activada (umbral {cache.threshold}, {cache.capacity} entradas por dominio, "
+                    f"dominios excluidos: {sorted(cache.disabled_domains)})")
+        return cache
+
+    def enabled_for(self, domain):
+        return domain not in self.disabled_domains
+
+    def embed(self, question):
+        """(texto preprocesado, vector normalizado {termino: peso}, palabras que deben coincidir) o None"""
+        text = self.vectorizer.preprocess([question])[0]
+        row = self.vectorizer.vectorizer.transform([text])
+        norm = math.sqrt(sum(weight * weight for weight in row.data))
+        if not norm:
+            return None
+        vector = {int(term): float(weight) / norm for term, weight in zip(row.indices, row.data)}
+        oov = frozenset(word for word in text.split() if word not in self.vocabulary) if self.vocabulary is not None else frozenset()
+        guard = GUARD_WORDS.intersection(clean_text(question).split())
+        # Prefijo para no confundir una palabra fuera del vocabulario con una de GUARD_WORDS
+        return text, vector, oov | frozenset(f"~{word}" for word in guard)
+
+    def lookup(self, question, domain):
+        """SemanticLookup con la respuesta de la pregunta mas parecida del dominio; None si la pregunta no se puede representar"""
+        embedded = self.embed(question)
+        if embedded is None:
+            self.skipped += 1
+            logger.info(f"Cache semantica omitida ({domain}): ningun termino de '{question}' esta en el vocabulario")
+            return None
+        _, vector, oov = embedded
+
+        with self._lock:
+            index = self._domains.get(domain)
+            best_id, similarity = index.nearest(vector, oov, time.time() - self.ttl) if index is not None else (None, 0.0)
+            entry = index.entries[best_id] if best_id is not None else None
+            hit = entry is not None and similarity >= self.threshold
+            if hit:
+                index.touch(best_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        closest = entry.question if entry is not None else None
+        if hit:
+            logger.info(f"Cache semantica ACIERTO ({domain}): similitud {similarity:.3f} entre '{question}' y '{closest}'")
+            return SemanticLookup(entry.answer, similarity, closest)
+        logger.info(f"Cache semantica FALLO ({domain}): similitud maxima {similarity:.3f} (umbral {self.threshold}) "
+                    f"para '{question}'" + (f", mas parecida '{closest}'" if closest else ""))
+        return SemanticLookup(None, similarity, closest)
+
+    def add(self, question, domain, answer):
+        embedded = self.embed(question)
+        if embedded is None or not answer:
+            return
+        text, vector, oov = embedded
+        with self._lock:
+            index = self._domains.get(domain)
+            if index is None:
+                index = self._domains[domain] = _DomainIndex()
+            index.add(_Entry(text, vector, oov, question, answer, time.time()))
+            while len(index) > self.capacity:
+                index.evict_oldest()
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'threshold': self.threshold,
+                'capacity_per_domain': self.capacity,
+                'entries': {domain: len(index) for domain, index in self._domains.items()},
+                'hits': self.hits,
+                'misses': self.misses,
+                'skipped': self.skipped,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
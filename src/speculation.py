@@ -0,0 +1,314 @@
+"""
+Generacion especulativa de respuestas con Gemini.
+
+En los modos 'gemini' e 'hybrid' el gateway conoce la intencion antes de llamar a RASA. Para
+las intenciones cuya accion genera la respuesta con Gemini (SPECULATIVE_INTENTS) el gateway
+construye el mismo prompt que construira la accion (src/generation_prompts.py) y lanza la
+generacion en paralelo con la ida y vuelta a RASA, en vez de esperar a que la accion la haga
+en serie.
+
+- Gateway (Speculator): genera en un pool propio y limitado (SPECULATION_MAX_CONCURRENCY; si
+  esta lleno no se especula) y publica el resultado en el servidor de acciones
+  (POST SPECULATION_URL). A RASA le envia metadata.speculation = {turn, fingerprint}. La
+  especulacion es prescindible: solo se lanza si el circuit breaker de Gemini del gateway esta
+  cerrado y hay un hueco libre de admision sin cola (no adelanta a los mensajes que esperan).
+  La llamada pasa por ese breaker con su propio presupuesto (SPECULATION_BUDGET) y ocupa el
+  hueco hasta que termina.
+- Servidor de acciones (SpeculationStore): guarda los resultados por (sender, turno) durante
+  SPECULATION_TTL segundos. La accion solo usa el resultado si la huella de su propio prompt
+  coincide (mismo modelo, dominio y entidades); si aun no ha llegado, espera como mucho
+  SPECULATION_WAIT_TIMEOUT. Sin resultado valido genera como siempre. Antes de esperar se miran
+  las caches de respuestas de la accion, y un resultado especulativo usado se guarda en ellas.
+
+Los resultados que ninguna accion recoge (RASA eligio otra accion, el prompt no coincidia)
+caducan; el almacen guarda como mucho SPECULATION_MAX_ENTRIES (se descartan los mas antiguos).
+POST /speculative rechaza cuerpos de mas de SPECULATION_MAX_BODY_BYTES y, con
+SPECULATION_TOKEN, las peticiones sin la cabecera X-Speculation-Token correcta (el gateway la
+envia con el mismo valor). Se cuentan los aciertos, fallos y caducados y el tiempo ahorrado en cada acierto: lo
+que tardo la generacion menos lo que la accion tuvo que esperarla.
+"""
+import os
+import time
+import uuid
+import hmac
+import logging
+import threading
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .admission import DOMAIN_BY_INTENT, SenderDomains
+from .resilience import ResilientCaller
+from .generation_prompts import SPECULATIVE_INTENTS, build_domain_prompt, prompt_for_intent, prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Clave de los metadatos del mensaje a RASA (tracker.latest_message['metadata'])
+SPECULATION_KEY = 'speculation'
+
+# Cabecera con el secreto compartido entre el gateway y el servidor de acciones
+TOKEN_HEADER = 'X-Speculation-Token'
+
+# Dominio que tendra el slot current_domain segun domain.yml (las emergencias lo pasan a salud)
+SLOT_DOMAIN_BY_INTENT = dict(DOMAIN_BY_INTENT, contacto_emergencia='salud')
+
+SPECULATION_OUTCOMES = ('hit', 'mismatch', 'failed', 'timeout')
+
+SpeculativeResult = namedtuple('SpeculativeResult', 'text outcome waited saved')
+
+
+class Speculator:
+    """Lado del gateway: lanza las generaciones y publica los resultados en el servidor de acciones"""
+
+    def __init__(self, model, model_name, publish_url, max_concurrency=4, publish_timeout=5.0, intents=SPECULATIVE_INTENTS,
+                 resilience=None, gate=None, token=None):
+        self.model = model
+        self.model_name = model_name
+        self.publish_url = publish_url
+        self.max_concurrency = max_concurrency
+        self.publish_timeout = publish_timeout
+        self.intents = set(intents)
+        self.resilience = resilience or ResilientCaller('gemini-especulacion', budget=20.0, max_attempts=1)
+        # PriorityGate de la admision del gateway (None si esta desactivada)
+        self.gate = gate
+        # current_domain de cada sender tal y como lo tendra RASA (para pregunta_abierta)
+        self.domains = SenderDomains(SLOT_DOMAIN_BY_INTENT)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='speculative')
+        self._session = requests.Session()
+        if token:
+            self._session.headers[TOKEN_HEADER] = token
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.started = 0
+        self.skipped = {'no_prompt': 0, 'busy': 0, 'breaker_open': 0, 'admission': 0}
+        self.published = 0
+        self.failed = 0
+        self.publish_errors = 0
+        self.total_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, model, model_name, breaker=None, gate=None):
+        """
+        Especulador con SPECULATION_*; None si SPECULATION_ENABLED no esta activado o no hay modelo.
+        breaker es el circuit breaker de Gemini del gateway y gate el PriorityGate de su admision.
+        """
+        if os.getenv('SPECULATION_ENABLED', '0').lower() not in ('1', 'true', 'yes') or model is None:
+            return None
+        intents = os.getenv('SPECULATION_INTENTS')
+        # Sin reintentos: si falla, la accion genera como siempre
+        resilience = ResilientCaller(
+            'gemini-especulacion',
+            budget=float(os.getenv('SPECULATION_BUDGET', 20.0)),
+            max_attempts=1,
+            breaker=breaker,
+            on_abandon=gate.hold if gate is not None else None,
+        )
+        speculator = cls(
+            model,
+            model_name,
+            os.getenv('SPECULATION_URL', 'http://localhost:5056/speculative'),
+            max_concurrency=int(os.getenv('SPECULATION_MAX_CONCURRENCY', 4)),
+            publish_timeout=float(os.getenv('SPECULATION_PUBLISH_TIMEOUT', 5.0)),
+            intents=[i.strip() for i in intents.split(',') if i.strip()] if intents is not None else SPECULATIVE_INTENTS,
+            resilience=resilience,
+            gate=gate,
+            token=os.getenv('SPECULATION_TOKEN'),
+        )
+        logger.info(f"Generación especulativa activada para {sorted(speculator.intents)} (resultados en {speculator.publish_url})")
+        return speculator
+
+    def remember(self, sender_id, nlu_data):
+        self.domains.remember(sender_id, nlu_data)
+
+    def start(self, sender_id, nlu_data, user_message):
+        """Lanza la generacion si la intencion lo permite; devuelve los metadatos para RASA o None"""
+        intent = nlu_data.get('intent')
+        if intent not in self.intents:
+            return None
+        entities = {e['entity']: e['value'] for e in nlu_data.get('entities') or [] if 'entity' in e and 'value' in e}
+        request = prompt_for_intent(intent, entities, user_message, self.domains.get(sender_id))
+        with self._lock:
+            if request is None:
+                self.skipped['no_prompt'] += 1
+                return None
+            if self.in_flight >= self.max_concurrency:
+                self.skipped['busy'] += 1
+                return None
+            # Ni sonda del half_open ni llamadas con el breaker abierto: eso queda para el trafico real
+            if self.resilience.breaker.state != 'closed':
+                self.skipped['breaker_open'] += 1
+                return None
+            if self.gate is not None and not self.gate.try_acquire():
+                self.skipped['admission'] += 1
+                return None
+            self.in_flight += 1
+            self.started += 1
+
+        prompt, domain = request
+        full_prompt = build_domain_prompt(prompt, domain)
+        speculation = {'turn': uuid.uuid4().hex, 'fingerprint': prompt_fingerprint(self.model_name, full_prompt)}
+        self._executor.submit(contextvars.copy_context().run, self._run, sender_id, speculation, full_prompt)
+        return speculation
+
+    def _run(self, sender_id, speculation, full_prompt):
+        payload = dict(speculation, sender=sender_id)
+        started = time.perf_counter()
+        try:
+            payload['text'] = self.resilience.call(
+                lambda timeout: self.model.generate_content(full_prompt, request_options={'timeout': timeout}).text)
+        except Exception as e:
+            logger.warning(f"Falló la generación especulativa para '{sender_id}': {e}")
+            payload['error'] = str(e)
+        finally:
+            if self.gate is not None:
+                self.gate.release()
+        payload['seconds'] = time.perf_counter() - started
+        try:
+            self._session.post(self.publish_url, json=payload, timeout=self.publish_timeout).raise_for_status()
+            published = True
+        except requests.RequestException as e:
+            logger.error(f"No se pudo publicar el resultado especulativo en {self.publish_url}: {e}")
+            published = False
+        with self._lock:
+            self.in_flight -= 1
+            self.total_seconds += payload['seconds']
+            self.failed += 'error' in payload
+            self.published += published
+            self.publish_errors += not published
+
+    def stats(self):
+        with self._lock:
+            return {
+                'intents': sorted(self.intents),
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'started': self.started,
+                'skipped': dict(self.skipped),
+                'published': self.published,
+                'failed': self.failed,
+                'publish_errors': self.publish_errors,
+                'avg_generation_seconds': (self.total_seconds / (self.started - self.in_flight)) if self.started > self.in_flight else 0.0,
+            }
+
+
+class SpeculationStore:
+    """Lado del servidor de acciones: resultados especulativos por (sender, turno) hasta que caducan"""
+
+    def __init__(self, ttl=60.0, wait_timeout=2.0, max_entries=1000, max_body_bytes=256 * 1024, token=None):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.token = token
+        # Orden de llegada: los primeros son los mas antiguos
+        self._results = {}
+        self._cond = threading.Condition()
+        self.received = 0
+        self.expired = 0
+        self.evicted = 0
+        self.rejected = 0
+        self.outcomes = dict.fromkeys(SPECULATION_OUTCOMES, 0)
+        self.saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        # La espera solo tiene sentido si la generacion va por delante: del orden de una ida y vuelta a RASA
+        return cls(
+            ttl=float(os.getenv('SPECULATION_TTL', 60)),
+            wait_timeout=float(os.getenv('SPECULATION_WAIT_TIMEOUT', 2.0)),
+            max_entries=int(os.getenv('SPECULATION_MAX_ENTRIES', 1000)),
+            max_body_bytes=int(os.getenv('SPECULATION_MAX_BODY_BYTES', 256 * 1024)),
+            token=os.getenv('SPECULATION_TOKEN'),
+        )
+
+    def authorized(self, token):
+        """Comprueba la cabecera X-Speculation-Token si hay SPECULATION_TOKEN configurado"""
+        if not self.token:
+            return True
+        if token is not None and hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+            return True
+        with self._cond:
+            self.rejected += 1
+        return False
+
+    def reject(self):
+        """Cuenta una publicacion rechazada antes de llegar a put() (cuerpo demasiado grande)"""
+        with self._cond:
+            self.rejected += 1
+
+    def _purge(self):
+        now = time.monotonic()
+        while self._results:
+            key, (_, received) = next(iter(self._results.items()))
+            if now - received <= self.ttl:
+                break
+            del self._results[key]
+            self.expired += 1
+
+    def put(self, payload):
+        """Guarda el resultado publicado por el gateway ({sender, turn, fingerprint, text|error, seconds})"""
+        key = (payload['sender'], payload['turn'])
+        with self._cond:
+            self._purge()
+            self._results.pop(key, None)
+            while len(self._results) >= self.max_entries:
+                del self._results[next(iter(self._results))]
+                self.evicted += 1
+            self._results[key] = (payload, time.monotonic())
+            self.received += 1
+            self._cond.notify_all()
+
+    def take(self, sender_id, speculation, fingerprint):
+        """
+        SpeculativeResult del turno si su huella coincide con la del prompt de la accion. Si la
+        generacion aun no ha terminado espera como mucho wait_timeout segundos.
+        """
+        key = (sender_id, speculation.get('turn'))
+        if speculation.get('fingerprint') != fingerprint:
+            # El resultado, cuando llegue, caducara sin usarse
+            return self._record(SpeculativeResult(None, 'mismatch', 0.0, 0.0))
+
+        started = time.monotonic()
+        deadline = started + self.wait_timeout
+        with self._cond:
+            self._purge()
+            while key not in self._results:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            entry = self._results.pop(key, None)
+        waited = time.monotonic() - started
+
+        if entry is None:
+            return self._record(SpeculativeResult(None, 'timeout', waited, 0.0))
+        payload, _ = entry
+        if 'error' in payload or not payload.get('text'):
+            return self._record(SpeculativeResult(None, 'failed', waited, 0.0))
+        # Sin especulacion la accion habria tardado lo mismo que la generacion; solo ha esperado 'waited'
+        saved = max(0.0, payload.get('seconds', 0.0) - waited)
+        return self._record(SpeculativeResult(payload['text'], 'hit', waited, saved))
+
+    def _record(self, result):
+        with self._cond:
+            self.outcomes[result.outcome] += 1
+            self.saved_seconds += result.saved
+        logger.info(f"Resultado especulativo: {result.outcome} (espera {result.waited:.3f}s, ahorro {result.saved:.3f}s)")
+        return result
+
+    def stats(self):
+        with self._cond:
+            used = sum(self.outcomes.values())
+            return {
+                'pending': len(self._results),
+                'received': self.received,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'rejected': self.rejected,
+                'max_entries': self.max_entries,
+                'outcomes': dict(self.outcomes),
+                'hit_rate': (self.outcomes['hit'] / used) if used else 0.0,
+                'saved_seconds': self.saved_seconds,
+            }
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .metrics import send_metrics
+from .speculation import TOKEN_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Marca interna de fin de stream
+_END = object()
+
+
+def sse_event(event, data):
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class StreamRegistry:
+    """
+    Registro de generaciones en curso dentro del servidor de acciones.
+
+    Cada stream tiene una cola de fragmentos que un hilo productor (la llamada a Gemini)
+    va llenando y que el gateway consume por HTTP. Los streams que nadie lee caducan.
+    """
+
+    def __init__(self, ttl=120):
+        self.ttl = ttl
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def start(self, chunks, prefix="", executor=None):
+        """
+        Consume el iterador de fragmentos en segundo plano y devuelve el id del stream.
+        Si se pasa un executor (p. ej. el pool limitado de Gemini) la generación se encola en él.
+        """
+        stream_id = uuid.uuid4().hex
+        chunk_queue = queue.Queue()
+        with self._lock:
+            self._purge()
+            self._streams[stream_id] = (chunk_queue, time.monotonic())
+
+        def produce():
+            try:
+                if prefix:
+                    chunk_queue.put(prefix)
+                for chunk in chunks:
+                    if chunk:
+                        chunk_queue.put(chunk)
+            except Exception as e:
+                logger.error(f"Error generando el stream {stream_id}: {e}")
+            finally:
+                chunk_queue.put(_END)
+
+        if executor is not None:
+            executor.submit(produce)
+        else:
+            threading.Thread(target=produce, name=f"stream-{stream_id[:8]}", daemon=True).start()
+        return stream_id
+
+    def _purge(self):
+        now = time.monotonic()
+        for stream_id in [k for k, (_, created) in self._streams.items() if now - created > self.ttl]:
+            del self._streams[stream_id]
+
+    def consume(self, stream_id, timeout=60):
+        """Devuelve los fragmentos del stream a medida que llegan; None si no existe"""
+        with self._lock:
+            entry = self._streams.pop(stream_id, None)
+        if entry is None:
+            return None
+        chunk_queue, _ = entry
+
+        def chunks():
+            while True:
+                chunk = chunk_queue.get(timeout=timeout)
+                if chunk is _END:
+                    return
+                yield chunk
+
+        return chunks()
+
+
+def start_stream_server(registry, host='0.0.0.0', port=5056, speculation_store=None):
+    """
+    Arranca en un hilo un servidor HTTP que expone GET /streams/<id> como NDJSON:
+    una linea {"text": ...} por fragmento y {"done": true} al final. Sirve tambien las
+    metricas del servidor de acciones en GET /metrics y, con speculation_store, recibe los
+    resultados especulativos del gateway en POST /speculative (con el token y el limite de
+    tamaño del almacen).
+    """
+
+    class StreamHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 con transferencia por trozos para que cada fragmento llegue sin esperar al siguiente
+        protocol_version = 'HTTP/1.1'
+
+        def _write_chunk(self, item):
+            data = (json.dumps(item, ensure_ascii=False) + "\n").encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0].rstrip('/') == '/metrics':
+                send_metrics(self)
+                return
+            prefix = '/streams/'
+            if not self.path.startswith(prefix):
+                self.send_error(404)
+                return
+            chunks = registry.consume(self.path[len(prefix):])
+            if chunks is None:
+                self.send_error(404, "Stream no encontrado o caducado")
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            try:
+                try:
+                    for chunk in chunks:
+                        self._write_chunk({"text": chunk})
+                    self._write_chunk({"done": True})
+                except queue.Empty:
+                    self._write_chunk({"done": True, "error": "timeout"})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                logger.warning("El gateway cerró la conexión del stream antes de terminar.")
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/speculative' or speculation_store is None:
+                self.send_error(404)
+                return
+            if not speculation_store.authorized(self.headers.get(TOKEN_HEADER)):
+                self.send_error(403)
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                self.send_error(400, "Content-Length invalido")
+                return
+            if length > speculation_store.max_body_bytes:
+                speculation_store.reject()
+                # Sin leer el cuerpo la conexion no se puede reutilizar
+                self.close_connection = True
+                self.send_error(413, f"Resultado especulativo de mas de {speculation_store.max_body_bytes} bytes")
+                return
+            try:
+                payload = json.loads(self.rfile.read(length))
+                speculation_store.put(payload)
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_error(400, f"Resultado especulativo invalido: {e}")
+                return
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), StreamHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stream-server', daemon=True).start()
+    logger.info(f"Servidor de streams de acciones escuchando en {host}:{port}")
+    return server
+
+
+def stream_registry_from_env(speculation_store=None):
+    """Crea el registro y su servidor HTTP si ACTION_STREAM_ENABLED lo permite; None si no"""
+    if os.getenv('ACTION_STREAM_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+        return None
+    registry = StreamRegistry(ttl=float(os.getenv('ACTION_STREAM_TTL', 120)))
+    try:
+        start_stream_server(registry, host=os.getenv('ACTION_STREAM_HOST', '0.0.0.0'),
+                            port=int(os.getenv('ACTION_STREAM_PORT', 5056)), speculation_store=speculation_store)
+    except OSError as e:
+        logger.error(f"No se pudo arrancar el servidor de streams: {e}. Se usarán respuestas completas.")
+        return None
+    return registry
+
+
+def iter_action_stream(session, base_url, stream_id, timeout=(2.0, 60.0)):
+    """Lee (gateway, síncrono) los fragmentos de un stream del servidor de acciones"""
+    with session.get(f"{base_url}/{stream_id}", stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        buffer = b""
+        # chunk_size=None entrega cada trozo en cuanto llega (iter_lines esperaría a llenar su buffer)
+        for data in response.iter_content(chunk_size=None):
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if item.get("done"):
+                    return
+                yield item.get("text", "")
+
+
+async def iter_action_stream_async(session, base_url, stream_id, timeout=None):
+    """Versión asíncrona (aiohttp) de iter_action_stream para el modo ASGI"""
+    async with session.get(f"{base_url}/{stream_id}", timeout=timeout) as response:
+        response.raise_for_status()
+        async for line in response.content:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("done"):
+                return
+            yield item.get("text", "")
@@ -0,0 +1,51 @@
+"""
+Normalizacion de texto compartida por TextPreprocessor (entrenamiento y clasificador local), el
+detector de emergencias del gateway, el catalogo y las claves de las caches. No depende de NLTK
+ni de sklearn para que el gateway la pueda usar sin cargar el modelo.
+"""
+import re
+import unicodedata
+
+# Patrones precompilados de limpieza
+SPECIAL_CHARS_PATTERN = re.compile(r'[^a-zA-Z0-9\s]')
+# Signos que no son separadores decimales o de miles entre dos digitos ("1,5", "100.50")
+KEY_PUNCTUATION_PATTERN = re.compile(r'(?!(?<=\d)[.,](?=\d))[^\w\s]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class _AccentTable(dict):
+    """Tabla para str.translate que calcula (y recuerda) la version sin acentos de cada caracter"""
+
+    def __missing__(self, char_code):
+        stripped = ''.join(c for c in unicodedata.normalize('NFD', chr(char_code))
+                           if unicodedata.category(c) != 'Mn')
+        self[char_code] = stripped
+        return stripped
+
+
+_ACCENT_TABLE = _AccentTable()
+
+
+def remove_accents(text):
+    """Remueve acentos del texto"""
+    if text.isascii():
+        return text
+    return text.translate(_ACCENT_TABLE)
+
+
+def clean_text(text):
+    """Minusculas, sin acentos ni caracteres especiales y con los espacios colapsados"""
+    text = remove_accents(text.lower())
+    text = SPECIAL_CHARS_PATTERN.sub('', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def key_text(text):
+    """
+    Texto normalizado para claves de cache: minusculas y sin acentos como clean_text, pero los
+    signos pasan a ser espacios y se conservan los separadores entre digitos, para que
+    "transferir 1,5 soles" y "transferir 15 soles" no compartan clave (ni sus entidades).
+    """
+    text = remove_accents(text.lower())
+    text = KEY_PUNCTUATION_PATTERN.sub(' ', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
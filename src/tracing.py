@@ -0,0 +1,353 @@
+"""
+Trazas distribuidas gateway -> RASA -> servidor de acciones.
+
+El gateway abre una traza por mensaje (o continua la de la cabecera W3C 'traceparent' del
+cliente) y la envia a RASA en metadata.traceparent; las acciones la leen de
+tracker.latest_message y cuelgan de ella sus propios spans. El span actual vive en un
+ContextVar, asi que los hijos se enlazan solos dentro de la misma tarea o hilo; los pools
+de hilos (resiliencia, Gemini) copian el contexto al encolar.
+
+Los spans terminados se exportan en segundo plano (sin bloquear la peticion) a:
+- TRACE_EXPORT_PATH: fichero JSONL, un span por linea.
+- TRACE_COLLECTOR_URL: colector OTLP/HTTP con JSON (p. ej. http://localhost:4318/v1/traces).
+Sin ninguno de los dos los identificadores se siguen propagando pero no se guarda nada.
+
+Desglose de una traza a partir de los ficheros del gateway y de las acciones:
+    python -m src.tracing traces.jsonl actions_traces.jsonl --slowest 5
+    python -m src.tracing traces.jsonl --trace-id 4bf92f3577b34da6a3ce929d0e0e4736
+"""
+import os
+import re
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import contextvars
+from collections import namedtuple
+from contextlib import contextmanager
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Clave de la metadata de RASA (y cabecera HTTP) con el contexto de la traza
+TRACEPARENT_KEY = 'traceparent'
+
+_TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+# Spans pendientes de exportar como maximo; si el exportador no da abasto se descartan
+EXPORT_QUEUE_SIZE = 10000
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 1.0
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class TraceContext(namedtuple('TraceContext', 'trace_id span_id')):
+    """Traza y span padre; span_id es None en la raiz de una traza nueva"""
+
+    @classmethod
+    def new(cls):
+        return cls(os.urandom(16).hex(), None)
+
+    @classmethod
+    def from_traceparent(cls, value):
+        """Contexto de una cabecera traceparent valida; una traza nueva si no lo es"""
+        match = _TRACEPARENT_PATTERN.match(value.strip().lower()) if isinstance(value, str) else None
+        if match is None or match.group(1) == '0' * 32:
+            return cls.new()
+        return cls(match.group(1), match.group(2))
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id or '0' * 16}-01"
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_ns', '_started', 'duration', 'error')
+
+    def __init__(self, tracer, name, context, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = context.trace_id
+        self.parent_id = context.span_id
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    @property
+    def context(self):
+        """Contexto para los hijos de este span (tambien en otros procesos)"""
+        return TraceContext(self.trace_id, self.span_id)
+
+    @property
+    def traceparent(self):
+        return self.context.traceparent
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'service': self.tracer.service,
+            'start': self.start_ns / 1e9,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class _NoopSpan:
+    """Span hijo sin padre: no se registra (p. ej. llamadas desde hilos del batcher)"""
+
+    context = None
+    traceparent = None
+    trace_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, error):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    return _current_span.get()
+
+
+class SpanExporter:
+    """Exporta lotes de spans desde un hilo propio; export() nunca bloquea"""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        threading.Thread(target=self._run, name=f"{type(self).__name__}", daemon=True).start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"No se pudieron exportar {len(batch)} spans: {e}")
+
+    def write(self, spans):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'exporter': type(self).__name__, 'exported': self.exported, 'dropped': self.dropped,
+                'failed': self.failed, 'pending': self._queue.qsize()}
+
+
+class FileSpanExporter(SpanExporter):
+    """Un span por linea (JSONL); cada lote se anade con una sola escritura"""
+
+    def __init__(self, path):
+        self.path = path
+        super().__init__()
+
+    def write(self, spans):
+        data = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """Envia los spans a un colector OTLP/HTTP en formato JSON (Jaeger, OpenTelemetry Collector...)"""
+
+    def __init__(self, url, service, timeout=5.0):
+        self.url = url
+        self.service = service
+        self.timeout = timeout
+        self.session = requests.Session()
+        super().__init__()
+
+    def _span(self, span):
+        end_ns = span.start_ns + int(span.duration * 1e9)
+        item = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(end_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span.attributes.items()],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+        }
+        if span.parent_id:
+            item['parentSpanId'] = span.parent_id
+        return item
+
+    def write(self, spans):
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service}}]},
+            'scopeSpans': [{'scope': {'name': 'chatbot'}, 'spans': [self._span(span) for span in spans]}],
+        }]}
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    def __init__(self, service, exporter=None):
+        self.service = service
+        self.exporter = exporter
+
+    @classmethod
+    def from_env(cls, service):
+        """Tracer con el exportador de TRACE_COLLECTOR_URL o TRACE_EXPORT_PATH (ninguno si no hay)"""
+        if os.getenv('TRACING_ENABLED', '1').lower() not in ('1', 'true', 'yes'):
+            return cls(service)
+        collector_url = os.getenv('TRACE_COLLECTOR_URL')
+        export_path = os.getenv('TRACE_EXPORT_PATH')
+        if collector_url:
+            exporter = OTLPHttpSpanExporter(collector_url, service)
+        elif export_path:
+            exporter = FileSpanExporter(export_path)
+        else:
+            exporter = None
+        if exporter is not None:
+            logger.info(f"Trazas de '{service}' exportadas con {type(exporter).__name__}")
+        return cls(service, exporter)
+
+    @contextmanager
+    def span(self, name, context=None, root=True, **attributes):
+        """
+        Abre un span hijo del span actual, o de context (p. ej. el traceparent recibido de otro
+        proceso). Sin ninguno de los dos empieza una traza nueva, salvo con root=False: entonces
+        el bloque se ejecuta sin registrar nada.
+        """
+        if context is None:
+            parent = _current_span.get()
+            if parent is None and not root:
+                yield _NOOP_SPAN
+                return
+            context = parent.context if parent is not None else TraceContext.new()
+
+        span = Span(self, name, context, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            if self.exporter is not None:
+                self.exporter.export(span)
+
+    def stats(self):
+        return self.exporter.stats() if self.exporter is not None else {'exporter': None}
+
+
+def read_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def format_trace(spans):
+    """Arbol de spans de una traza con el desfase y la duracion de cada uno"""
+    spans = sorted(spans, key=lambda span: span['start'])
+    ids = {span['span_id'] for span in spans}
+    children = {}
+    for span in spans:
+        parent = span['parent_id'] if span['parent_id'] in ids else None
+        children.setdefault(parent, []).append(span)
+    origin = spans[0]['start']
+    lines = []
+
+    def walk(span, depth):
+        attributes = " ".join(f"{key}={value}" for key, value in span['attributes'].items())
+        error = f"  ERROR {span['error']}" if span.get('error') else ""
+        lines.append(f"{(span['start'] - origin) * 1000:9.1f}ms {span['duration_ms']:9.1f}ms  "
+                     f"{'  ' * depth}{span['name']} [{span['service']}] {attributes}{error}")
+        for child in children.get(span['span_id'], []):
+            walk(child, depth + 1)
+
+    for root in children.get(None, []):
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Desglose de trazas exportadas en JSONL")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--trace-id')
+    parser.add_argument('--slowest', type=int, default=5, help="Mostrar las N trazas mas lentas")
+    args = parser.parse_args(argv)
+
+    traces = {}
+    for span in read_spans(args.files):
+        traces.setdefault(span['trace_id'], []).append(span)
+
+    if args.trace_id:
+        if args.trace_id not in traces:
+            print(f"Traza {args.trace_id} no encontrada", file=sys.stderr)
+            return 1
+        selected = [args.trace_id]
+    else:
+        def total_ms(trace_id):
+            spans = traces[trace_id]
+            return max(s['start'] * 1000 + s['duration_ms'] for s in spans) - min(s['start'] for s in spans) * 1000
+        selected = sorted(traces, key=total_ms, reverse=True)[:args.slowest]
+
+    for trace_id in selected:
+        print(f"Traza {trace_id} ({len(traces[trace_id])} spans)")
+        print(format_trace(traces[trace_id]))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
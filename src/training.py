@@ -1,5 +1,4 @@
 import json 
-import pickle
 import os 
 from sklearn.svm import SVC
 from sklearn.model_selection import train_test_split
@@ -7,16 +6,27 @@ from sklearn.metrics import classification_report, accuracy_score
 
 import numpy as np
 from .preprocessing import IntentVectorizer
+from .linear_model import LinearSVCModel
+from .model_artifact import ARTIFACT_FILENAME, export_model
+from .nlu_data import load_nlu_intents
+from .feature_cache import FeatureCache
 
 class ChatbotTrainer:
-    def __init__(self):
-        self.vectorizer = IntentVectorizer()
+    def __init__(self, featurizer=None):
+        # featurizer: 'tfidf' o 'hashing' (por defecto NLU_FEATURIZER)
+        self.vectorizer = IntentVectorizer(featurizer=featurizer)
         self.model = SVC(kernel='linear', probability=True, random_state=42)
         self.intents = None
         self.intent_labels = []
+        # Cache en disco del texto preprocesado de cada ejemplo (FEATURE_CACHE_PATH)
+        self.feature_cache = FeatureCache.from_env()
     
     def load_intents(self, filepath):
-        """Carga los intents desde un archivo JSON"""
+        """Carga los intents desde el NLU de Rasa (.yml o directorio data/) o desde un archivo JSON"""
+        if os.path.isdir(filepath) or filepath.endswith(('.yml', '.yaml')):
+            self.intents = load_nlu_intents(filepath)
+            return self.intents
+
         with open(filepath, 'r', encoding='utf-8') as file:
             data = json.load(file)
             self.intents = data['intents']
@@ -49,10 +59,12 @@ class ChatbotTrainer:
         x_text, y = self.prepare_training_data()
 
         print("Vectorizando texto")
-        x = self.vectorizer.fit_transform(x_text)
+        x = self.vectorizer.fit_transform(x_text, self.feature_cache)
 
         print("Dividiendo datos para entrenamiento y prueba")
-        X_train, X_test, y_train, y_test = train_test_split(x,y,test_size=0.2, random_state=42, stratify=y)
+        # Con corpus pequeños como data/nlu.yml el 20% no llega a un ejemplo de prueba por intencion
+        test_size = max(0.2, len(self.intent_labels) / len(y))
+        X_train, X_test, y_train, y_test = train_test_split(x,y,test_size=test_size, random_state=42, stratify=y)
 
         print("Entrenando modelo")
         self.model.fit(X_train, y_train)
@@ -67,33 +79,25 @@ class ChatbotTrainer:
         target_names = [self.intent_labels[i] for i in sorted(set(y_test))]
         print(classification_report(y_test, y_pred, target_names=target_names))
 
+        if self.feature_cache is not None:
+            report = self.feature_cache.report()
+            print(f"Cache de features: {report['hits']}/{report['examples']} aciertos ({report['hit_ratio']:.1%}), "
+                  f"preprocesados {report['misses']} ejemplos en {report['seconds_spent']:.2f}s, ahorro estimado {report['seconds_saved']:.2f}s")
+            pruned = self.feature_cache.prune()
+            if pruned:
+                print(f"Cache de features: borradas {pruned} entradas sin usar en {self.feature_cache.max_age_days:g} dias")
+
         return accuracy
     
     def save_model(self, model_dir):
-        """Guarda el modelo y componentes necesarios"""
+        """Guarda vectorizador, modelo y etiquetas en un unico artefacto versionado"""
         if not os.path.exists(model_dir):
             os.makedirs(model_dir)
-        
-        #Guardamos modelo
-        model_path = os.path.join(model_dir, 'chatbot_model.pkl')
-        with open(model_path, 'wb') as f:
-            pickle.dump(self.model, f)
-        
-        #Guardamos vectorizador
-        vectorizer_path = os.path.join(model_dir, 'vectorizer.pkl')
-        with open(vectorizer_path, 'wb') as f:
-            pickle.dump(self.vectorizer, f)
-        
-        #Guardamos labels e intents
-        metadata = {
-            'intent_labels': self.intent_labels,
-            'intents': self.intents
-        }
-        metadata_path = os.path.join(model_dir, 'metadata.pkl')
-        with open(metadata_path, 'wb') as f:
-            pickle.dump(metadata, f)
 
-        print(f"Modelo guardado en {model_dir}")
+        artifact_path = os.path.join(model_dir, ARTIFACT_FILENAME)
+        export_model(artifact_path, self.vectorizer, LinearSVCModel.from_svc(self.model), self.intent_labels, self.intents)
+
+        print(f"Modelo guardado en {artifact_path}")
 
 #Codigo principal para entrenamiento del modelo.
 
@@ -101,10 +105,10 @@ if __name__ == "__main__":
     trainer = ChatbotTrainer()
 
     #entrenamiento del modelo
-    trainer.train('../data/intents.json')
+    trainer.train('data/nlu.yml')
 
     #Guardar el modelo
-    trainer.save_model('../models/')
+    trainer.save_model('models/')
 
 
 
@@ -0,0 +1,79 @@
+import os
+import asyncio
+import tempfile
+
+import pytest
+
+pytest.importorskip('rasa_sdk')
+pytest.importorskip('sklearn')
+
+# Servidor de acciones sin Gemini real, sin servidores HTTP ni ficheros en el directorio de trabajo
+os.environ['GEMINI_API_KEY'] = ''
+os.environ['ACTION_STREAM_ENABLED'] = '0'
+os.environ['METRICS_ENABLED'] = '0'
+os.environ['GEMINI_CACHE_ENABLED'] = '0'
+os.environ['SEMANTIC_CACHE_ENABLED'] = '0'
+os.environ['CATALOG_REFRESH_INTERVAL'] = '0'
+os.environ['CATALOG_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'catalog.sqlite3')
+
+from rasa_sdk import Tracker  # noqa: E402
+from rasa_sdk.executor import CollectingDispatcher  # noqa: E402
+from sklearn.feature_extraction.text import TfidfVectorizer  # noqa: E402
+
+from actions import actions  # noqa: E402
+from src.generation_prompts import USER_TEXT_KEY  # noqa: E402
+from src.semantic_cache import SemanticAnswerCache  # noqa: E402
+
+
+class FakeVectorizer:
+    """Interfaz minima de IntentVectorizer que usa SemanticAnswerCache"""
+
+    def __init__(self, corpus):
+        self.vectorizer = TfidfVectorizer().fit(corpus)
+
+    def preprocess(self, texts):
+        return [text.lower().strip('¿?') for text in texts]
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, request_options=None):
+        self.prompts.append(prompt)
+        return FakeResponse(f"respuesta {len(self.prompts)}")
+
+
+def injected_tracker(question):
+    """Tracker como lo deja el gateway en los modos 'gemini' e 'hybrid'"""
+    message = {'text': '/pregunta_abierta', 'intent': {'name': 'pregunta_abierta'}, 'entities': [],
+               'metadata': {USER_TEXT_KEY: question}}
+    return Tracker('usuario', {'current_domain': 'general'}, message, [], False, None, {}, '')
+
+
+def ask(tracker):
+    dispatcher = CollectingDispatcher()
+    asyncio.run(actions.ActionAskGemini().run(dispatcher, tracker, {}))
+    return dispatcher.messages[-1]['text']
+
+
+def test_preguntas_distintas_por_la_intencion_inyectada_no_comparten_respuesta(monkeypatch):
+    questions = ['¿qué es la inflación?', '¿cómo funciona una hipoteca?']
+    model = FakeModel()
+    monkeypatch.setattr(actions.gemini_service, 'model', model)
+    monkeypatch.setattr(actions.gemini_service, 'semantic_cache',
+                        SemanticAnswerCache(FakeVectorizer(questions + ['pregunta_abierta']), threshold=0.9))
+
+    first = ask(injected_tracker(questions[0]))
+    second = ask(injected_tracker(questions[1]))
+
+    assert first != second
+    assert questions[0] in model.prompts[0] and questions[1] in model.prompts[1]
+    # La misma pregunta otra vez sale de la cache semantica, con su propia respuesta
+    assert ask(injected_tracker(questions[0])) == first
+    assert len(model.prompts) == 2
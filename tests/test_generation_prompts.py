@@ -0,0 +1,16 @@
+from src.generation_prompts import USER_TEXT_KEY, build_domain_prompt, prompt_fingerprint, prompt_for_intent, user_text
+
+
+def test_user_text_usa_el_mensaje_original_de_los_metadatos():
+    latest_message = {'text': '/pregunta_abierta', 'metadata': {USER_TEXT_KEY: '¿qué es la inflación?'}}
+    assert user_text(latest_message) == '¿qué es la inflación?'
+    assert user_text({'text': 'hola'}) == 'hola'
+
+
+def test_huella_especulativa_coincide_con_la_de_la_accion():
+    message = '¿qué es la inflación?'
+    prompt, domain = prompt_for_intent('pregunta_abierta', {}, message, 'banca')
+    gateway = prompt_fingerprint('gemini-2.0-flash', build_domain_prompt(prompt, domain))
+    latest_message = {'text': '/pregunta_abierta', 'metadata': {USER_TEXT_KEY: message}}
+    action = prompt_fingerprint('gemini-2.0-flash', build_domain_prompt(user_text(latest_message), 'banca'))
+    assert gateway == action
@@ -0,0 +1,71 @@
+import warnings
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sp = pytest.importorskip('scipy.sparse')
+pytest.importorskip('sklearn')
+from sklearn.preprocessing import normalize  # noqa: E402
+from sklearn.svm import SVC  # noqa: E402
+
+from src.linear_model import LinearSVCModel  # noqa: E402
+
+TOLERANCE = 1e-9
+
+
+def synthetic_tfidf(n_rows, n_features, n_classes, rng, terms_per_row=6):
+    """Matriz dispersa tipo TF-IDF (filas L2) con terminos caracteristicos por clase"""
+    labels = np.arange(n_rows) % n_classes
+    class_terms = rng.integers(0, n_features, size=(n_classes, terms_per_row))
+    rows, cols = [], []
+    for row, label in enumerate(labels):
+        own = rng.choice(class_terms[label], size=terms_per_row // 2, replace=False)
+        noise = rng.integers(0, n_features, size=terms_per_row - len(own))
+        terms = np.unique(np.concatenate([own, noise]))
+        rows.extend([row] * len(terms))
+        cols.extend(terms)
+    X = sp.csr_matrix((rng.random(len(rows)) + 0.1, (rows, cols)), shape=(n_rows, n_features))
+    X.sum_duplicates()
+    return normalize(X), labels
+
+
+def train(n_classes, seed=0):
+    rng = np.random.default_rng(seed)
+    X, y = synthetic_tfidf(30 * n_classes, 200, n_classes, rng)
+    svc = SVC(kernel='linear', probability=True, random_state=seed).fit(X, y)
+    X_test, _ = synthetic_tfidf(40, 200, n_classes, rng)
+    with warnings.catch_warnings():
+        # Versiones recientes de sklearn avisan de que probA_/probB_ quedaran obsoletos
+        warnings.simplefilter('ignore', FutureWarning)
+        model = LinearSVCModel.from_svc(svc)
+    return svc, model, X_test
+
+
+@pytest.mark.parametrize('n_classes', [2, 5, 12])
+def test_predict_proba_coincide_con_sklearn(n_classes):
+    svc, model, X_test = train(n_classes)
+    expected = svc.predict_proba(X_test)
+    np.testing.assert_allclose(model.predict_proba(X_test), expected, rtol=0, atol=TOLERANCE)
+    # Un solo mensaje va por el camino escalar del acoplamiento
+    np.testing.assert_allclose(model.predict_proba(X_test[:1]), expected[:1], rtol=0, atol=TOLERANCE)
+
+
+def test_predict_proba_con_pesos_dispersos():
+    svc, model, X_test = train(5)
+    sparse = LinearSVCModel(sp.csr_matrix(model.weights), model.intercept, model.prob_a, model.prob_b, model.n_classes)
+    np.testing.assert_allclose(sparse.predict_proba(X_test), svc.predict_proba(X_test), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('k', [1, 3, 5])
+def test_top_k_coincide_con_el_orden_de_sklearn(k):
+    svc, model, X_test = train(5)
+    expected = svc.predict_proba(X_test)
+    indices, probabilities = model.top_k(X_test, k)
+
+    assert indices.shape == probabilities.shape == (X_test.shape[0], k)
+    np.testing.assert_allclose(probabilities, -np.sort(-expected, axis=1)[:, :k], rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(np.take_along_axis(expected, indices, axis=1), probabilities, rtol=0, atol=TOLERANCE)
+    # La primera clase es la de SVC.predict_proba salvo empates dentro de la tolerancia
+    best = expected.argmax(axis=1)
+    tied = np.abs(expected[np.arange(len(best)), best] - np.take_along_axis(expected, indices[:, :1], axis=1)[:, 0]) <= TOLERANCE
+    assert np.all((indices[:, 0] == best) | tied)
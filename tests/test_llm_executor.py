@@ -0,0 +1,27 @@
+import threading
+from concurrent.futures import Future
+
+from src.llm_executor import BoundedLLMExecutor
+
+
+def test_llamada_en_cola_arranca_al_liberarse_un_hueco():
+    executor = BoundedLLMExecutor(max_concurrency=2)
+    # Un intento abandonado que sigue en curso ocupa uno de los dos huecos
+    abandoned = Future()
+    executor.hold(abandoned)
+
+    release_first = threading.Event()
+    second_started = threading.Event()
+    first = executor.submit(release_first.wait)
+    second = executor.submit(second_started.set)
+
+    assert not second_started.wait(0.2)
+    assert executor.stats()['queued'] == 1
+
+    release_first.set()
+    first.result(timeout=1)
+    # Arranca en cuanto la primera termina, sin esperar a que acabe la abandonada
+    assert second_started.wait(1)
+    second.result(timeout=1)
+    assert not abandoned.done()
+    abandoned.set_result(None)
@@ -0,0 +1,89 @@
+import time
+import asyncio
+import threading
+
+from src.nlu_batcher import AsyncNLUBatcher, NLUBatcher
+
+
+def classify_concurrently(batcher, messages):
+    results = {}
+
+    def worker(message):
+        results[message] = batcher.classify(message)
+
+    threads = [threading.Thread(target=worker, args=(message,)) for message in messages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_lote_resuelve_cada_mensaje():
+    batcher = NLUBatcher(lambda messages, budget: [{'intent': m} for m in messages], lambda m, budget: None,
+                         window=0.05, budget=1.0)
+    results = classify_concurrently(batcher, ['a', 'b', 'c'])
+    assert results == {m: {'intent': m} for m in 'abc'}
+
+
+def test_lote_lento_no_supera_el_presupuesto_ni_se_reenvia():
+    singles = []
+
+    def slow_batch(messages, budget):
+        time.sleep(0.5)
+        return [None] * len(messages)
+
+    def single(message, budget):
+        singles.append(message)
+        return {'intent': message}
+
+    batcher = NLUBatcher(slow_batch, single, window=0.05, budget=0.3)
+    started = time.monotonic()
+    results = classify_concurrently(batcher, ['a', 'b'])
+    assert time.monotonic() - started < 0.45
+    assert results == {'a': None, 'b': None}
+    time.sleep(0.4)
+    assert singles == []
+    assert batcher.stats()['timeouts'] == 2
+
+
+def test_reenvio_individual_recibe_el_presupuesto_restante():
+    budgets = []
+
+    def failing_batch(messages, budget):
+        time.sleep(0.1)
+        raise RuntimeError("lote fallido")
+
+    def single(message, budget):
+        budgets.append(budget)
+        return {'intent': message}
+
+    batcher = NLUBatcher(failing_batch, single, window=0.05, budget=1.0)
+    results = classify_concurrently(batcher, ['a', 'b'])
+    assert results == {'a': {'intent': 'a'}, 'b': {'intent': 'b'}}
+    assert len(budgets) == 2 and all(0 < budget < 0.9 for budget in budgets)
+
+
+def test_async_lote_lento_no_supera_el_presupuesto():
+    singles = []
+
+    async def slow_batch(messages, budget):
+        await asyncio.sleep(0.5)
+        return [None] * len(messages)
+
+    async def single(message, budget):
+        singles.append(message)
+        return {'intent': message}
+
+    async def scenario():
+        batcher = AsyncNLUBatcher(slow_batch, single, window=0.05, budget=0.3)
+        started = time.monotonic()
+        results = await asyncio.gather(batcher.classify('a'), batcher.classify('b'))
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(0.4)
+        return results, elapsed, batcher.stats()['timeouts']
+
+    results, elapsed, timeouts = asyncio.run(scenario())
+    assert results == [None, None]
+    assert elapsed < 0.45
+    assert singles == [] and timeouts == 2
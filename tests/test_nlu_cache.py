@@ -0,0 +1,30 @@
+from src.nlu_cache import MemoryCacheBackend, NLUCache
+
+
+def make_cache():
+    return NLUCache(MemoryCacheBackend(max_size=16, ttl=60))
+
+
+def test_distintas_cantidades_tienen_claves_distintas():
+    cache = make_cache()
+    assert cache.key("transferir 1,5 soles", "v1") != cache.key("transferir 15 soles", "v1")
+    assert cache.key("pagar 100.50", "v1") != cache.key("pagar 10050", "v1")
+
+
+def test_entidad_cantidad_no_se_sirve_para_otro_importe():
+    cache = make_cache()
+    cache.set("transferir 1,5 soles", "v1", {"intent": "realizar_transferencia", "entities": [{"entity": "cantidad", "value": "1,5"}]})
+    assert cache.get("transferir 15 soles", "v1") is None
+    assert cache.get("Transferir 1,5 soles.", "v1")["entities"][0]["value"] == "1,5"
+
+
+def test_signos_y_acentos_no_cambian_la_clave():
+    cache = make_cache()
+    assert cache.key("¡Hola, QUÉ tal!", "v1") == cache.key("hola que tal", "v1")
+
+
+def test_mensajes_sin_texto_no_usan_la_cache():
+    cache = make_cache()
+    cache.set("👍", "v1", {"intent": "affirm", "entities": []})
+    assert cache.key("😡", "v1") is None
+    assert cache.get("😡", "v1") is None
@@ -0,0 +1,85 @@
+import json
+import time
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from src.rasa_client import RasaClient
+
+BODY = json.dumps([{"recipient_id": "s1", "text": "hola"}]).encode('utf-8')
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        if self.path == '/lento':
+            # Cada byte llega antes del timeout de lectura, pero el cuerpo entero tarda mucho mas
+            try:
+                for byte in BODY:
+                    self.wfile.write(bytes([byte]))
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # el cliente corta la conexion al vencer su plazo
+        else:
+            self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host):
+    server_class = type('Server', (ThreadingHTTPServer,), {'address_family': socket.AF_INET6 if ':' in host else socket.AF_INET})
+    server = server_class((host, 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server():
+    server = start_server('127.0.0.1')
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_respuesta_normal_reutiliza_la_conexion(server):
+    client = RasaClient(f"{server}/webhook", pool_size=2, read_timeout=1.0, deadline=2.0)
+    assert client.post({"sender": "s1", "message": "hola"})[0]["text"] == "hola"
+    assert client.post({"sender": "s1", "message": "hola"})[0]["text"] == "hola"
+    assert client.stats()['idle'] == 1
+    assert client.stats()['timeouts'] == 0
+
+
+def test_cuerpo_lento_no_supera_el_plazo_total(server):
+    client = RasaClient(f"{server}/lento", read_timeout=1.0, deadline=0.5)
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        client.post({"sender": "s1", "message": "hola"})
+    assert time.monotonic() - started < 1.0
+    assert client.stats()['timeouts'] == 1
+    assert client.stats()['in_use'] == 0
+
+
+def test_plazo_con_ipv6():
+    if not socket.has_ipv6:
+        pytest.skip("sin IPv6")
+    try:
+        server = start_server('::1')
+    except OSError:
+        pytest.skip("sin IPv6 en loopback")
+    try:
+        client = RasaClient(f"http://[::1]:{server.server_port}/lento", read_timeout=1.0, deadline=0.5)
+        with pytest.raises(requests.exceptions.Timeout):
+            client.post({"sender": "s1", "message": "hola"})
+    finally:
+        server.shutdown()